@@ -0,0 +1,66 @@
+"""
+Micro-benchmark for the PCM DSP stage.
+
+Runs one DSPSource per simulated guild over synthetic 20 ms frames with volume and a
+full five-band EQ enabled, and reports the per-frame cost against Discord's 20 ms frame budget.
+
+Usage: python -m benchmarks.dsp_bench --guilds 200 --frames 250
+"""
+import argparse
+import time
+import numpy as np
+from cogs.dsp import CHANNELS, EQ_BANDS, SAMPLE_RATE, DSPSettings, DSPSource
+
+FRAME_MS = 20
+FRAME_SAMPLES = SAMPLE_RATE * FRAME_MS // 1000
+
+
+class SyntheticSource:
+    """Endless stereo noise in 20 ms s16le frames."""
+    def __init__(self, seed):
+        rng = np.random.default_rng(seed)
+        self.frame = (rng.standard_normal((FRAME_SAMPLES, CHANNELS)) * 4000).astype(np.int16).tobytes()
+
+    def read(self):
+        return self.frame
+
+    def cleanup(self):
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--guilds", type=int, default=200, help="concurrent guild sources")
+    parser.add_argument("--frames", type=int, default=250, help="frames processed per guild (250 = 5 s of audio)")
+    args = parser.parse_args()
+
+    sources = []
+    for guild in range(args.guilds):
+        settings = DSPSettings()
+        settings.set_volume(0.8)
+        settings.set_bands({name: 3.0 if i % 2 else -3.0 for i, name in enumerate(EQ_BANDS)})
+        sources.append(DSPSource(SyntheticSource(guild), settings))
+
+    for source in sources:
+        source.read()  # warm-up: first frame allocates filter state
+
+    samples = []
+    start = time.perf_counter()
+    for _ in range(args.frames):
+        tick = time.perf_counter()
+        for source in sources:
+            source.read()
+        samples.append(time.perf_counter() - tick)
+    elapsed = time.perf_counter() - start
+
+    per_frame_us = elapsed / (args.frames * args.guilds) * 1e6
+    samples.sort()
+    p99_tick_ms = samples[int(len(samples) * 0.99) - 1] * 1000
+    print(f"guilds: {args.guilds}, frames/guild: {args.frames}, EQ bands: {len(EQ_BANDS)}")
+    print(f"per-frame cost: {per_frame_us:.1f} us ({per_frame_us / (FRAME_MS * 10):.2f}% of the {FRAME_MS} ms budget)")
+    print(f"all guilds, one 20 ms tick: mean {elapsed / args.frames * 1000:.2f} ms, p99 {p99_tick_ms:.2f} ms")
+    print(f"guilds sustainable on one core: ~{int(FRAME_MS * 1000 / per_frame_us)}")
+
+
+if __name__ == "__main__":
+    main()
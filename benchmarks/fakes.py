@@ -0,0 +1,295 @@
+"""
+Local stand-ins for Discord, Ollama and Spotify, so the real cogs can be driven offline.
+
+The Discord fakes implement only the attributes and coroutines the cogs touch. FakeOllama is a
+real HTTP server speaking the subset of Ollama's API that OllamaClient uses, running on its own
+thread and event loop so its work doesn't show up as bot event loop time.
+"""
+import asyncio
+import hashlib
+import itertools
+import json
+import threading
+import time
+from aiohttp import web
+
+# 20 ms of 48 kHz stereo s16le silence, the frame size discord.py's voice client reads.
+SILENT_FRAME = b"\0" * 3840
+
+_ids = itertools.count(10 ** 15)
+
+
+def next_id():
+    return next(_ids)
+
+
+class FakeGuild:
+    def __init__(self, guild_id=None):
+        self.id = guild_id or next_id()
+        self.name = f"guild-{self.id}"
+
+
+class FakePermissions:
+    manage_guild = True
+
+
+class FakeMember:
+    def __init__(self, guild, member_id=None):
+        self.id = member_id or next_id()
+        self.guild = guild
+        self.bot = False
+        self.voice = None
+        self.guild_permissions = FakePermissions()
+
+    def __str__(self):
+        return f"user-{self.id}"
+
+
+class FakeMessage:
+    def __init__(self, channel, author=None, content=""):
+        self.id = next_id()
+        self.channel = channel
+        self.guild = channel.guild
+        self.author = author
+        self.content = content
+        self.attachments = []
+
+    async def edit(self, content=None, **kwargs):
+        if content is not None:
+            self.content = content
+        self.channel.edits += 1
+        return self
+
+    async def delete(self):
+        self.channel.deletes += 1
+
+
+class FakeChannel:
+    """A text channel that counts what the bot sends instead of delivering it."""
+    def __init__(self, guild, channel_id=None):
+        self.id = channel_id or next_id()
+        self.guild = guild
+        self.sends = 0
+        self.edits = 0
+        self.deletes = 0
+
+    async def send(self, content=None, **kwargs):
+        self.sends += 1
+        return FakeMessage(self, content=content or "")
+
+
+class FakeContext:
+    """Enough of commands.Context for the cogs' command callbacks and checks."""
+    def __init__(self, bot, channel, author, content="", command=None):
+        self.bot = bot
+        self.guild = channel.guild
+        self.channel = channel
+        self.author = author
+        self.message = FakeMessage(channel, author, content)
+        self.command = command
+        self.invoked_with = command.name if command else None
+        self.command_failed = False
+        self.sent = []
+
+    @property
+    def cog(self):
+        return self.command.cog if self.command else None
+
+    async def send(self, content=None, **kwargs):
+        self.sent.append(content)
+        return await self.channel.send(content, **kwargs)
+
+    async def invoke(self, command, *args, **kwargs):
+        return await command(self, *args, **kwargs)
+
+
+class FakePCMAudio:
+    """Replaces FFmpegPCMAudio: a fixed number of silent frames, no subprocess."""
+    frames = 50
+
+    def __init__(self, source, *args, **kwargs):
+        self.source = source
+        self._remaining = self.frames
+
+    def read(self):
+        if self._remaining <= 0:
+            return b""
+        self._remaining -= 1
+        return SILENT_FRAME
+
+    def is_opus(self):
+        return False
+
+    def cleanup(self):
+        self._remaining = 0
+
+
+class FakeVoiceClient:
+    """Reads each source to the end on its own thread, like discord.py's AudioPlayer, without sending anything."""
+    def __init__(self, frame_interval=0.0):
+        self.frame_interval = frame_interval
+        self.frames = 0
+        self._connected = True
+        self._paused = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def play(self, source, after=None):
+        self._stop.clear()
+        self._paused.clear()
+
+        def run():
+            error = None
+            try:
+                while not self._stop.is_set():
+                    if self._paused.is_set():
+                        time.sleep(0.01)
+                        continue
+                    if not source.read():
+                        break
+                    self.frames += 1
+                    if self.frame_interval:
+                        time.sleep(self.frame_interval)
+            except Exception as e:
+                error = e
+            finally:
+                source.cleanup()
+            if after is not None:
+                after(error)
+
+        self._thread = threading.Thread(target=run, daemon=True)
+        self._thread.start()
+
+    def is_connected(self):
+        return self._connected
+
+    def is_playing(self):
+        return self._thread is not None and self._thread.is_alive() and not self._paused.is_set()
+
+    def is_paused(self):
+        return self._thread is not None and self._thread.is_alive() and self._paused.is_set()
+
+    def pause(self):
+        self._paused.set()
+
+    def resume(self):
+        self._paused.clear()
+
+    def stop(self):
+        self._stop.set()
+
+    async def move_to(self, channel):
+        pass
+
+    async def disconnect(self, force=False):
+        self.stop()
+        self._connected = False
+
+
+class FakeSpotify:
+    """The spotipy calls SpotifyResolver makes, answering after a fixed latency."""
+    def __init__(self, latency=0.05):
+        self.latency = latency
+        self.calls = 0
+
+    def _track(self, seed):
+        track_id = hashlib.sha1(seed.encode("utf-8")).hexdigest()[:22]
+        return {
+            "id": track_id,
+            "type": "track",
+            "name": f"Song {track_id[:6]}",
+            "artists": [{"name": "Fake Artist"}],
+            "external_urls": {"spotify": f"https://open.spotify.com/track/{track_id}"},
+            "duration_ms": 180000,
+        }
+
+    def search(self, q, type="track", limit=1):
+        self.calls += 1
+        time.sleep(self.latency)
+        return {"tracks": {"items": [self._track(q)]}}
+
+    def playlist_items(self, playlist_id, offset=0, limit=100, additional_types=("track",)):
+        self.calls += 1
+        time.sleep(self.latency)
+        items = [{"track": self._track(f"{playlist_id}:{i}")} for i in range(offset, min(offset + limit, 500))]
+        return {"items": items, "total": 500}
+
+    def album_tracks(self, album_id, limit=50, offset=0):
+        self.calls += 1
+        time.sleep(self.latency)
+        return {"items": [self._track(f"{album_id}:{i}") for i in range(offset, min(offset + limit, 12))], "total": 12}
+
+
+class FakeOllama:
+    """
+    HTTP stand-in for the Ollama server: /api/tags, and /api/chat with and without streaming.
+    Replies are `tokens` words long and each word takes `token_delay` seconds, so generation
+    time is predictable and the bot's own overhead is what varies between runs.
+    """
+    def __init__(self, model="qwen:0.5b", tokens=40, token_delay=0.002, host="127.0.0.1", port=0):
+        self.model = model
+        self.tokens = tokens
+        self.token_delay = token_delay
+        self.host = host
+        self.port = port
+        self.requests = 0
+        self._loop = None
+        self._runner = None
+        self._thread = None
+
+    @property
+    def url(self):
+        return f"http://{self.host}:{self.port}"
+
+    async def _tags(self, request):
+        return web.json_response({"models": [{"name": self.model, "model": self.model, "digest": "fake" * 16}]})
+
+    async def _chat(self, request):
+        self.requests += 1
+        body = await request.json()
+        last = body["messages"][-1]
+        words = ["Red."] if last.get("images") else [f"word{i}" for i in range(self.tokens)]
+        limit = body.get("options", {}).get("num_predict")
+        if limit:
+            words = words[:limit]
+        stats = {"done": True, "eval_count": len(words), "eval_duration": int(len(words) * self.token_delay * 1e9) or 1}
+        if not body.get("stream", True):
+            await asyncio.sleep(self.token_delay * len(words))
+            return web.json_response(dict(stats, message={"role": "assistant", "content": " ".join(words)}))
+        response = web.StreamResponse(headers={"Content-Type": "application/x-ndjson"})
+        await response.prepare(request)
+        for word in words:
+            await asyncio.sleep(self.token_delay)
+            chunk = {"message": {"role": "assistant", "content": word + " "}, "done": False}
+            await response.write(json.dumps(chunk).encode("utf-8") + b"\n")
+        await response.write(json.dumps(dict(stats, message={"role": "assistant", "content": ""})).encode("utf-8") + b"\n")
+        await response.write_eof()
+        return response
+
+    def start(self):
+        """Start serving on a background thread and return once the port is bound."""
+        ready = threading.Event()
+
+        def run():
+            self._loop = asyncio.new_event_loop()
+            app = web.Application()
+            app.router.add_get("/api/tags", self._tags)
+            app.router.add_post("/api/chat", self._chat)
+            self._runner = web.AppRunner(app, access_log=None)
+            self._loop.run_until_complete(self._runner.setup())
+            self._loop.run_until_complete(web.TCPSite(self._runner, self.host, self.port).start())
+            self.port = self._runner.addresses[0][1]
+            ready.set()
+            self._loop.run_forever()
+            self._loop.run_until_complete(self._runner.cleanup())
+            self._loop.close()
+
+        self._thread = threading.Thread(target=run, daemon=True)
+        self._thread.start()
+        ready.wait()
+        return self
+
+    def stop(self):
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join()
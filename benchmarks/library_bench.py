@@ -0,0 +1,102 @@
+"""
+Benchmark for the local music library index.
+
+Creates a synthetic library of empty audio files named "Artist - Title" in album folders,
+then measures the first full scan, a rescan with nothing changed, a rescan after touching a
+fraction of the files, and search latency for exact, partial and misspelt queries. Empty files
+have no tags, so titles come from the file names either way.
+
+Usage: python -m benchmarks.library_bench --files 100000
+"""
+import argparse
+import asyncio
+import os
+import random
+import string
+import tempfile
+import time
+from cogs.library import MusicLibrary
+
+
+def fake_word(rng):
+    return "".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(3, 9))).capitalize()
+
+
+def build_library(rng, root, files, per_album=12):
+    """Write `files` empty .mp3 files and return their (artist, title) pairs."""
+    artists = [" ".join(fake_word(rng) for _ in range(rng.randint(1, 2))) for _ in range(max(1, files // 100))]
+    songs = []
+    for album_index in range(0, files, per_album):
+        artist = rng.choice(artists)
+        album = os.path.join(root, artist, f"Album {album_index // per_album}")
+        os.makedirs(album, exist_ok=True)
+        for track in range(min(per_album, files - album_index)):
+            title = " ".join(fake_word(rng) for _ in range(rng.randint(1, 4)))
+            open(os.path.join(album, f"{track + 1:02d} - {artist} - {title}.mp3"), "wb").close()
+            songs.append((artist, title))
+    return songs
+
+
+def misspell(rng, text):
+    chars = list(text)
+    index = rng.randrange(1, len(chars)) if len(chars) > 1 else 0
+    chars[index] = rng.choice(string.ascii_lowercase)
+    return "".join(chars)
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+async def run(args):
+    rng = random.Random(args.seed)
+    with tempfile.TemporaryDirectory(prefix="library_bench-") as root:
+        music = os.path.join(root, "music")
+        started = time.perf_counter()
+        songs = build_library(rng, music, args.files)
+        print(f"created {len(songs)} files in {time.perf_counter() - started:.1f}s")
+
+        library = MusicLibrary([music], os.path.join(root, "library.db"), args.workers)
+        for label in ("first scan", "unchanged rescan"):
+            result = await library.scan()
+            print(f"{label:>18}: {result['seconds']:.2f}s, {result['indexed']} indexed")
+        touched = set(rng.sample(range(len(songs)), max(1, len(songs) * args.touch // 100)))
+        now = time.time() + 10
+        for path_index, path in enumerate(sorted(os.path.join(d, f) for d, _, fs in os.walk(music) for f in fs)):
+            if path_index in touched:
+                os.utime(path, (now, now))
+        result = await library.scan()
+        print(f"{f'{args.touch}% touched':>18}: {result['seconds']:.2f}s, {result['indexed']} indexed")
+
+        queries = {
+            "exact": lambda artist, title: f"{title} {artist}",
+            "partial": lambda artist, title: title.split()[0][:4],
+            "misspelt": lambda artist, title: misspell(rng, title),
+        }
+        print(f"{'query':>10} {'p50 ms':>8} {'p99 ms':>8} {'found':>6}")
+        for name, make in queries.items():
+            timings = []
+            found = 0
+            for artist, title in rng.sample(songs, min(args.queries, len(songs))):
+                started = time.perf_counter()
+                results = await library.search(make(artist, title), limit=5)
+                timings.append(time.perf_counter() - started)
+                found += any(track['title'] == f"{title} - {artist}" for track in results)
+            print(f"{name:>10} {percentile(timings, 0.5) * 1000:>8.2f} {percentile(timings, 0.99) * 1000:>8.2f} "
+                  f"{found / len(timings):>6.0%}")
+        await library.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--files", type=int, default=20000)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--touch", type=int, default=1, help="percent of files modified before the third scan")
+    parser.add_argument("--queries", type=int, default=300, help="searches per query kind")
+    parser.add_argument("--seed", type=int, default=1)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
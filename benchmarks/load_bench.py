@@ -0,0 +1,262 @@
+"""
+Offline load test for the AI, Music and Help cogs.
+
+Simulates N guilds with M users each. Every user sends commands as a Poisson process at
+--rate commands per second, mixing chat, play, queue and help per --mix. The real cogs handle
+them through fake Discord contexts, channels and voice clients. A local HTTP stand-in answers
+for Ollama, and a fake spotipy client answers for Spotify. Nothing touches the network.
+
+Reports throughput, p50/p99 latency per command, event loop lag, and memory retained per guild.
+--max-p99-ms and --min-throughput make the run exit non-zero when a budget is missed, for
+regression checks in CI.
+
+Usage: python -m benchmarks.load_bench --guilds 50 --users 5 --rate 0.2 --duration 30
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from benchmarks.fakes import (FakeChannel, FakeContext, FakeGuild, FakeMember, FakeOllama, FakePCMAudio,
+                              FakeSpotify, FakeVoiceClient)
+
+PROMPTS = [
+    "tell me a joke", "what's the best pizza in new york", "roast my taste in music",
+    "how's your day been", "explain the offside rule", "what should I name my cat",
+]
+HELP_TOPICS = [None, "ai", "music", "filter"]
+# Start of the AI cog's reply when the inference queue is full.
+BUSY_REPLY = "I'm busy"
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def configure_environment(args, ollama):
+    """The cogs read their settings at import time, so this has to run before they are imported."""
+    state_dir = tempfile.mkdtemp(prefix="load_bench-")
+    os.environ.update({
+        "OLLAMA_API_URL": ollama.url,
+        "MODEL": ollama.model,
+        "IMAGE_RECOGNITION": "false",
+        "MODEL_PROBE_CACHE": os.path.join(state_dir, "model_probes.json"),
+        "STATE_DB": os.path.join(state_dir, "state.db"),
+        "OPUS_CACHE_MAX_BYTES": "0",
+        "STREAM_RESPONSES": "true" if args.stream else "false",
+        "OLLAMA_CONCURRENCY": str(args.ollama_concurrency),
+    })
+
+
+class LoadTest:
+    def __init__(self, args):
+        self.args = args
+        self.rng = random.Random(args.seed)
+        self.latencies = {}  # command -> [seconds]
+        self.outcomes = {}  # (command, outcome) -> count
+        self.lag = []
+
+    def record(self, command, outcome, seconds=None):
+        self.outcomes[(command, outcome)] = self.outcomes.get((command, outcome), 0) + 1
+        if seconds is not None:
+            self.latencies.setdefault(command, []).append(seconds)
+
+    async def run_command(self, bot, command, channel, author, **kwargs):
+        from discord.ext import commands
+        ctx = FakeContext(bot, channel, author, command=command)
+        started = time.perf_counter()
+        try:
+            if not await command.can_run(ctx):
+                self.record(command.name, "rejected")
+                return
+            await command(ctx, **kwargs)
+            if any(text and text.startswith(BUSY_REPLY) for text in ctx.sent):
+                self.record(command.name, "busy")
+                return
+        except commands.CheckFailure:
+            self.record(command.name, "rate_limited")
+            return
+        except Exception:
+            logging.getLogger(__name__).exception("Command %s failed", command.name)
+            self.record(command.name, "error")
+            return
+        self.record(command.name, "ok", time.perf_counter() - started)
+
+    async def user(self, bot, channel, author, deadline):
+        ai, music, help_cog = bot.get_cog("AI"), bot.get_cog("Music"), bot.get_cog("HelpCog")
+        weights = self.args.mix
+        actions = ["chat", "play", "queue", "help"]
+        while True:
+            delay = self.rng.expovariate(self.args.rate)
+            if time.perf_counter() + delay >= deadline:
+                return
+            await asyncio.sleep(delay)
+            action = self.rng.choices(actions, weights)[0]
+            if action == "chat":
+                await self.run_command(bot, ai.chat, channel, author, message=self.rng.choice(PROMPTS))
+            elif action == "play":
+                query = f"song {self.rng.randrange(self.args.catalog)}"
+                await self.run_command(bot, music.play, channel, author, query=query)
+            elif action == "queue":
+                await self.run_command(bot, music.show_queue, channel, author, page=1)
+            else:
+                await self.run_command(bot, help_cog.help_command, channel, author, topic=self.rng.choice(HELP_TOPICS))
+
+    async def sample_lag(self, interval=0.05):
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + interval
+            await asyncio.sleep(interval)
+            self.lag.append(max(0.0, loop.time() - expected))
+
+    async def run(self):
+        import discord
+        from discord.ext import commands
+        import cogs.player
+        from cogs.ai import AI
+        from cogs.help import HelpCog
+        from cogs.music import Music
+        from cogs.resolver import SpotifyResolver
+
+        # No FFmpeg: tracks are a fixed number of silent frames.
+        FakePCMAudio.frames = self.args.track_frames
+        cogs.player.FFmpegPCMAudio = FakePCMAudio
+
+        intents = discord.Intents.default()
+        intents.message_content = True
+        bot = commands.Bot(command_prefix="!", intents=intents, help_command=None)
+        async with bot:
+            await bot.add_cog(AI(bot))
+            await bot.add_cog(Music(bot))
+            await bot.add_cog(HelpCog(bot))
+            music = bot.get_cog("Music")
+            spotify = FakeSpotify(self.args.spotify_latency)
+            music.resolver = SpotifyResolver(lambda: spotify)
+            # Let the capability probe finish so it doesn't land in the measurements.
+            await asyncio.sleep(0.5)
+
+            baseline = tracemalloc.get_traced_memory()[0] if tracemalloc.is_tracing() else 0
+            users = []
+            for _ in range(self.args.guilds):
+                guild = FakeGuild()
+                channel = FakeChannel(guild)
+                ctx = FakeContext(bot, channel, FakeMember(guild))
+                music.get_player(ctx).voice_client = FakeVoiceClient(self.args.frame_interval)
+                users.extend((channel, FakeMember(guild)) for _ in range(self.args.users))
+
+            lag_task = asyncio.create_task(self.sample_lag())
+            started = time.perf_counter()
+            deadline = started + self.args.duration
+            await asyncio.gather(*(self.user(bot, channel, author, deadline) for channel, author in users))
+            elapsed = time.perf_counter() - started
+            lag_task.cancel()
+
+            retained = (tracemalloc.get_traced_memory()[0] - baseline) if tracemalloc.is_tracing() else None
+            ai = bot.get_cog("AI")
+            report = {
+                "config": {key: value for key, value in vars(self.args).items() if key != "json"},
+                "elapsed": elapsed,
+                "commands": {},
+                "throughput": sum(len(values) for values in self.latencies.values()) / elapsed,
+                "loop_lag_p99_ms": percentile(self.lag, 0.99) * 1000,
+                "loop_lag_max_ms": max(self.lag, default=0.0) * 1000,
+                "memory_per_guild_kb": retained / self.args.guilds / 1024 if retained is not None else None,
+                "scheduler": ai.scheduler.stats(),
+                "resolver": music.resolver.stats(),
+                "spotify_calls": spotify.calls,
+            }
+            for command in sorted({name for name, _ in self.outcomes}):
+                values = self.latencies.get(command, [])
+                report["commands"][command] = {
+                    "ok": self.outcomes.get((command, "ok"), 0),
+                    "rate_limited": self.outcomes.get((command, "rate_limited"), 0),
+                    "busy": self.outcomes.get((command, "busy"), 0),
+                    "errors": self.outcomes.get((command, "error"), 0),
+                    "per_second": len(values) / elapsed,
+                    "p50_ms": percentile(values, 0.50) * 1000,
+                    "p99_ms": percentile(values, 0.99) * 1000,
+                    "max_ms": max(values, default=0.0) * 1000,
+                }
+            await bot.remove_cog("Music")
+            await bot.remove_cog("AI")
+        return report
+
+
+def print_report(report):
+    print(f"{'command':>8} {'ok':>7} {'limited':>8} {'busy':>6} {'errors':>7} {'per s':>8} {'p50 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    for command, row in report["commands"].items():
+        print(f"{command:>8} {row['ok']:>7} {row['rate_limited']:>8} {row['busy']:>6} {row['errors']:>7} {row['per_second']:>8.1f} "
+              f"{row['p50_ms']:>9.1f} {row['p99_ms']:>9.1f} {row['max_ms']:>9.1f}")
+    print(f"throughput: {report['throughput']:.1f} commands/s over {report['elapsed']:.1f}s")
+    print(f"event loop lag: p99 {report['loop_lag_p99_ms']:.1f} ms, max {report['loop_lag_max_ms']:.1f} ms")
+    if report["memory_per_guild_kb"] is not None:
+        print(f"memory retained per guild: {report['memory_per_guild_kb']:.1f} KiB")
+    scheduler = report["scheduler"]
+    print(f"inference queue: {scheduler['completed']} completed, {scheduler['rejected']} rejected, "
+          f"wait p95 {scheduler['wait_p95'] * 1000:.0f} ms")
+    resolver = report["resolver"]
+    print(f"resolver: hit ratio {resolver['hit_ratio']:.2f}, {resolver['coalesced']} coalesced, {report['spotify_calls']} Spotify calls")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--guilds", type=int, default=20)
+    parser.add_argument("--users", type=int, default=5, help="users per guild")
+    parser.add_argument("--rate", type=float, default=0.2, help="commands per second per user")
+    parser.add_argument("--duration", type=float, default=20.0, help="seconds of simulated traffic")
+    parser.add_argument("--mix", type=lambda s: [float(w) for w in s.split(",")], default=[6, 2, 1, 1],
+                        help="relative weights of chat,play,queue,help")
+    parser.add_argument("--catalog", type=int, default=200, help="distinct songs users ask for")
+    parser.add_argument("--tokens", type=int, default=40, help="words per fake Ollama reply")
+    parser.add_argument("--token-delay", type=float, default=0.002, help="seconds per generated word")
+    parser.add_argument("--ollama-concurrency", type=int, default=4)
+    parser.add_argument("--spotify-latency", type=float, default=0.05)
+    parser.add_argument("--track-frames", type=int, default=50, help="20 ms frames per fake track")
+    parser.add_argument("--frame-interval", type=float, default=0.0, help="seconds the fake voice client waits per frame")
+    parser.add_argument("--stream", action=argparse.BooleanOptionalAction, default=True, help="stream chat replies")
+    parser.add_argument("--memory", action=argparse.BooleanOptionalAction, default=True,
+                        help="trace allocations for memory per guild (slows everything by a constant factor)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    parser.add_argument("--max-p99-ms", type=float, help="fail if any command's p99 latency exceeds this")
+    parser.add_argument("--min-throughput", type=float, help="fail if overall commands/s is below this")
+    parser.add_argument("--log-level", default="WARNING")
+    args = parser.parse_args()
+    logging.basicConfig(level=args.log_level, format="%(asctime)s [%(levelname)s] %(name)s: %(message)s")
+
+    ollama = FakeOllama(tokens=args.tokens, token_delay=args.token_delay).start()
+    configure_environment(args, ollama)
+    if args.memory:
+        tracemalloc.start()
+    try:
+        report = asyncio.run(LoadTest(args).run())
+    finally:
+        ollama.stop()
+    report["ollama_requests"] = ollama.requests
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+
+    failures = []
+    if args.max_p99_ms is not None:
+        failures.extend(f"{command} p99 {row['p99_ms']:.1f} ms > {args.max_p99_ms} ms"
+                        for command, row in report["commands"].items() if row["p99_ms"] > args.max_p99_ms)
+    if args.min_throughput is not None and report["throughput"] < args.min_throughput:
+        failures.append(f"throughput {report['throughput']:.1f}/s < {args.min_throughput}/s")
+    for failure in failures:
+        print(f"FAIL: {failure}", file=sys.stderr)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
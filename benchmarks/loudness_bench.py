@@ -0,0 +1,75 @@
+"""
+Throughput benchmark for loudness analysis.
+
+Writes synthetic 16-bit stereo WAV tracks (pink-ish noise at random levels), then measures
+them with the same batched process pool the music library uses, once per worker count.
+Reports tracks and seconds of audio analyzed per second, per core, and how far the
+normalized tracks land from the target. WAV is read directly; compressed formats add an
+FFmpeg decode on top of these numbers.
+
+Usage: python -m benchmarks.loudness_bench --tracks 64 --seconds 180 --workers 1,2,4
+"""
+import argparse
+import multiprocessing
+import os
+import tempfile
+import time
+import wave
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from scipy.signal import lfilter
+from cogs.loudness import ANALYSIS_BATCH, LOUDNESS_TARGET, analyze_batch, normalization_gain
+
+RATE = 44100
+
+
+def write_track(path, rng, seconds):
+    """Noise with a -3 dB/octave tilt at a random level between -35 and -8 dBFS RMS."""
+    white = rng.standard_normal((RATE * seconds, 2))
+    pink = lfilter([0.049922035, -0.095993537, 0.050612699, -0.004408786], [1, -2.494956002, 2.017265875, -0.522189400], white, axis=0)
+    pink *= 10 ** (rng.uniform(-35, -8) / 20) / np.sqrt(np.mean(pink ** 2))
+    with wave.open(path, "wb") as wav:
+        wav.setnchannels(2)
+        wav.setsampwidth(2)
+        wav.setframerate(RATE)
+        wav.writeframes((np.clip(pink, -1, 1) * 32767).astype("<i2").tobytes())
+
+
+def run(paths, workers):
+    batches = [paths[i:i + ANALYSIS_BATCH] for i in range(0, len(paths), ANALYSIS_BATCH)]
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+        # Start the workers before timing so interpreter start-up isn't counted.
+        list(pool.map(int, range(workers)))
+        started = time.perf_counter()
+        results = [row for rows in pool.map(analyze_batch, batches) for row in rows]
+        return results, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tracks", type=int, default=32)
+    parser.add_argument("--seconds", type=int, default=120, help="length of each track")
+    parser.add_argument("--workers", default=",".join(sorted({"1", str(os.cpu_count() or 1)})),
+                        help="comma-separated worker counts to compare")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    rng = np.random.default_rng(args.seed)
+    cores = os.cpu_count() or 1
+
+    with tempfile.TemporaryDirectory(prefix="loudness_bench-") as root:
+        paths = [os.path.join(root, f"track{i}.wav") for i in range(args.tracks)]
+        for path in paths:
+            write_track(path, rng, args.seconds)
+        audio_seconds = args.tracks * args.seconds
+        print(f"{args.tracks} tracks x {args.seconds}s, {cores} cores available")
+        print(f"{'workers':>7} {'tracks/s':>9} {'per core':>9} {'x realtime':>11} {'spread dB':>10}")
+        for workers in (int(w) for w in args.workers.split(",")):
+            results, elapsed = run(paths, workers)
+            normalized = [loudness + normalization_gain(loudness, peak) for _, loudness, peak in results if loudness is not None]
+            spread = max(abs(value - LOUDNESS_TARGET) for value in normalized) if normalized else float("nan")
+            rate = len(results) / elapsed
+            print(f"{workers:>7} {rate:>9.2f} {rate / min(workers, cores):>9.2f} {audio_seconds / elapsed:>11.0f} {spread:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+"""
+Benchmark for the profanity filter engine.
+
+Compiles synthetic word lists of increasing size and censors texts of increasing length,
+reporting compile time and throughput. Throughput should stay roughly flat as the text
+grows (linear scan) and degrade only slowly as the word list grows.
+
+Usage: python -m benchmarks.profanity_bench
+"""
+import argparse
+import random
+import string
+import time
+from cogs.profanity import ProfanityFilter
+
+
+def random_words(rng, count, min_len=4, max_len=10):
+    return ["".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(min_len, max_len))) for _ in range(count)]
+
+
+def random_text(rng, size, blocked):
+    words = []
+    length = 0
+    while length < size:
+        word = rng.choice(blocked) if rng.random() < 0.01 else "".join(
+            rng.choice(string.ascii_lowercase) for _ in range(rng.randint(2, 9)))
+        words.append(word)
+        length += len(word) + 1
+    return " ".join(words)[:size]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--wordlists", default="10,1000,10000", help="comma-separated word list sizes")
+    parser.add_argument("--texts", default="10000,100000,1000000", help="comma-separated text sizes in characters")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+
+    print(f"{'words':>7} {'compile ms':>11} {'text chars':>11} {'censor ms':>10} {'MB/s':>7}")
+    for count in (int(n) for n in args.wordlists.split(",")):
+        words = random_words(rng, count)
+        start = time.perf_counter()
+        engine = ProfanityFilter(words, allow=random_words(rng, max(1, count // 100)))
+        compile_ms = (time.perf_counter() - start) * 1000
+        for size in (int(n) for n in args.texts.split(",")):
+            text = random_text(rng, size, words)
+            start = time.perf_counter()
+            engine.censor(text)
+            elapsed = time.perf_counter() - start
+            print(f"{count:>7} {compile_ms:>11.1f} {size:>11} {elapsed * 1000:>10.2f} {size / elapsed / 1e6:>7.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,28 +1,73 @@
 import discord
 from discord.ext import commands
 import os
+import time
 import logging
 import asyncio
-import ollama  # Using the ollama.chat interface
-from cogs.utils import censor_text
+from cogs.utils import FILTERS, censor_text
+from cogs.metrics import REGISTRY, CallbackGauge
+from cogs.coalesce import MentionCoalescer, merge_mentions
+from cogs.images import ImagePipeline, ImageRejected, content_hash, probe_image
+from cogs.sessions import SESSION_IDLE_TIMEOUT, SessionStore
+from cogs.state_store import StateStore
+from cogs.streaming import StreamingReply, split_pages
+from cogs.ollama_client import OllamaClient, OllamaError
+from cogs.probes import ProbeCache
+from cogs.ratelimit import RateLimited, RateLimiter, policies_from_env
+from cogs.response_cache import RESPONSE_CACHE, ResponseCache
+from cogs.scheduler import InferenceScheduler, RequestCancelled, SchedulerBusy
 import random
-import base64
-import time
 
 logger = logging.getLogger(__name__)
 
-# Maximum conversation history entries (excluding the system prompt)
-MAX_HISTORY = 10
-
 # Example emoji pool
 EMOJI_POOL = ["😊", "😎", "😉", "👍", "🔥", "🤬", "💥"]
 
+# Updated system prompt with unhinged New Yorker personality.
+DEFAULT_SYSTEM_PROMPT = (
+    "You are Grok, a no-nonsense, foul-mouthed New Yorker who doesn't hold back. "
+    "You curse like a sailor in every other sentence and speak with raw, edgy honesty. "
+    "Mix profanity with humor and never be polite. Feel free to generate your own context "
+    "and add emojis when it suits you. NEVER say 'I have nothing to say.'"
+)
+
+def meme_system_prompt(meme_context: str) -> str:
+    """Build the system prompt used after a channel sets its meme context."""
+    return (
+        f"You are Grok, a no-nonsense, foul-mouthed New Yorker. Meme context: {meme_context}. "
+        "You curse like a sailor and speak with raw, edgy honesty. "
+        "Your responses are unfiltered, unhinged, and full of attitude—drop profanity liberally and don't give a damn about being polite."
+    )
+
+# Instructions for folding old turns into a channel's rolling summary.
+SUMMARY_PROMPT = (
+    "You maintain running notes on a Discord chat. Merge the previous summary and the new messages "
+    "into one updated summary of at most 150 words. Keep names, facts, requests and running jokes. "
+    "Write plain notes with no preamble."
+)
+# Generation cap for a summary, in tokens.
+SUMMARY_MAX_TOKENS = 256
+
+# Reply sent when the model can't be reached; never cached.
+AI_DOWN_MESSAGE = "AI is not running."
+
+# Question asked about an image when the command comes without one.
+DEFAULT_IMAGE_PROMPT = "What's in this image? Give me your honest take."
+
 def add_emoji(text: str) -> str:
     """Randomly append an emoji from the pool to a text string."""
     if random.random() < 0.5:
         return f"{text} {random.choice(EMOJI_POOL)}"
     return text
 
+def finalize_response(message: str) -> str:
+    """Replace empty or canned model answers with a fallback line, otherwise maybe add an emoji."""
+    message = message.strip()
+    if not message or message.lower() == "i have nothing to say.":
+        logger.warning("Received empty or default response from Ollama API.")
+        return "Fuck, I'm drawing a blank here."
+    return add_emoji(message)
+
 class AI(commands.Cog):
     """AI conversation commands using the Ollama API in a raw, unhinged New Yorker style with optional image support and spam prevention."""
     def __init__(self, bot):
@@ -31,11 +76,13 @@ class AI(commands.Cog):
         self.model = os.getenv("MODEL", "qwen:0.5b")
         # Set image recognition flag from env, if provided.
         image_rec_env = os.getenv("IMAGE_RECOGNITION", "").lower()
+        # True or False when set explicitly, which overrides the image probe; None to probe.
+        self.image_recognition = None
         if image_rec_env in ("true", "1", "yes"):
-            self.image_support = True
+            self.image_recognition = self.image_support = True
             logger.info("Image recognition enabled via environment variable.")
         elif image_rec_env in ("false", "0", "no"):
-            self.image_support = False
+            self.image_recognition = self.image_support = False
             logger.info("Image recognition disabled via environment variable.")
         else:
             self.image_support = False
@@ -46,93 +93,267 @@ class AI(commands.Cog):
             self.debounce_delay = float(os.getenv("DEBOUNCE_DELAY", "3"))
         except Exception:
             self.debounce_delay = 3.0
-        self.user_last_message = {}  # user_id -> timestamp
-
-        # Updated system prompt with unhinged New Yorker personality.
-        self.conversation_history = [{
-            "role": "system",
-            "content": (
-                "You are Grok, a no-nonsense, foul-mouthed New Yorker who doesn't hold back. "
-                "You curse like a sailor in every other sentence and speak with raw, edgy honesty. "
-                "Mix profanity with humor and never be polite. Feel free to generate your own context "
-                "and add emojis when it suits you. NEVER say 'I have nothing to say.'"
-            )
-        }]
-        self.meme_context = "default"
+        # Token buckets per (command, guild, user); see RATE_LIMITS in .env.example.
+        policies, default_policy = policies_from_env(self.debounce_delay)
+        self.rate_limiter = RateLimiter(policies, default_policy)
+
+        # Stream replies into an edited message instead of waiting for the full answer.
+        self.stream_responses = os.getenv("STREAM_RESPONSES", "true").lower() in ("true", "1", "yes")
+
+        # Pooled async connection to the Ollama server at OLLAMA_API_URL.
+        self.client = OllamaClient()
+        # Conversation state per (guild, channel).
+        self.sessions = SessionStore(DEFAULT_SYSTEM_PROMPT)
+        # Sessions are saved behind the scenes and read back when a channel is first used after a restart.
+        self.state = StateStore()
+        # Replays recent answers to repeated prompts when RESPONSE_CACHE is enabled.
+        self.response_cache = ResponseCache() if RESPONSE_CACHE else None
+        # Bounds how many generations run and wait at once.
+        self.scheduler = InferenceScheduler()
+        # Mentions arriving together in a channel are answered with one generation.
+        self.mentions = MentionCoalescer(self.answer_mentions)
+        # Downscales attachments off the loop and caches analyses by image hash.
+        self.images = ImagePipeline()
+        # Background summarization and probe tasks, kept referenced until they finish.
+        self._background = set()
+        # Capability probe results from earlier runs, keyed by model digest.
+        self.probes = ProbeCache()
+        # Read at scrape time only; unregistered on unload.
+        self.metrics = [
+            CallbackGauge("ollama_requests_running", "Generations currently running.", lambda: self.scheduler.running),
+            CallbackGauge("ollama_queue_depth", "Generation requests waiting for a slot.", lambda: self.scheduler.depth),
+            CallbackGauge("ai_sessions", "Chat sessions held in memory.", lambda: len(self.sessions)),
+        ]
         logger.info("AI cog initialized with unhinged system prompt using model: %s", self.model)
-        # Run test prompts.
-        asyncio.create_task(self.test_text_prompt())
-        if not os.getenv("IMAGE_RECOGNITION"):
-            asyncio.create_task(self.test_image_support())
+        self._spawn(self.probe_model())
+
+    def _spawn(self, coro):
+        task = asyncio.create_task(coro)
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+        return task
+
+    @staticmethod
+    def _state_key(key):
+        guild_id, channel_id = key
+        # DMs have no guild; 0 stands in for it in the state database.
+        return (guild_id or 0, channel_id)
+
+    async def session_for(self, channel):
+        """Return a channel's session, restoring it from the state database if it isn't in memory."""
+        key = SessionStore.key_for(channel)
+        if key not in self.sessions:
+            saved = await self.state.load("sessions", self._state_key(key))
+            # Another message may have started this session while the saved one was being read.
+            if saved is not None and key not in self.sessions:
+                state, updated_at = saved
+                if time.time() - updated_at < SESSION_IDLE_TIMEOUT:
+                    logger.info("Restored session %s with %d messages.", key, len(state.get("history", [])))
+                    return self.sessions.restore(channel, state)
+        return self.sessions.get(channel)
+
+    def save_session(self, session):
+        """Queue a write of the session; repeated calls before the next flush write once."""
+        self.state.mark_dirty("sessions", self._state_key(session.key), session.snapshot)
+
+    async def probe_model(self):
+        """
+        Check what the configured model can do. Results are saved per model digest, so
+        restarts with the same model skip the test generations entirely, and a first
+        probe goes through the scheduler instead of competing with user requests.
+        """
+        try:
+            digest = await self.client.model_digest(self.model)
+        except OllamaError as e:
+            logger.warning("Could not reach Ollama to check model %s: %s", self.model, e)
+            return
+        if digest is None:
+            logger.warning("Model %s is not installed on the Ollama server; skipping capability probes.", self.model)
+            return
+        saved = self.probes.get(self.model, digest) or {}
+        results = {key: value for key, value in saved.items() if key != "probed_at"}
+        # Entries saved before the text probe was recorded on its own only exist if it passed.
+        results.setdefault("text_ok", "image_support" in results)
+        needs_image_probe = self.image_recognition is None and "image_support" not in results
+        if results["text_ok"] and not needs_image_probe:
+            if self.image_recognition is None:
+                self.image_support = results["image_support"]
+            logger.info("Using saved capability probe for %s (%s): image support %s.",
+                        self.model, digest[:12], results.get("image_support", "not probed"))
+            return
+        try:
+            if not results["text_ok"]:
+                if not await self.scheduler.run(self.test_text_prompt):
+                    return
+                results["text_ok"] = True
+                self.probes.set(self.model, digest, results)
+            if needs_image_probe:
+                results["image_support"] = await self.scheduler.run(self.test_image_support)
+                self.image_support = results["image_support"]
+                self.probes.set(self.model, digest, results)
+        except SchedulerBusy:
+            logger.warning("Inference queue full; skipping capability probes for %s.", self.model)
 
-    async def test_text_prompt(self):
-        """Run a test text prompt on initialization to ensure basic API connectivity."""
+    async def test_text_prompt(self) -> bool:
+        """Run a test text prompt to ensure basic API connectivity."""
         test_prompt = "Hey, how's your damn day been?"
         logger.info("Running text test prompt on Ollama API: %s", test_prompt)
         try:
-            response = await asyncio.to_thread(
-                ollama.chat,
-                model=self.model,
-                messages=[{"role": "user", "content": test_prompt}]
+            response = await self.client.chat(
+                self.model,
+                [{"role": "user", "content": test_prompt}]
             )
             message = response["message"]["content"].strip() if response.get("message") else ""
             if message:
                 logger.info("Text test prompt successful. Response: %s", message)
             else:
                 logger.warning("Text test prompt returned an empty response.")
+            return bool(message)
         except Exception as e:
             logger.exception("Exception during text test prompt: %s", e)
+            return False
 
-    async def test_image_support(self):
+    async def test_image_support(self) -> bool:
         """
-        Run a test image prompt to check if the model supports images.
-        We simulate an image prompt by sending a special tag.
+        Check whether the model can see images by showing it a solid red square
+        and asking for the color. Text-only models ignore the image and guess.
         """
-        test_image_prompt = "[Image: sample_test_image]"
+        test_image_prompt = "What color is this image? Answer with one word."
         logger.info("Running image test prompt on Ollama API: %s", test_image_prompt)
         try:
-            response = await asyncio.to_thread(
-                ollama.chat,
-                model=self.model,
-                messages=self.conversation_history + [{"role": "user", "content": test_image_prompt}]
+            response = await self.client.chat(
+                self.model,
+                [{"role": "user", "content": test_image_prompt, "images": [probe_image()]}]
             )
             message = response["message"]["content"].strip() if response.get("message") else ""
-            if message and message.lower() != "i have nothing to say.":
-                self.image_support = True
+            if "red" in message.lower():
                 logger.info("Image test prompt successful. Image processing is supported. Response: %s", message)
-            else:
-                self.image_support = False
-                logger.warning("Image test prompt failed or returned empty. Image processing is not supported.")
+                return True
+            logger.warning("Image test prompt failed (response: %r). Image processing is not supported.", message)
         except Exception as e:
-            self.image_support = False
             logger.exception("Exception during image test prompt: %s", e)
+        return False
 
-    def update_history(self, role: str, content: str):
-        """Append a new message to the conversation history and maintain a maximum size."""
-        self.conversation_history.append({"role": role, "content": content})
-        if len(self.conversation_history) > (MAX_HISTORY + 1):
-            removed = self.conversation_history.pop(1)
-            logger.debug("Removed oldest conversation entry: %s", removed)
-        logger.debug("Updated conversation history: %s", self.conversation_history)
-
-    async def query_ollama(self) -> str:
-        """Query the Ollama API using the conversation history and return its response."""
-        logger.info("Querying Ollama API with conversation history length: %d", len(self.conversation_history))
+    async def query_ollama(self, session) -> str:
+        """Query the Ollama API using a session's conversation history and return its response."""
+        logger.info("Querying Ollama API for session %s with history length: %d", session.key, len(session.history))
         try:
-            response = await asyncio.to_thread(
-                ollama.chat,
-                model=self.model,
-                messages=self.conversation_history
-            )
+            response = await self.client.chat(self.model, session.messages())
             message = response["message"]["content"].strip() if response.get("message") else ""
             logger.info("Received response from Ollama API: %s", message)
-            if not message or message.lower() == "i have nothing to say.":
-                logger.warning("Received empty or default response from Ollama API.")
-                return "Fuck, I'm drawing a blank here."
-            return add_emoji(message)
+            return finalize_response(message)
         except Exception as e:
             logger.exception("Exception while querying Ollama API: %s", e)
-            return "AI is not running."
+            return AI_DOWN_MESSAGE
+
+    async def respond(self, ctx, session):
+        """
+        Generate a reply for a session and post it in the invoking channel.
+        Returns (the censored text that was sent, for the session history; whether the answer completed).
+        """
+        guild_id = ctx.guild.id if ctx.guild else None
+        if not self.stream_responses:
+            response_message = await self.query_ollama(session)
+            complete = response_message != AI_DOWN_MESSAGE
+            response_message = censor_text(response_message, guild_id)
+            for page in split_pages(response_message):
+                await ctx.send(page)
+            return response_message, complete
+
+        logger.info("Streaming Ollama API reply for session %s with history length: %d", session.key, len(session.history))
+        reply = StreamingReply(ctx, censor=lambda text: censor_text(text, guild_id))
+        complete = True
+        try:
+            async for chunk in self.client.chat_stream(self.model, session.messages()):
+                await reply.feed(chunk)
+        except Exception as e:
+            logger.exception("Exception while streaming from Ollama API: %s", e)
+            if not reply.text.strip():
+                await ctx.send(AI_DOWN_MESSAGE)
+                return AI_DOWN_MESSAGE, False
+            # Keep what already arrived on screen, but it's not an answer worth replaying.
+            complete = False
+        response_message = await reply.finish(lambda text: censor_text(finalize_response(text), guild_id))
+        logger.info("Streamed response from Ollama API in %d message(s): %s", len(reply.messages), response_message)
+        return response_message, complete
+
+    async def converse(self, ctx, session, content: str):
+        """
+        Add a user turn to a session, generate and send the reply through the scheduler,
+        and record the answer. Returns the reply, or None if the request was turned away or cancelled.
+        """
+        entry = session.update_history("user", content)
+        logger.debug("Current conversation history for %s: %s", session.key, session.history)
+        cache_key = None
+        if self.response_cache is not None:
+            guild_id = ctx.guild.id if ctx.guild else None
+            # Replies are cached censored, so they're only replayed under the same guild's filter.
+            profanity_filter = FILTERS.for_guild(guild_id)
+            cache_key = self.response_cache.key_for(self.model, session, guild_id)
+            cached = self.response_cache.get(cache_key, profanity_filter)
+            if cached is not None:
+                for page in split_pages(cached):
+                    await ctx.send(page)
+                session.update_history("assistant", cached)
+                self.maybe_compact(session)
+                self.save_session(session)
+                logger.info("Response cache hit for session %s (hit ratio %.2f).", session.key, self.response_cache.hit_ratio)
+                return cached
+        try:
+            response_message, complete = await self.scheduler.run(
+                lambda: self.respond(ctx, session),
+                guild_id=ctx.guild.id if ctx.guild else None,
+                user_id=ctx.author.id,
+                message_id=ctx.message.id
+            )
+        except SchedulerBusy:
+            session.forget(entry)
+            await ctx.send("I'm busy as hell right now, try again in a minute.")
+            logger.warning("Inference queue full; rejected request from %s.", ctx.author)
+            return None
+        except RequestCancelled:
+            session.forget(entry)
+            logger.info("Dropped request from %s; invoking message was deleted.", ctx.author)
+            return None
+        if cache_key is not None and complete:
+            self.response_cache.set(cache_key, response_message, profanity_filter)
+        session.update_history("assistant", response_message)
+        self.maybe_compact(session)
+        self.save_session(session)
+        return response_message
+
+    def maybe_compact(self, session):
+        """Start folding a session's oldest turns into its summary if history is over the token budget."""
+        if not session.needs_compaction:
+            return
+        batch = session.compaction_batch()
+        if not batch:
+            return
+        session.compacting = True
+        self._spawn(self.compact_history(session, batch))
+
+    async def compact_history(self, session, batch):
+        """Summarize the given turns together with the existing summary and swap them out of the history."""
+        transcript = "\n".join(f"{entry['role']}: {entry['content']}" for entry in batch)
+        prompt = f"Previous summary:\n{session.summary or '(none)'}\n\nNew messages:\n{transcript}"
+        messages = [{"role": "system", "content": SUMMARY_PROMPT}, {"role": "user", "content": prompt}]
+        logger.info("Compacting %d messages for session %s (~%d tokens).", len(batch), session.key, session.tokens)
+        try:
+            response = await self.scheduler.run(
+                lambda: self.client.chat(self.model, messages, options={"num_predict": SUMMARY_MAX_TOKENS}),
+                guild_id=session.key[0]
+            )
+            summary = response["message"]["content"].strip() if response.get("message") else ""
+            if summary:
+                session.apply_summary(batch, summary)
+                self.save_session(session)
+                logger.info("Session %s compacted to ~%d tokens of history.", session.key, session.tokens)
+        except SchedulerBusy:
+            logger.debug("Inference queue full; deferring compaction for session %s.", session.key)
+        except Exception as e:
+            logger.exception("Exception while compacting session %s: %s", session.key, e)
+        finally:
+            session.compacting = False
 
     @commands.command(name="chat", aliases=["ai"])
     async def chat(self, ctx, *, message: str):
@@ -140,48 +361,46 @@ class AI(commands.Cog):
         Engage in conversation with the AI.
         Usage (by mentioning the bot): @BotName chat <message>
         """
-        # Debounce check: if this user spammed recently, delete the message and ignore.
-        now = time.time()
-        last = self.user_last_message.get(ctx.author.id, 0)
-        if now - last < self.debounce_delay:
-            try:
-                await ctx.message.delete()
-                logger.info("Debounce: Deleted spam message from %s", ctx.author)
-            except Exception as e:
-                logger.exception("Failed to delete spam message: %s", e)
-            return
-        self.user_last_message[ctx.author.id] = now
-
         logger.info("Chat command invoked by %s with message: %s", ctx.author, message)
-        self.update_history("user", message)
-        logger.debug("Current conversation history: %s", self.conversation_history)
-        response_message = await self.query_ollama()
-        response_message = censor_text(response_message)
-        self.update_history("assistant", response_message)
-        await ctx.send(response_message)
+        session = await self.session_for(ctx.channel)
+        response_message = await self.converse(ctx, session, message)
+        if response_message is None:
+            return
         logger.info("Sent chat response to %s: %s", ctx.author, response_message)
 
     @commands.command(name="setmeme")
     async def setmeme(self, ctx, *, context: str):
         """
-        Change the meme context of the AI.
+        Change the meme context of the AI for this channel.
         Usage (by mentioning the bot): @BotName setmeme <context>
         """
-        self.meme_context = context
-        new_system_prompt = (
-            f"You are Grok, a no-nonsense, foul-mouthed New Yorker. Meme context: {self.meme_context}. "
-            "You curse like a sailor and speak with raw, edgy honesty. "
-            "Your responses are unfiltered, unhinged, and full of attitude—drop profanity liberally and don't give a damn about being polite."
-        )
-        self.conversation_history[0]["content"] = new_system_prompt
+        session = await self.session_for(ctx.channel)
+        session.meme_context = context
+        session.set_system_prompt(meme_system_prompt(context))
+        self.save_session(session)
         await ctx.send(f"Meme context updated to: {context}")
-        logger.info("Meme context updated to: %s by %s", context, ctx.author)
+        logger.info("Meme context for %s updated to: %s by %s", session.key, context, ctx.author)
+
+    async def describe_image(self, session, prompt: str, image_b64: str) -> str:
+        """Ask the model about one image in the channel's persona. The chat history is left out so the answer can be reused."""
+        messages = [
+            {"role": "system", "content": session.system_prompt},
+            {"role": "user", "content": prompt, "images": [image_b64]}
+        ]
+        try:
+            response = await self.client.chat(self.model, messages)
+            message = response["message"]["content"].strip() if response.get("message") else ""
+            logger.info("Received image analysis from Ollama API: %s", message)
+            return finalize_response(message)
+        except Exception as e:
+            logger.exception("Exception while querying Ollama API with an image: %s", e)
+            return AI_DOWN_MESSAGE
 
     @commands.command(name="analyzeimage", aliases=["img"])
-    async def analyze_image(self, ctx):
+    async def analyze_image(self, ctx, *, prompt: str = DEFAULT_IMAGE_PROMPT):
         """
-        Process an attached image if image processing is supported.
-        If not, inform the user that image processing isn’t available.
+        Show the model an attached image, optionally with a question about it.
+        Usage: !analyzeimage [question] with an image attached.
         """
         logger.info("AnalyzeImage command invoked by %s", ctx.author)
         if not self.image_support:
@@ -195,43 +414,71 @@ class AI(commands.Cog):
             return
 
         attachment = ctx.message.attachments[0]
+        if attachment.content_type and not attachment.content_type.startswith("image/"):
+            await ctx.send("That attachment isn't an image.")
+            return
+        if self.images.too_large(attachment):
+            await ctx.send(f"That image is too damn big; keep it under {self.images.max_bytes // (1024 * 1024)} MB.")
+            logger.info("Rejected %d byte image from %s.", attachment.size, ctx.author)
+            return
+
+        session = await self.session_for(ctx.channel)
+        guild_id = ctx.guild.id if ctx.guild else None
         try:
             image_bytes = await attachment.read()
-            # Optionally convert image to base64 if needed (for demonstration)
-            image_b64 = base64.b64encode(image_bytes).decode("utf-8")
-            image_prompt = f"[ImageData: {image_b64[:30]}...]"  
-            logger.info("Image data encoded and prepared for query.")
-            self.update_history("user", image_prompt)
-            response_message = await self.query_ollama()
-            response_message = censor_text(response_message)
-            self.update_history("assistant", response_message)
-            await ctx.send(response_message)
-            logger.info("Sent image analysis response to %s: %s", ctx.author, response_message)
-        except Exception as e:
-            logger.exception("Exception while processing image attachment: %s", e)
+        except discord.HTTPException as e:
+            logger.exception("Exception while downloading image attachment: %s", e)
             await ctx.send("There was an error processing your image.")
+            return
+        cache_key = self.images.result_key(self.model, session.system_prompt, content_hash(image_bytes), prompt)
+        analysis = self.images.results.get(cache_key)
+        if analysis is not None:
+            logger.info("Image analysis cache hit for %s (hit ratio %.2f).", ctx.author, self.images.results.hit_ratio)
+        else:
+            try:
+                image_b64 = await self.images.prepare(image_bytes)
+            except ImageRejected as e:
+                await ctx.send("I can't read that image.")
+                logger.info("Could not decode image from %s: %s", ctx.author, e)
+                return
+            logger.info("Prepared %d byte image from %s as %d bytes of base64.", len(image_bytes), ctx.author, len(image_b64))
+            try:
+                analysis = await self.scheduler.run(
+                    lambda: self.describe_image(session, prompt, image_b64),
+                    guild_id=guild_id,
+                    user_id=ctx.author.id,
+                    message_id=ctx.message.id
+                )
+            except SchedulerBusy:
+                await ctx.send("I'm busy as hell right now, try again in a minute.")
+                logger.warning("Inference queue full; rejected image request from %s.", ctx.author)
+                return
+            except RequestCancelled:
+                logger.info("Dropped image request from %s; invoking message was deleted.", ctx.author)
+                return
+            if analysis != AI_DOWN_MESSAGE:
+                self.images.results.set(cache_key, analysis)
+
+        response_message = censor_text(analysis, guild_id)
+        for page in split_pages(response_message):
+            await ctx.send(page)
+        # Keep the exchange in the conversation as text so follow-up chat has context.
+        session.update_history("user", f"[Image] {prompt}")
+        session.update_history("assistant", response_message)
+        self.maybe_compact(session)
+        self.save_session(session)
+        logger.info("Sent image analysis response to %s: %s", ctx.author, response_message)
 
     @commands.Cog.listener()
     async def on_message(self, message):
         """
         Listen for messages that start with a bot mention.
-        Apply debounce and then invoke the chat command with the remaining text.
+        Apply the chat rate limit and then invoke the chat command with the remaining text.
+        Messages not addressed to the bot are ignored without any further work.
         """
         if message.author.bot:
             return
 
-        # Debounce for on_message as well.
-        now = time.time()
-        last = self.user_last_message.get(message.author.id, 0)
-        if now - last < self.debounce_delay:
-            try:
-                await message.delete()
-                logger.info("Debounce: Deleted spam message from %s", message.author)
-            except Exception as e:
-                logger.exception("Failed to delete spam message: %s", e)
-            return
-        self.user_last_message[message.author.id] = now
-
         bot_mention = f"<@{self.bot.user.id}>"
         bot_mention_alt = f"<@!{self.bot.user.id}>"
         if message.content.startswith(bot_mention) or message.content.startswith(bot_mention_alt):
@@ -243,11 +490,72 @@ class AI(commands.Cog):
             if not content:
                 logger.debug("Mention detected but no content provided.")
                 return
+            retry_after = self.retry_after(self.chat.qualified_name, message.guild, message.author)
+            if retry_after:
+                # Dropped silently: no delete or reply, so spam costs no API calls.
+                logger.info("Rate limited %s on mention for %.1fs.", message.author, retry_after)
+                return
             logger.info("Processed content after stripping mention: %s", content)
-            ctx = await self.bot.get_context(message)
-            ctx.invoked_with = "chat"
+            if self.mentions.enabled:
+                self.mentions.add(message, content)
+                return
+            await self.answer_mentions([(message, content)])
+
+    async def answer_mentions(self, batch):
+        """
+        Reply to one or more mentions from a channel. A single mention runs the chat command;
+        several are merged into one turn naming each speaker and answered with one generation.
+        """
+        message, content = batch[-1]
+        ctx = await self.bot.get_context(message)
+        ctx.invoked_with = "chat"
+        if len(batch) == 1:
             await ctx.invoke(self.chat, message=content)
             logger.info("Chat command invoked via on_message with content: %s", content)
+            return
+        session = await self.session_for(ctx.channel)
+        response_message = await self.converse(ctx, session, merge_mentions(batch))
+        if response_message is not None:
+            logger.info("Sent one response to %d mentions from %s.", len(batch),
+                        ", ".join(sorted({str(m.author) for m, _ in batch})))
+
+    def retry_after(self, command_name: str, guild, user) -> float:
+        """Take a rate limit token for a command use; returns seconds to wait, or 0 if allowed."""
+        return self.rate_limiter.hit(command_name, guild.id if guild else None, user.id)
+
+    async def cog_check(self, ctx):
+        retry_after = self.retry_after(ctx.command.qualified_name, ctx.guild, ctx.author)
+        if retry_after:
+            raise RateLimited(retry_after)
+        return True
+
+    async def cog_command_error(self, ctx, error):
+        if isinstance(error, RateLimited):
+            # Dropped silently: no delete or reply, so spam costs no API calls.
+            logger.info("Rate limited %s on %s for %.1fs.", ctx.author, ctx.command, error.retry_after)
+        else:
+            # Defining this handler stops discord.py's default one from logging anything for this cog.
+            logger.error("Ignoring exception in command %s", ctx.command, exc_info=error)
+
+    async def cog_unload(self):
+        for task in list(self._background):
+            task.cancel()
+        self.mentions.close()
+        await self.state.close()
+        self.images.close()
+        for metric in self.metrics:
+            REGISTRY.unregister(metric)
+        await self.client.close()
+
+    @commands.Cog.listener()
+    async def on_raw_message_delete(self, payload):
+        """Drop any pending or running generation for a deleted message."""
+        self.scheduler.cancel_message(payload.message_id)
+
+    @commands.Cog.listener()
+    async def on_raw_bulk_message_delete(self, payload):
+        for message_id in payload.message_ids:
+            self.scheduler.cancel_message(message_id)
 
 async def setup(bot):
     await bot.add_cog(AI(bot))
@@ -0,0 +1,96 @@
+import os
+import time
+import logging
+from collections import deque
+import discord
+from discord.oggparse import OggStream
+
+logger = logging.getLogger(__name__)
+
+# Number of 20 ms frames decoded ahead for the next track (50 frames = 1 second of audio).
+try:
+    PREFETCH_FRAMES = int(os.getenv("PREFETCH_FRAMES", "50"))
+except ValueError:
+    PREFETCH_FRAMES = 50
+
+# Duration of one frame handed to the voice client, in seconds.
+FRAME_SECONDS = 0.02
+
+
+class PrerollSource(discord.AudioSource):
+    """
+    Wraps an audio source so its first frames can be decoded before playback starts.
+    preload() fills a bounded buffer (run it off the event loop); read() serves the
+    buffered frames first and then reads straight through to the wrapped source.
+    The time of the first read is recorded so inter-track gaps can be measured, and frames
+    handed out are counted so the playback position can be saved and resumed.
+    """
+    def __init__(self, source, on_start=None, offset=0.0):
+        self.source = source
+        self._buffer = deque()
+        self._exhausted = False
+        self.started_at = None
+        # Seconds into the track the wrapped source starts at, when resuming.
+        self.offset = offset
+        self.frames_read = 0
+        # Called with the perf_counter() timestamp of the first frame handed to the voice client.
+        self._on_start = on_start
+
+    def preload(self, frames=PREFETCH_FRAMES):
+        """Decode up to `frames` frames into the buffer. Blocking; call it from a worker thread."""
+        while len(self._buffer) < frames and not self._exhausted:
+            frame = self.source.read()
+            if not frame:
+                self._exhausted = True
+                break
+            self._buffer.append(frame)
+        return len(self._buffer)
+
+    def read(self):
+        if self.started_at is None:
+            self.started_at = time.perf_counter()
+            if self._on_start is not None:
+                self._on_start(self.started_at)
+        if self._buffer:
+            frame = self._buffer.popleft()
+        elif self._exhausted:
+            return b''
+        else:
+            frame = self.source.read()
+        if frame:
+            self.frames_read += 1
+        return frame
+
+    @property
+    def position(self):
+        """Seconds into the track of the last frame played."""
+        return self.offset + self.frames_read * FRAME_SECONDS
+
+    def is_opus(self):
+        return self.source.is_opus()
+
+    def cleanup(self):
+        self._buffer.clear()
+        self.source.cleanup()
+
+
+class OpusPassthroughSource(discord.AudioSource):
+    """
+    Streams pre-encoded Opus packets from an Ogg file with no decode or re-encode step.
+    `skip` seconds are dropped from the start, counting each packet as one 20 ms frame.
+    """
+    def __init__(self, path, skip=0.0):
+        self._file = open(path, "rb")
+        self._packets = OggStream(self._file).iter_packets()
+        for _ in range(int(skip / FRAME_SECONDS)):
+            if next(self._packets, None) is None:
+                break
+
+    def read(self):
+        return next(self._packets, b'')
+
+    def is_opus(self):
+        return True
+
+    def cleanup(self):
+        self._file.close()
@@ -0,0 +1,273 @@
+import asyncio
+import json
+import math
+import multiprocessing
+import os
+import queue
+import signal
+import time
+import urllib.request
+import logging
+from discord.ext import commands
+
+logger = logging.getLogger(__name__)
+
+# Seconds between stats snapshots sent from each worker to the supervisor and back out.
+try:
+    CLUSTER_STATS_INTERVAL = float(os.getenv("CLUSTER_STATS_INTERVAL", "15"))
+except ValueError:
+    CLUSTER_STATS_INTERVAL = 15.0
+# Seconds between starting workers, so their shards don't all identify with Discord at once.
+try:
+    CLUSTER_START_STAGGER = float(os.getenv("CLUSTER_START_STAGGER", "5"))
+except ValueError:
+    CLUSTER_START_STAGGER = 5.0
+# Restart backoff for crashed workers: doubles per crash up to the maximum, and resets once
+# a worker has stayed up for RESTART_RESET_AFTER seconds.
+RESTART_BACKOFF = 2.0
+RESTART_BACKOFF_MAX = 300.0
+RESTART_RESET_AFTER = 60.0
+
+STARTED_AT = time.monotonic()
+
+
+def split_shards(shard_count: int, workers: int):
+    """Spread shard ids 0..shard_count-1 over at most `workers` contiguous, near-equal ranges."""
+    workers = max(1, min(workers, shard_count))
+    size = math.ceil(shard_count / workers)
+    return [list(range(start, min(start + size, shard_count))) for start in range(0, shard_count, size)]
+
+
+def recommended_shard_count(token: str) -> int:
+    """Ask Discord how many shards it recommends for this bot (GET /gateway/bot)."""
+    request = urllib.request.Request(
+        "https://discord.com/api/v10/gateway/bot",
+        headers={"Authorization": f"Bot {token}", "User-Agent": "DiscordBot (cluster launcher, 1.0)"}
+    )
+    with urllib.request.urlopen(request, timeout=10) as response:
+        return int(json.load(response)["shards"])
+
+
+def peak_rss_mb():
+    """Peak resident memory of this process in MB, or None where `resource` is missing (Windows)."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    # ru_maxrss is in KiB on Linux.
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def process_stats(bot, worker_id=None) -> dict:
+    """A small, picklable snapshot of this process for owner stats."""
+    shard_ids = getattr(bot, "shard_ids", None)
+    if shard_ids is None and bot.shard_id is not None:
+        shard_ids = [bot.shard_id]
+    latency = bot.latency
+    stats = {
+        "worker": worker_id,
+        "pid": os.getpid(),
+        "shards": list(shard_ids or []),
+        "guilds": len(bot.guilds),
+        "voice": len(bot.voice_clients),
+        "latency_ms": latency * 1000 if math.isfinite(latency) else None,
+        "peak_rss_mb": peak_rss_mb(),
+        "uptime": time.monotonic() - STARTED_AT,
+    }
+    ai = bot.get_cog("AI")
+    if ai is not None:
+        stats["ai_queue"] = ai.scheduler.depth
+    music = bot.get_cog("Music")
+    if music is not None:
+        stats["players"] = len(music.players)
+    return stats
+
+
+class ClusterLink:
+    """
+    Worker side of the stats channel. Periodically pushes this process's snapshot to the
+    supervisor and picks up the latest snapshots of every worker it broadcasts back.
+    Both directions are non-blocking multiprocessing queues, so the event loop never waits on IPC.
+    """
+    def __init__(self, worker_id, outbox, inbox, interval=CLUSTER_STATS_INTERVAL):
+        self.worker_id = worker_id
+        self.outbox = outbox
+        self.inbox = inbox
+        self.interval = interval
+        self.cluster = {}  # worker_id -> last snapshot received from the supervisor
+        self.updated_at = None
+
+    def publish(self, bot):
+        try:
+            self.outbox.put_nowait((self.worker_id, process_stats(bot, self.worker_id)))
+        except queue.Full:
+            pass
+
+    def receive(self):
+        while True:
+            try:
+                snapshots = self.inbox.get_nowait()
+            except queue.Empty:
+                return
+            self.cluster = snapshots
+            self.updated_at = time.monotonic()
+
+    async def run(self, bot):
+        while True:
+            self.publish(bot)
+            self.receive()
+            await asyncio.sleep(self.interval)
+
+
+class _Worker:
+    def __init__(self, worker_id, shard_ids):
+        self.worker_id = worker_id
+        self.shard_ids = shard_ids
+        self.process = None
+        self.inbox = None
+        self.started_at = None
+        self.backoff = RESTART_BACKOFF
+        self.restart_at = None
+        self.restarts = 0
+
+
+class Supervisor:
+    """
+    Runs one bot process per shard range and keeps them running: crashed workers are restarted
+    with exponential backoff, and stats snapshots are relayed between workers. `target` is called
+    in each child as target(worker_id, shard_ids, shard_count, outbox, inbox) and must be importable.
+    """
+    def __init__(self, target, shard_count, workers, stats_interval=CLUSTER_STATS_INTERVAL):
+        self.target = target
+        self.shard_count = shard_count
+        self.stats_interval = stats_interval
+        self._mp = multiprocessing.get_context("spawn")
+        self.outbox = self._mp.Queue()
+        self.workers = [_Worker(worker_id, shard_ids) for worker_id, shard_ids in enumerate(split_shards(shard_count, workers))]
+        self.snapshots = {}
+        self._stopping = False
+
+    def _start(self, worker):
+        worker.inbox = self._mp.Queue(maxsize=4)
+        worker.process = self._mp.Process(
+            target=self.target,
+            args=(worker.worker_id, worker.shard_ids, self.shard_count, self.outbox, worker.inbox),
+            name=f"bot-worker-{worker.worker_id}",
+        )
+        worker.process.start()
+        worker.started_at = time.monotonic()
+        worker.restart_at = None
+        logger.info(f"Started worker {worker.worker_id} (pid {worker.process.pid}) for shards "
+                    f"{worker.shard_ids[0]}-{worker.shard_ids[-1]} of {self.shard_count}.")
+
+    def _check(self, worker, now):
+        if worker.process is None or worker.process.is_alive():
+            return
+        if worker.restart_at is None:
+            code = worker.process.exitcode
+            if now - worker.started_at >= RESTART_RESET_AFTER:
+                worker.backoff = RESTART_BACKOFF
+            worker.restart_at = now + worker.backoff
+            logger.error(f"Worker {worker.worker_id} exited with code {code}; restarting in {worker.backoff:.0f}s.")
+            worker.backoff = min(worker.backoff * 2, RESTART_BACKOFF_MAX)
+            self.snapshots.pop(worker.worker_id, None)
+        elif now >= worker.restart_at:
+            worker.restarts += 1
+            self._start(worker)
+
+    def _relay(self):
+        while True:
+            try:
+                worker_id, snapshot = self.outbox.get_nowait()
+            except queue.Empty:
+                break
+            self.snapshots[worker_id] = snapshot
+        snapshots = {
+            worker_id: dict(snapshot, restarts=self.workers[worker_id].restarts)
+            for worker_id, snapshot in self.snapshots.items()
+        }
+        for worker in self.workers:
+            if worker.process is not None and worker.process.is_alive():
+                try:
+                    worker.inbox.put_nowait(snapshots)
+                except queue.Full:
+                    pass
+
+    def _stop(self, signum=None, frame=None):
+        self._stopping = True
+
+    def run(self):
+        signal.signal(signal.SIGINT, self._stop)
+        signal.signal(signal.SIGTERM, self._stop)
+        logger.info(f"Cluster starting: {self.shard_count} shards over {len(self.workers)} workers.")
+        pending = list(self.workers)
+        next_start = 0.0
+        next_relay = time.monotonic() + self.stats_interval
+        while not self._stopping:
+            now = time.monotonic()
+            if pending and now >= next_start:
+                self._start(pending.pop(0))
+                next_start = now + CLUSTER_START_STAGGER
+            for worker in self.workers:
+                self._check(worker, now)
+            if now >= next_relay:
+                self._relay()
+                next_relay = now + self.stats_interval
+            time.sleep(0.5)
+        self.shutdown()
+
+    def shutdown(self, timeout=30.0):
+        logger.info("Cluster shutting down.")
+        for worker in self.workers:
+            if worker.process is not None and worker.process.is_alive():
+                worker.process.terminate()
+        deadline = time.monotonic() + timeout
+        for worker in self.workers:
+            if worker.process is not None:
+                worker.process.join(max(0.0, deadline - time.monotonic()))
+                if worker.process.is_alive():
+                    logger.warning(f"Worker {worker.worker_id} did not exit in time; killing it.")
+                    worker.process.kill()
+                    worker.process.join()
+
+
+def format_uptime(seconds: float) -> str:
+    hours, remainder = divmod(int(seconds), 3600)
+    return f"{hours}h{remainder // 60:02d}m"
+
+
+class Cluster(commands.Cog):
+    """Owner-only process and shard stats, for one process or the whole cluster."""
+    def __init__(self, bot):
+        self.bot = bot
+
+    async def cog_check(self, ctx):
+        return await self.bot.is_owner(ctx.author)
+
+    @commands.command(name="stats")
+    async def stats(self, ctx):
+        """Shows guilds, shards, latency and memory for each bot process."""
+        link = getattr(self.bot, "cluster_link", None)
+        local = process_stats(self.bot, link.worker_id if link else None)
+        snapshots = dict(link.cluster) if link else {}
+        snapshots[local["worker"]] = dict(snapshots.get(local["worker"], {}), **local)
+        lines = [f"{'worker':>6} {'pid':>7} {'shards':>9} {'guilds':>7} {'voice':>5} {'ms':>5} {'MB':>6} {'up':>7} {'restarts':>8}"]
+        for worker_id in sorted(snapshots, key=lambda w: -1 if w is None else w):
+            s = snapshots[worker_id]
+            shards = f"{s['shards'][0]}-{s['shards'][-1]}" if s["shards"] else "-"
+            latency = f"{s['latency_ms']:.0f}" if s["latency_ms"] is not None else "-"
+            memory = f"{s['peak_rss_mb']:.0f}" if s.get("peak_rss_mb") is not None else "-"
+            lines.append(
+                f"{'-' if worker_id is None else worker_id:>6} {s['pid']:>7} {shards:>9} {s['guilds']:>7} {s['voice']:>5} "
+                f"{latency:>5} {memory:>6} {format_uptime(s['uptime']):>7} {s.get('restarts', 0):>8}"
+            )
+        total = sum(s["guilds"] for s in snapshots.values())
+        footer = f"{total} guilds across {len(snapshots)} process(es)."
+        if link and link.updated_at is not None:
+            footer += f" Other workers as of {time.monotonic() - link.updated_at:.0f}s ago."
+        await ctx.send("```\n" + "\n".join(lines) + "\n```\n" + footer)
+        logger.info("Stats command invoked by %s", ctx.author)
+
+
+async def setup(bot):
+    await bot.add_cog(Cluster(bot))
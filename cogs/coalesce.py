@@ -0,0 +1,99 @@
+import asyncio
+import os
+import logging
+from cogs.metrics import MENTION_BATCH_SIZE
+
+logger = logging.getLogger(__name__)
+
+# Mentions arriving while a channel's reply is being generated are answered together once it's done.
+MENTION_COALESCE = os.getenv("MENTION_COALESCE", "true").lower() in ("true", "1", "yes")
+# A held batch is answered as soon as it has this many mentions, without waiting for the reply in progress.
+try:
+    MENTION_COALESCE_MAX = int(os.getenv("MENTION_COALESCE_MAX", "8"))
+except ValueError:
+    MENTION_COALESCE_MAX = 8
+
+def speaker_name(member) -> str:
+    return getattr(member, "display_name", None) or str(member)
+
+
+def merge_mentions(batch) -> str:
+    """
+    Combine (message, content) pairs from several people into one user turn. Consecutive
+    messages from the same person are joined, and the model is told who said what.
+    """
+    turns = []
+    for message, content in batch:
+        name = speaker_name(message.author)
+        if turns and turns[-1][0] == name:
+            turns[-1][1].append(content)
+        else:
+            turns.append((name, [content]))
+    names = sorted({name for name, _ in turns})
+    if len(names) == 1:
+        return " ".join(part for _, parts in turns for part in parts)
+    lines = [f"{name}: {' '.join(parts)}" for name, parts in turns]
+    return (f"{len(names)} people talked to you at once. Answer all of them in one message, "
+            f"addressing each by name ({', '.join(names)}).\n" + "\n".join(lines))
+
+
+class MentionCoalescer:
+    """
+    Answers a mention in a quiet channel straight away. Mentions arriving while that answer is
+    being generated are held and handed to `answer` together once it finishes, as one list of
+    (message, content) pairs in arrival order. A burst costs two generations instead of one per
+    message, and the first mention never waits.
+    """
+    def __init__(self, answer, enabled=MENTION_COALESCE, max_batch=MENTION_COALESCE_MAX):
+        self.answer = answer
+        self.enabled = enabled
+        self.max_batch = max_batch
+        self._pending = {}  # channel id -> [(message, content)] held until the channel's answer is done
+        self._running = {}  # channel id -> answers in progress
+        self._tasks = set()
+        self.batches = 0
+        self.mentions = 0
+
+    def add(self, message, content):
+        """Answer a mention now if its channel is quiet, otherwise hold it for the next batch."""
+        key = message.channel.id
+        self.mentions += 1
+        if key not in self._running:
+            self._start(key, [(message, content)])
+            return
+        batch = self._pending.setdefault(key, [])
+        batch.append((message, content))
+        if len(batch) >= self.max_batch:
+            self._start(key, self._pending.pop(key))
+
+    def _start(self, key, batch):
+        self.batches += 1
+        MENTION_BATCH_SIZE.observe(len(batch))
+        if len(batch) > 1:
+            logger.info("Answering %d mentions in channel %s with one generation.", len(batch), key)
+        self._running[key] = self._running.get(key, 0) + 1
+        task = asyncio.create_task(self._answer(key, batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _answer(self, key, batch):
+        try:
+            await self.answer(batch)
+        except Exception as e:
+            logger.exception("Exception while answering %d mentions: %s", len(batch), e)
+        finally:
+            self._running[key] -= 1
+            if not self._running[key]:
+                del self._running[key]
+            held = self._pending.pop(key, None)
+            if held:
+                self._start(key, held)
+
+    def stats(self):
+        return {"mentions": self.mentions, "batches": self.batches, "pending": sum(len(b) for b in self._pending.values())}
+
+    def close(self):
+        """Drop held mentions and cancel answers in progress."""
+        self._pending.clear()
+        for task in list(self._tasks):
+            task.cancel()
@@ -0,0 +1,155 @@
+import logging
+import re
+import numpy as np
+from scipy.signal import sosfilt
+import discord
+
+logger = logging.getLogger(__name__)
+
+SAMPLE_RATE = 48000
+CHANNELS = 2
+# Largest boost or cut accepted for a single EQ band, in dB.
+MAX_BAND_GAIN_DB = 12.0
+
+# name -> (filter type, centre/corner frequency in Hz, Q)
+EQ_BANDS = {
+    "bass": ("lowshelf", 120.0, 0.707),
+    "lowmid": ("peaking", 500.0, 1.0),
+    "mid": ("peaking", 1500.0, 1.0),
+    "highmid": ("peaking", 4000.0, 1.0),
+    "treble": ("highshelf", 9000.0, 0.707),
+}
+
+_BAND_SETTING = re.compile(r"^([a-z]+)\s*([+-]\d+(?:\.\d+)?)$")
+
+
+def biquad(kind: str, freq: float, q: float, gain_db: float, rate: int = SAMPLE_RATE):
+    """Return one second-order section [b0, b1, b2, 1, a1, a2] from the RBJ audio EQ cookbook."""
+    a = 10 ** (gain_db / 40)
+    w0 = 2 * np.pi * freq / rate
+    cos_w0 = np.cos(w0)
+    alpha = np.sin(w0) / (2 * q)
+    if kind == "peaking":
+        b = [1 + alpha * a, -2 * cos_w0, 1 - alpha * a]
+        den = [1 + alpha / a, -2 * cos_w0, 1 - alpha / a]
+    elif kind in ("lowshelf", "highshelf"):
+        sign = 1 if kind == "lowshelf" else -1
+        sqrt_a = 2 * np.sqrt(a) * alpha
+        b = [
+            a * ((a + 1) - sign * (a - 1) * cos_w0 + sqrt_a),
+            sign * 2 * a * ((a - 1) - sign * (a + 1) * cos_w0),
+            a * ((a + 1) - sign * (a - 1) * cos_w0 - sqrt_a),
+        ]
+        den = [
+            (a + 1) + sign * (a - 1) * cos_w0 + sqrt_a,
+            -sign * 2 * ((a - 1) + sign * (a + 1) * cos_w0),
+            (a + 1) + sign * (a - 1) * cos_w0 - sqrt_a,
+        ]
+    else:
+        raise ValueError(f"Unknown filter type: {kind}")
+    return [b[0] / den[0], b[1] / den[0], b[2] / den[0], 1.0, den[1] / den[0], den[2] / den[0]]
+
+
+def parse_eq(settings: str) -> dict:
+    """
+    Parse '!eq' arguments such as 'bass+5 treble-3' into {band: dB}.
+    Raises ValueError naming the first token that isn't a known band with a signed gain.
+    """
+    bands = {}
+    for token in settings.lower().split():
+        match = _BAND_SETTING.match(token)
+        if match is None or match.group(1) not in EQ_BANDS:
+            raise ValueError(token)
+        gain = float(match.group(2))
+        bands[match.group(1)] = max(-MAX_BAND_GAIN_DB, min(MAX_BAND_GAIN_DB, gain))
+    return bands
+
+
+class DSPSettings:
+    """Per-guild gain and EQ settings. Sources pick up changes on their next frame."""
+    def __init__(self):
+        self.volume = 1.0
+        self.bands = {}  # band name -> gain in dB
+        self.version = 0
+        self.sos = None
+
+    @property
+    def is_flat(self):
+        return self.volume == 1.0 and self.sos is None
+
+    def set_volume(self, volume: float):
+        self.volume = volume
+        self.version += 1
+
+    def set_bands(self, bands: dict):
+        """Update some bands; a band set to 0 dB is removed from the filter chain."""
+        merged = dict(self.bands)
+        merged.update(bands)
+        self.bands = {name: gain for name, gain in merged.items() if gain != 0}
+        self._rebuild()
+
+    def reset_bands(self):
+        self.bands = {}
+        self._rebuild()
+
+    def _rebuild(self):
+        if self.bands:
+            sections = [biquad(*EQ_BANDS[name][:2], EQ_BANDS[name][2], gain) for name, gain in self.bands.items()]
+            self.sos = np.array(sections, dtype=np.float64)
+        else:
+            self.sos = None
+        self.version += 1
+
+    def describe(self):
+        if not self.bands:
+            return "flat"
+        return " ".join(f"{name}{gain:+g}" for name, gain in self.bands.items())
+
+
+class DSPSource(discord.AudioSource):
+    """
+    Applies gain and the EQ filter chain to 16-bit stereo PCM frames from a wrapped source.
+    Each 20 ms frame is processed as a whole with NumPy/SciPy, with filter state carried
+    between frames so the EQ stays continuous. `gain` is a fixed per-track factor on top of
+    the guild volume, such as a precomputed loudness normalization.
+    """
+    def __init__(self, source, settings: DSPSettings, gain: float = 1.0):
+        self.source = source
+        self.settings = settings
+        self.gain = gain
+        self._version = None
+        self._sos = None
+        self._zi = None
+
+    def _sync(self):
+        settings = self.settings
+        self._version = settings.version
+        if settings.sos is not self._sos:
+            self._sos = settings.sos
+            self._zi = None if self._sos is None else np.zeros((len(self._sos), 2, CHANNELS))
+
+    def process(self, frame: bytes) -> bytes:
+        if self._version != self.settings.version:
+            self._sync()
+        volume = self.settings.volume * self.gain
+        if self._sos is None and volume == 1.0:
+            return frame
+        usable = len(frame) - len(frame) % (2 * CHANNELS)
+        samples = np.frombuffer(frame, dtype=np.int16, count=usable // 2).reshape(-1, CHANNELS).astype(np.float64)
+        if self._sos is not None:
+            samples, self._zi = sosfilt(self._sos, samples, axis=0, zi=self._zi)
+        samples *= volume
+        np.clip(samples, -32768, 32767, out=samples)
+        return samples.astype(np.int16).tobytes()
+
+    def read(self):
+        frame = self.source.read()
+        if not frame:
+            return frame
+        return self.process(frame)
+
+    def is_opus(self):
+        return False
+
+    def cleanup(self):
+        self.source.cleanup()
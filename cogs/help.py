@@ -23,6 +23,7 @@ class HelpCog(commands.Cog):
           !help             - Displays general help.
           !help ai          - Displays help for AI conversation commands.
           !help music       - Displays help for music commands.
+          !help filter      - Displays help for the profanity filter commands.
           !help repo        - Displays help for the repository command.
         """
         if topic is None:
@@ -30,12 +31,13 @@ class HelpCog(commands.Cog):
                 title="Bot General Help",
                 description=(
                     "Use `!help <topic>` for detailed information on a specific topic.\n"
-                    "Available topics: `ai`, `music`, `repo`."
+                    "Available topics: `ai`, `music`, `filter`, `repo`."
                 ),
                 color=discord.Color.blue()
             )
             embed.add_field(name="AI Commands", value="Use `!help ai` for details on chatting with the AI.", inline=False)
             embed.add_field(name="Music Commands", value="Use `!help music` for details on playing music.", inline=False)
+            embed.add_field(name="Profanity Filter", value="Use `!help filter` for managing this server's word filter.", inline=False)
             embed.add_field(name="Repository", value="Use `!help repo` for info on the repo command.", inline=False)
             embed.set_footer(text="For more info, ask the owner!")
             await ctx.send(embed=embed)
@@ -50,6 +52,8 @@ class HelpCog(commands.Cog):
                         "Example: `!chat How's it going, you crazy bastard?`\n\n"
                         "**!setmeme <context>**: Change the AI's personality context.\n"
                         "Example: `!setmeme I want you to be extra unhinged and real.`\n\n"
+                        "**!analyzeimage [question]** or **!img**: Show the AI an attached image (if the model supports images).\n"
+                        "Example: `!img Is this cat plotting something?` with a picture attached.\n\n"
                         "You can also mention the bot (e.g. `@Duck jammie Tell me something wild!`) to start a conversation."
                     ),
                     color=discord.Color.green()
@@ -62,11 +66,15 @@ class HelpCog(commands.Cog):
                     title="Music Commands Help",
                     description=(
                         "**!join**: Make the bot join your voice channel.\n"
-                        "**!play <query>**: Play a song from Spotify. Example: `!play Never Gonna Give You Up`.\n"
+                        "**!play <query>**: Play a song from the local music library or Spotify. Example: `!play Never Gonna Give You Up`.\n"
+                        "**!play <playlist/album URL>**: Queue every track in a Spotify playlist or album.\n"
                         "**!pause** / **!resume**: Pause or resume the current track.\n"
                         "**!skip**: Skip the current track.\n"
-                        "**!queue**: Show the current song queue.\n"
+                        "**!queue [page]**: Show the current song queue.\n"
+                        "**!remove <position>** / **!move <from> <to>**: Edit the song queue.\n"
                         "**!shuffle**: Shuffle the song queue.\n"
+                        "**!volume <0-100>**: Set the playback volume.\n"
+                        "**!eq <band+dB ...>**: Adjust the equalizer, e.g. `!eq bass+5 treble-3` or `!eq reset`.\n"
                         "**!nowplaying**: Display the currently playing track."
                     ),
                     color=discord.Color.purple()
@@ -74,6 +82,21 @@ class HelpCog(commands.Cog):
                 embed.set_footer(text="Rock on!")
                 await ctx.send(embed=embed)
                 logger.info("Music help command invoked by %s", ctx.author)
+            elif topic == "filter":
+                embed = discord.Embed(
+                    title="Profanity Filter Help",
+                    description=(
+                        "Requires the **Manage Server** permission.\n"
+                        "**!filter**: Show this server's filter.\n"
+                        "**!filter add <words>** / **!filter remove <words>**: Block or unblock words.\n"
+                        "**!filter allow <words>** / **!filter unallow <words>**: Never censor these words, e.g. `!filter allow scunthorpe`.\n"
+                        "**!filter reset**: Go back to the default word list."
+                    ),
+                    color=discord.Color.red()
+                )
+                embed.set_footer(text="Leetspeak and accented letters are caught too.")
+                await ctx.send(embed=embed)
+                logger.info("Filter help command invoked by %s", ctx.author)
             elif topic == "repo":
                 embed = discord.Embed(
                     title="Repository Help",
@@ -87,7 +110,7 @@ class HelpCog(commands.Cog):
                 await ctx.send(embed=embed)
                 logger.info("Repo help command invoked by %s", ctx.author)
             else:
-                await ctx.send("Sorry, I don't have help information for that topic. Try `ai`, `music`, or `repo`.")
+                await ctx.send("Sorry, I don't have help information for that topic. Try `ai`, `music`, `filter`, or `repo`.")
                 logger.info("Help command invoked with unknown topic '%s' by %s", topic, ctx.author)
 
     @commands.command(name="repo")
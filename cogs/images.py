@@ -0,0 +1,115 @@
+import asyncio
+import base64
+import hashlib
+import io
+import os
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image, ImageOps
+from cogs.utils import TTLCache
+from cogs.response_cache import normalize_prompt
+
+logger = logging.getLogger(__name__)
+
+# Attachments larger than this are refused before they are downloaded.
+try:
+    IMAGE_MAX_BYTES = int(os.getenv("IMAGE_MAX_BYTES", str(8 * 1024 * 1024)))
+except ValueError:
+    IMAGE_MAX_BYTES = 8 * 1024 * 1024
+# Longest side, in pixels, of the image handed to the model. Vision models resize to well
+# under this anyway, so sending more only costs upload and encode time.
+try:
+    IMAGE_MAX_DIMENSION = int(os.getenv("IMAGE_MAX_DIMENSION", "1024"))
+except ValueError:
+    IMAGE_MAX_DIMENSION = 1024
+try:
+    IMAGE_WORKERS = int(os.getenv("IMAGE_WORKERS", "2"))
+except ValueError:
+    IMAGE_WORKERS = 2
+try:
+    IMAGE_CACHE_SIZE = int(os.getenv("IMAGE_CACHE_SIZE", "512"))
+except ValueError:
+    IMAGE_CACHE_SIZE = 512
+try:
+    IMAGE_CACHE_TTL = float(os.getenv("IMAGE_CACHE_TTL", "86400"))
+except ValueError:
+    IMAGE_CACHE_TTL = 86400.0
+JPEG_QUALITY = 85
+# Decoded size limit; anything bigger is treated as a decompression bomb.
+MAX_PIXELS = 64 * 1024 * 1024
+
+
+class ImageRejected(Exception):
+    """Raised when an attachment can't be turned into a model input."""
+
+
+def content_hash(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def prepare_image(data: bytes, max_dimension=IMAGE_MAX_DIMENSION) -> str:
+    """
+    Decode an image, apply its EXIF orientation, shrink it to fit max_dimension and
+    re-encode it as base64 JPEG. Blocking; run it in a worker.
+    """
+    try:
+        image = Image.open(io.BytesIO(data))
+        if image.width * image.height > MAX_PIXELS:
+            raise ImageRejected(f"image is {image.width}x{image.height}")
+        # Lets the JPEG decoder scale down by a power of two while decoding, which is much cheaper.
+        image.draft("RGB", (max_dimension, max_dimension))
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((max_dimension, max_dimension))
+        if image.mode != "RGB":
+            background = Image.new("RGB", image.size, (255, 255, 255))
+            image = image.convert("RGBA")
+            background.paste(image, mask=image.getchannel("A"))
+            image = background
+        out = io.BytesIO()
+        image.save(out, format="JPEG", quality=JPEG_QUALITY)
+    except ImageRejected:
+        raise
+    except (OSError, ValueError, Image.DecompressionBombError) as e:
+        raise ImageRejected(str(e)) from e
+    return base64.b64encode(out.getvalue()).decode("ascii")
+
+
+class ImagePipeline:
+    """
+    Prepares attachments for a vision model in a small worker pool and remembers the
+    analysis of each distinct image by content hash.
+    """
+    def __init__(self, max_bytes=IMAGE_MAX_BYTES, max_dimension=IMAGE_MAX_DIMENSION, workers=IMAGE_WORKERS):
+        self.max_bytes = max_bytes
+        self.max_dimension = max_dimension
+        # Pillow releases the GIL while decoding, resizing and encoding, so threads are enough.
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="image")
+        self.results = TTLCache(maxsize=IMAGE_CACHE_SIZE, ttl=IMAGE_CACHE_TTL)
+
+    def too_large(self, attachment) -> bool:
+        return attachment.size > self.max_bytes
+
+    async def prepare(self, data: bytes) -> str:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, prepare_image, data, self.max_dimension)
+
+    def result_key(self, model: str, system_prompt: str, digest: str, prompt: str) -> str:
+        """Analyses are shared by every channel with the same persona asking the same question about the same bytes."""
+        key = hashlib.sha256()
+        for part in (model, system_prompt, digest, normalize_prompt(prompt)):
+            key.update(part.encode("utf-8"))
+            key.update(b"\0")
+        return key.hexdigest()
+
+    def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self):
+        return self.results.stats()
+
+
+def probe_image() -> str:
+    """A small solid red JPEG, base64 encoded, for checking whether a model can see images."""
+    out = io.BytesIO()
+    Image.new("RGB", (64, 64), (220, 20, 20)).save(out, format="JPEG", quality=JPEG_QUALITY)
+    return base64.b64encode(out.getvalue()).decode("ascii")
@@ -0,0 +1,414 @@
+import asyncio
+import difflib
+import multiprocessing
+import os
+import re
+import sqlite3
+import time
+import logging
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from cogs.loudness import ANALYSIS_BATCH, LOUDNESS_NORMALIZATION, LOUDNESS_WORKERS, analyze_batch, normalization_gain
+
+logger = logging.getLogger(__name__)
+
+# Directories with local music, separated like PATH (":" on Linux); empty disables the library.
+MUSIC_LIBRARY_DIRS = [path for path in os.getenv("MUSIC_LIBRARY_DIRS", "").split(os.pathsep) if path]
+LIBRARY_DB = os.getenv("LIBRARY_DB", "cache/library.db")
+# Processes reading tags during a scan.
+try:
+    LIBRARY_WORKERS = int(os.getenv("LIBRARY_WORKERS", "4"))
+except ValueError:
+    LIBRARY_WORKERS = 4
+AUDIO_EXTENSIONS = {".mp3", ".flac", ".ogg", ".opus", ".m4a", ".aac", ".wav", ".wma", ".aiff", ".alac", ".ape", ".mka"}
+# Files handed to a tag-reading process at a time, and rows written per transaction.
+SCAN_BATCH = 256
+# Candidates re-ranked by similarity when no result matches every word of a query.
+FUZZY_CANDIDATES = 50
+# A candidate must contain more than this share of the query's words, as prefixes or close spellings,
+# so a query that only shares a word like "now" with a local file falls through to Spotify instead.
+FUZZY_COVERAGE = 0.5
+# Minimum similarity (0-1) for a misspelt word to be replaced by a word from the index.
+TERM_CUTOFF = 0.75
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    id INTEGER PRIMARY KEY,
+    path TEXT UNIQUE NOT NULL,
+    mtime REAL NOT NULL,
+    size INTEGER NOT NULL,
+    title TEXT NOT NULL,
+    artist TEXT NOT NULL,
+    album TEXT NOT NULL,
+    duration REAL,
+    loudness REAL,
+    peak REAL,
+    analyzed INTEGER NOT NULL DEFAULT 0
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS files_fts USING fts5(
+    title, artist, album, content='files', content_rowid='id',
+    tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS files_vocab USING fts5vocab(files_fts, 'row');
+CREATE TRIGGER IF NOT EXISTS files_ai AFTER INSERT ON files BEGIN
+    INSERT INTO files_fts(rowid, title, artist, album) VALUES (new.id, new.title, new.artist, new.album);
+END;
+CREATE TRIGGER IF NOT EXISTS files_ad AFTER DELETE ON files BEGIN
+    INSERT INTO files_fts(files_fts, rowid, title, artist, album) VALUES ('delete', old.id, old.title, old.artist, old.album);
+END;
+CREATE TRIGGER IF NOT EXISTS files_au AFTER UPDATE OF title, artist, album ON files BEGIN
+    INSERT INTO files_fts(files_fts, rowid, title, artist, album) VALUES ('delete', old.id, old.title, old.artist, old.album);
+    INSERT INTO files_fts(rowid, title, artist, album) VALUES (new.id, new.title, new.artist, new.album);
+END;
+"""
+
+_WORD = re.compile(r"\w+")
+# "01 ", "01. ", "1-02 - " and similar track number prefixes in file names.
+_TRACK_NUMBER = re.compile(r"^\d{1,3}(?:[-.]\d{1,3})?[\s.\-_]+")
+
+
+def words(text: str):
+    return _WORD.findall(text.lower())
+
+
+def tags_from_name(path: str):
+    """Title and artist guessed from a file name like '01 - Artist - Title.mp3'."""
+    stem = _TRACK_NUMBER.sub("", os.path.splitext(os.path.basename(path))[0]).strip()
+    artist, sep, title = stem.partition(" - ")
+    if not sep:
+        return stem or os.path.basename(path), ""
+    return title.strip(), artist.strip()
+
+
+def read_tags(paths):
+    """
+    Return (path, title, artist, album, duration) for each file. Runs in a worker process.
+    Uses mutagen when it's installed and the file has tags, otherwise the file and folder names.
+    """
+    try:
+        import mutagen
+    except ImportError:
+        mutagen = None
+    results = []
+    for path in paths:
+        title = artist = album = ""
+        duration = None
+        if mutagen is not None:
+            try:
+                audio = mutagen.File(path, easy=True)
+                if audio is not None:
+                    tags = audio.tags or {}
+                    title = (tags.get("title") or [""])[0]
+                    artist = (tags.get("artist") or tags.get("albumartist") or [""])[0]
+                    album = (tags.get("album") or [""])[0]
+                    duration = getattr(audio.info, "length", None)
+            except Exception as e:
+                logger.debug(f"Could not read tags from {path}: {e}")
+        if not title:
+            title, guessed_artist = tags_from_name(path)
+            artist = artist or guessed_artist
+        if not album:
+            album = os.path.basename(os.path.dirname(path))
+        results.append((path, title, artist, album, duration))
+    return results
+
+
+def walk(directory):
+    """Yield (path, mtime, size) for every audio file under a directory."""
+    stack = [directory]
+    while stack:
+        current = stack.pop()
+        try:
+            with os.scandir(current) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            stack.append(entry.path)
+                        elif os.path.splitext(entry.name)[1].lower() in AUDIO_EXTENSIONS:
+                            stat = entry.stat()
+                            yield entry.path, stat.st_mtime, stat.st_size
+                    except OSError as e:
+                        logger.debug(f"Skipping {entry.path}: {e}")
+        except OSError as e:
+            logger.warning(f"Could not read library directory {current}: {e}")
+
+
+def _match_expression(terms, operator="AND"):
+    # Every word is quoted, so nothing in a query is read as FTS5 syntax, and matched as a prefix.
+    return f" {operator} ".join(f'"{term}"*' for term in terms)
+
+
+class MusicLibrary:
+    """
+    Index of local audio files for !play, kept in SQLite with an FTS5 full-text index.
+    Scans only re-read tags for files that are new or whose mtime or size changed, reading them
+    in a process pool and writing in batches, so a rescan of an unchanged library is a directory
+    walk. Searches run on their own thread and connection and see each batch as it is committed.
+    After a scan, files without a loudness measurement are analyzed in a second process pool, and
+    tracks returned by searches carry the normalization gain to play them at.
+    """
+    def __init__(self, directories=MUSIC_LIBRARY_DIRS, path=LIBRARY_DB, workers=LIBRARY_WORKERS):
+        self.directories = list(directories)
+        self.path = path
+        self.workers = workers
+        # sqlite3 connections belong to the thread that made them; searches all run on this one.
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="library-search")
+        self._conn = None
+        self._scan_task = None
+        self._analysis_task = None
+        self._stopping = False
+        self.last_scan = None
+        self.last_analysis = None
+
+    @property
+    def enabled(self):
+        return bool(self.directories) and bool(self.path)
+
+    @property
+    def scanning(self):
+        return self._scan_task is not None and not self._scan_task.done()
+
+    @property
+    def analyzing(self):
+        return self._analysis_task is not None and not self._analysis_task.done()
+
+    def _connect(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(SCHEMA)
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(files)")}
+        if "analyzed" not in columns:
+            # Indexes from before loudness analysis: add its columns, and stop loudness updates re-indexing text.
+            with conn:
+                conn.execute("ALTER TABLE files ADD COLUMN loudness REAL")
+                conn.execute("ALTER TABLE files ADD COLUMN peak REAL")
+                conn.execute("ALTER TABLE files ADD COLUMN analyzed INTEGER NOT NULL DEFAULT 0")
+                conn.execute("DROP TRIGGER files_au")
+            conn.executescript(SCHEMA)
+        return conn
+
+    def _db(self):
+        if self._conn is None:
+            self._conn = self._connect()
+        return self._conn
+
+    async def _run(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    def scan(self):
+        """
+        Start a scan in the background unless one is already running; returns its task.
+        Loudness analysis of new and changed files follows once the scan is done.
+        """
+        if not self.scanning:
+            self._scan_task = asyncio.create_task(self._scan_then_analyze())
+            self._scan_task.add_done_callback(self._task_done)
+        return self._scan_task
+
+    async def _scan_then_analyze(self):
+        result = await asyncio.to_thread(self._scan)
+        if LOUDNESS_NORMALIZATION and not self._stopping:
+            self.analyze()
+        return result
+
+    def analyze(self):
+        """Measure loudness of every file not yet analyzed, in the background; returns the task."""
+        if not self.analyzing:
+            self._analysis_task = asyncio.create_task(asyncio.to_thread(self._analyze))
+            self._analysis_task.add_done_callback(self._task_done)
+        return self._analysis_task
+
+    @staticmethod
+    def _task_done(task):
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f"Library background task failed: {task.exception()!r}")
+
+    def _scan(self):
+        started = time.perf_counter()
+        conn = self._connect()
+        try:
+            known = {path: (mtime, size) for path, mtime, size in conn.execute("SELECT path, mtime, size FROM files")}
+            changed = []  # (path, mtime, size)
+            seen = set()
+            for directory in self.directories:
+                for path, mtime, size in walk(directory):
+                    seen.add(path)
+                    if known.get(path) != (mtime, size):
+                        changed.append((path, mtime, size))
+            removed = [path for path in known if path not in seen]
+            with conn:
+                conn.executemany("DELETE FROM files WHERE path = ?", ((path,) for path in removed))
+            indexed = self._index(conn, changed)
+        finally:
+            conn.close()
+        self.last_scan = {
+            "files": len(seen),
+            "indexed": indexed,
+            "removed": len(removed),
+            "seconds": time.perf_counter() - started,
+        }
+        logger.info(f"Library scan: {len(seen)} files, {indexed} indexed, {len(removed)} removed "
+                    f"in {self.last_scan['seconds']:.1f}s.")
+        return self.last_scan
+
+    def _index(self, conn, changed):
+        stats = {path: (mtime, size) for path, mtime, size in changed}
+        batches = [[path for path, _, _ in changed[i:i + SCAN_BATCH]] for i in range(0, len(changed), SCAN_BATCH)]
+        if not batches:
+            return 0
+        indexed = 0
+        try:
+            import mutagen  # noqa: F401
+            # Tag parsing is CPU-bound Python, so it gets processes rather than threads.
+            pool = ProcessPoolExecutor(max_workers=max(1, self.workers), mp_context=multiprocessing.get_context("spawn"))
+        except ImportError:
+            logger.info("mutagen is not installed; indexing local music by file and folder names.")
+            pool = None
+        try:
+            results = pool.map(read_tags, batches) if pool is not None else map(read_tags, batches)
+            for rows in results:
+                if self._stopping:
+                    break
+                with conn:
+                    conn.executemany(
+                        "INSERT INTO files (path, mtime, size, title, artist, album, duration) VALUES (?, ?, ?, ?, ?, ?, ?) "
+                        "ON CONFLICT(path) DO UPDATE SET mtime = excluded.mtime, size = excluded.size, title = excluded.title, "
+                        "artist = excluded.artist, album = excluded.album, duration = excluded.duration, "
+                        "loudness = NULL, peak = NULL, analyzed = 0",
+                        ((path, *stats[path], title, artist, album, duration) for path, title, artist, album, duration in rows)
+                    )
+                indexed += len(rows)
+        finally:
+            if pool is not None:
+                pool.shutdown(cancel_futures=True)
+        return indexed
+
+    def _analyze(self):
+        started = time.perf_counter()
+        conn = self._connect()
+        analyzed = failed = 0
+        try:
+            pending = dict(conn.execute("SELECT path, mtime FROM files WHERE analyzed = 0"))
+            paths = list(pending)
+            batches = [paths[i:i + ANALYSIS_BATCH] for i in range(0, len(paths), ANALYSIS_BATCH)]
+            if not batches:
+                return None
+            logger.info(f"Measuring loudness of {len(paths)} library files.")
+            pool = ProcessPoolExecutor(max_workers=max(1, LOUDNESS_WORKERS), mp_context=multiprocessing.get_context("spawn"))
+            try:
+                for rows in pool.map(analyze_batch, batches):
+                    if self._stopping:
+                        break
+                    with conn:
+                        # The mtime check skips files that changed while they were being measured.
+                        conn.executemany(
+                            "UPDATE files SET loudness = ?, peak = ?, analyzed = 1 WHERE path = ? AND mtime = ?",
+                            ((loudness, peak, path, pending[path]) for path, loudness, peak in rows)
+                        )
+                    analyzed += len(rows)
+                    failed += sum(1 for _, loudness, _ in rows if loudness is None)
+            finally:
+                pool.shutdown(cancel_futures=True)
+        finally:
+            conn.close()
+        seconds = time.perf_counter() - started
+        self.last_analysis = {"analyzed": analyzed, "failed": failed, "seconds": seconds}
+        logger.info(f"Loudness analysis: {analyzed} files ({failed} unreadable or silent) in {seconds:.1f}s.")
+        return self.last_analysis
+
+    def _match(self, expression, limit):
+        return self._db().execute(
+            "SELECT f.id, f.path, f.mtime, f.title, f.artist, f.duration, f.loudness, f.peak FROM files_fts "
+            "JOIN files f ON f.id = files_fts.rowid WHERE files_fts MATCH ? "
+            "ORDER BY bm25(files_fts, 10.0, 5.0, 1.0) LIMIT ?",
+            (expression, limit)
+        ).fetchall()
+
+    def _closest_term(self, term):
+        """The indexed word most like a misspelt one, among words with the same first letter and a similar length."""
+        if len(term) < 3:
+            return None
+        candidates = [row[0] for row in self._db().execute(
+            "SELECT term FROM files_vocab WHERE term >= ? AND term < ? AND length(term) BETWEEN ? AND ?",
+            (term[0], chr(ord(term[0]) + 1), len(term) - 1, len(term) + 1)
+        )]
+        close = difflib.get_close_matches(term, candidates, n=1, cutoff=TERM_CUTOFF)
+        return close[0] if close else None
+
+    def _search(self, query, limit):
+        terms = words(query)
+        if not terms:
+            return []
+        rows = self._match(_match_expression(terms), limit)
+        if not rows:
+            corrected = [self._closest_term(term) or term for term in terms]
+            if corrected != terms:
+                rows = self._match(_match_expression(corrected), limit)
+        if not rows:
+            # Nothing has every word: rank files matching most of them by how alike the whole strings are.
+            text = " ".join(terms)
+            scored = []
+            for row in self._match(_match_expression(terms, "OR"), FUZZY_CANDIDATES):
+                row_words = words(f"{row[4]} {row[3]}")
+                found = sum(1 for term in terms if any(word.startswith(term) for word in row_words)
+                            or difflib.get_close_matches(term, row_words, n=1, cutoff=TERM_CUTOFF))
+                if found / len(terms) > FUZZY_COVERAGE:
+                    scored.append((difflib.SequenceMatcher(None, text, " ".join(row_words)).ratio(), row))
+            rows = [row for _, row in sorted(scored, key=lambda item: -item[0])[:limit]]
+        return rows
+
+    async def search(self, query: str, limit=10):
+        """Return up to `limit` tracks best matching a query, in the player's track format."""
+        if not self.enabled:
+            return []
+        try:
+            rows = await self._run(self._search, query, limit)
+        except sqlite3.Error as e:
+            logger.error(f"Library search for {query!r} failed: {e}")
+            return []
+        return [self._track(row) for row in rows]
+
+    async def find(self, query: str):
+        """The best match for a query, or None."""
+        tracks = await self.search(query, limit=1)
+        return tracks[0] if tracks else None
+
+    @staticmethod
+    def _track(row):
+        file_id, path, mtime, title, artist, duration, loudness, peak = row
+        track = {
+            # Includes the mtime so an edited file gets a fresh Opus cache entry.
+            'id': f"local:{file_id}:{int(mtime)}",
+            'title': f"{title} - {artist}" if artist else title,
+            'url': path,
+            'duration_ms': int(duration * 1000) if duration else None,
+        }
+        if LOUDNESS_NORMALIZATION and loudness is not None:
+            track['gain_db'] = round(normalization_gain(loudness, peak), 1)
+        return track
+
+    def _count(self):
+        return self._db().execute("SELECT COUNT(*) FROM files").fetchone()[0]
+
+    async def count(self):
+        return await self._run(self._count) if self.enabled else 0
+
+    def _close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    async def close(self):
+        """Stop a running scan or analysis after its current batch and close the database."""
+        self._stopping = True
+        for task in (self._scan_task, self._analysis_task):
+            if task is not None and not task.done():
+                try:
+                    await task
+                except Exception as e:
+                    logger.warning(f"Library background task failed during shutdown: {e}")
+        await self._run(self._close)
+        self._executor.shutdown(wait=True)
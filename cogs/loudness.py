@@ -0,0 +1,175 @@
+import os
+import subprocess
+import wave
+import logging
+import numpy as np
+from scipy.signal import sosfilt
+
+logger = logging.getLogger(__name__)
+
+# Normalize local library tracks to LOUDNESS_TARGET using gains measured ahead of time.
+LOUDNESS_NORMALIZATION = os.getenv("LOUDNESS_NORMALIZATION", "true").lower() in ("true", "1", "yes")
+# Target integrated loudness in LUFS; -18 is the ReplayGain 2.0 reference level.
+try:
+    LOUDNESS_TARGET = float(os.getenv("LOUDNESS_TARGET", "-18"))
+except ValueError:
+    LOUDNESS_TARGET = -18.0
+# Processes measuring loudness in the background; defaults to half the cores so playback keeps the rest.
+try:
+    LOUDNESS_WORKERS = int(os.getenv("LOUDNESS_WORKERS", str(max(1, (os.cpu_count() or 2) // 2))))
+except ValueError:
+    LOUDNESS_WORKERS = max(1, (os.cpu_count() or 2) // 2)
+# Tracks handed to an analysis process at a time.
+ANALYSIS_BATCH = 8
+# Largest boost applied to a quiet track, in dB.
+MAX_GAIN_DB = 12.0
+# Seconds of audio decoded and measured per step, which bounds memory per track.
+CHUNK_SECONDS = 1
+DECODE_RATE = 48000
+
+# BS.1770 K-weighting: a ~+4 dB high shelf modelling the head, then a ~38 Hz high-pass.
+_SHELF = (1681.974450955533, 0.7071752369554196, 3.999843853973347)
+_HIGHPASS = (38.13547087602444, 0.5003270373238773)
+# Gating block of 400 ms, stepped in 100 ms sub-blocks (75% overlap).
+_SUB_BLOCKS = 4
+_ABSOLUTE_GATE = -70.0
+_RELATIVE_GATE = -10.0
+
+
+def k_weighting(rate):
+    """
+    Second-order sections of the BS.1770 K-weighting filter at a sample rate.
+    At 48 kHz these reproduce the coefficients tabulated in the standard.
+    """
+    fc, q, gain_db = _SHELF
+    k = np.tan(np.pi * fc / rate)
+    vh = 10 ** (gain_db / 20)
+    vb = vh ** 0.4996667741545416
+    a0 = 1 + k / q + k * k
+    shelf = [(vh + vb * k / q + k * k) / a0, 2 * (k * k - vh) / a0, (vh - vb * k / q + k * k) / a0,
+             1.0, 2 * (k * k - 1) / a0, (1 - k / q + k * k) / a0]
+    fc, q = _HIGHPASS
+    k = np.tan(np.pi * fc / rate)
+    a0 = 1 + k / q + k * k
+    highpass = [1.0, -2.0, 1.0, 1.0, 2 * (k * k - 1) / a0, (1 - k / q + k * k) / a0]
+    return np.array([shelf, highpass], dtype=np.float64)
+
+
+class LoudnessMeter:
+    """
+    Integrated loudness (LUFS) and sample peak per ITU-R BS.1770-4, fed in chunks of any size.
+    Only one sum of squares per channel per 100 ms is kept, so memory doesn't grow with the
+    track's sample data, and gating is done once at the end.
+    """
+    def __init__(self, rate, channels=2):
+        self.sos = k_weighting(rate)
+        self.step = rate // 10
+        self.channels = channels
+        self._zi = np.zeros((len(self.sos), 2, channels))
+        self._pending = np.zeros((0, channels))
+        self._energies = []
+        self.peak = 0.0
+
+    def feed(self, samples):
+        """Add float samples in [-1, 1], shaped (frames, channels)."""
+        if not len(samples):
+            return
+        self.peak = max(self.peak, float(np.abs(samples).max()))
+        filtered, self._zi = sosfilt(self.sos, samples, axis=0, zi=self._zi)
+        buffered = np.concatenate((self._pending, filtered)) if len(self._pending) else filtered
+        whole = len(buffered) - len(buffered) % self.step
+        if whole:
+            self._energies.append(np.square(buffered[:whole]).reshape(-1, self.step, self.channels).sum(axis=1))
+        self._pending = buffered[whole:]
+
+    def integrated(self):
+        """Gated integrated loudness, or None for silence or audio shorter than one block."""
+        if not self._energies:
+            return None
+        energies = np.concatenate(self._energies)
+        if len(energies) < _SUB_BLOCKS:
+            return None
+        count = len(energies) - _SUB_BLOCKS + 1
+        blocks = sum(energies[i:i + count] for i in range(_SUB_BLOCKS)) / (_SUB_BLOCKS * self.step)
+        power = blocks.sum(axis=1)  # left and right (and mono) channels all weigh 1.0
+        with np.errstate(divide="ignore"):
+            loudness = -0.691 + 10 * np.log10(power)
+        gated = power[loudness > _ABSOLUTE_GATE]
+        if not len(gated):
+            return None
+        threshold = -0.691 + 10 * np.log10(gated.mean()) + _RELATIVE_GATE
+        gated = power[(loudness > _ABSOLUTE_GATE) & (loudness > threshold)]
+        return float(-0.691 + 10 * np.log10(gated.mean()))
+
+
+def _read_wav(path):
+    with wave.open(path, "rb") as wav:
+        if wav.getsampwidth() != 2 or wav.getnchannels() > 2:
+            return None
+        channels, rate = wav.getnchannels(), wav.getframerate()
+        meter = LoudnessMeter(rate)
+        while True:
+            data = wav.readframes(rate * CHUNK_SECONDS)
+            if not data:
+                break
+            samples = np.frombuffer(data, dtype="<i2").reshape(-1, channels) / 32768.0
+            if channels == 1:
+                # Mono counts as the same signal on both speakers, as FFmpeg's upmix would play it.
+                samples = np.repeat(samples, 2, axis=1)
+            meter.feed(samples)
+    return meter
+
+
+def _decode(path):
+    """Decode any format FFmpeg reads into 48 kHz stereo float, measuring it as it streams in."""
+    meter = LoudnessMeter(DECODE_RATE)
+    process = subprocess.Popen(
+        ["ffmpeg", "-nostdin", "-loglevel", "error", "-i", path, "-vn", "-f", "f32le", "-ac", "2", "-ar", str(DECODE_RATE), "-"],
+        stdout=subprocess.PIPE, stderr=subprocess.DEVNULL
+    )
+    chunk = DECODE_RATE * CHUNK_SECONDS * 2 * 4
+    try:
+        while True:
+            data = process.stdout.read(chunk)
+            if not data:
+                break
+            usable = len(data) - len(data) % 8
+            meter.feed(np.frombuffer(data[:usable], dtype="<f4").reshape(-1, 2).astype(np.float64))
+    finally:
+        process.stdout.close()
+        returncode = process.wait()
+    return meter if returncode == 0 else None
+
+
+def analyze(path):
+    """Return (integrated loudness in LUFS, sample peak) for a file, or None if it can't be measured."""
+    try:
+        meter = None
+        if path.lower().endswith(".wav"):
+            meter = _read_wav(path)
+        if meter is None:
+            meter = _decode(path)
+    except (OSError, EOFError, wave.Error) as e:
+        logger.debug(f"Could not analyze {path}: {e}")
+        return None
+    if meter is None:
+        return None
+    loudness = meter.integrated()
+    return (loudness, meter.peak) if loudness is not None else None
+
+
+def analyze_batch(paths):
+    """Return (path, loudness, peak) for each file, with None for both when it failed. Runs in a worker process."""
+    results = []
+    for path in paths:
+        measured = analyze(path)
+        results.append((path, *(measured or (None, None))))
+    return results
+
+
+def normalization_gain(loudness, peak, target=LOUDNESS_TARGET):
+    """Gain in dB bringing a track to the target, without boosting its peak past full scale."""
+    gain = min(target - loudness, MAX_GAIN_DB)
+    if peak > 0:
+        gain = min(gain, -20 * np.log10(peak))
+    return float(gain)
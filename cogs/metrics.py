@@ -0,0 +1,294 @@
+import asyncio
+import bisect
+import os
+import threading
+import logging
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+# Local port for the Prometheus text endpoint; 0 disables it.
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+try:
+    METRICS_PORT = int(os.getenv("METRICS_PORT", "9464"))
+except ValueError:
+    METRICS_PORT = 9464
+# Seconds between event loop lag samples.
+try:
+    LOOP_LAG_INTERVAL = float(os.getenv("LOOP_LAG_INTERVAL", "0.5"))
+except ValueError:
+    LOOP_LAG_INTERVAL = 0.5
+
+# Latency buckets in seconds, from a fast cache hit up to a slow generation.
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    pairs.extend(f'{name}="{value}"' for name, value in extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value))
+
+
+class Registry:
+    """The set of metrics rendered on a scrape. Nothing is computed until render() is called."""
+    def __init__(self):
+        self._metrics = {}
+
+    def register(self, metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+
+    def unregister(self, metric):
+        if self._metrics.get(metric.name) is metric:
+            del self._metrics[metric.name]
+
+    def render(self) -> str:
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+class _Metric:
+    """
+    Base for labelled metrics. Each label combination gets its own child with its own lock,
+    so recording costs a dict lookup and an uncontended lock, and is safe from audio threads.
+    """
+    type = None
+
+    def __init__(self, name, documentation, labelnames=(), registry=REGISTRY):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+        self._default = None
+        if not self.labelnames:
+            # Unlabelled metrics report zero from the first scrape and skip the label lookup.
+            self._default = self._children[()] = self._new_child()
+        if registry is not None:
+            registry.register(self)
+
+    def labels(self, *values):
+        key = tuple(str(value) for value in values)
+        child = self._children.get(key)
+        if child is None:
+            if len(key) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}")
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+
+    def remove(self, *values):
+        """Drop one label combination, e.g. for a guild the bot has left."""
+        self._children.pop(tuple(str(value) for value in values), None)
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def samples(self):
+        raise NotImplementedError
+
+
+class _CounterChild:
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1.0):
+        with self._lock:
+            self.value += amount
+
+
+class Counter(_Metric):
+    type = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount=1.0):
+        (self._default or self.labels()).inc(amount)
+
+    def samples(self):
+        for values, child in list(self._children.items()):
+            yield f"{self.name}_total{_format_labels(self.labelnames, values)} {_format_value(child.value)}"
+
+
+class _GaugeChild:
+    def __init__(self):
+        self.value = 0.0
+
+    def set(self, value):
+        self.value = value
+
+
+class Gauge(_Metric):
+    type = "gauge"
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def set(self, value):
+        (self._default or self.labels()).set(value)
+
+    def samples(self):
+        for values, child in list(self._children.items()):
+            yield f"{self.name}{_format_labels(self.labelnames, values)} {_format_value(child.value)}"
+
+
+class CallbackGauge(_Metric):
+    """
+    A gauge whose values are read from `callback` at scrape time, so keeping it current costs
+    nothing. The callback returns a number, or for labelled gauges an iterable of (label values, number).
+    """
+    type = "gauge"
+
+    def __init__(self, name, documentation, callback, labelnames=(), registry=REGISTRY):
+        self.callback = callback
+        super().__init__(name, documentation, labelnames, registry)
+
+    def _new_child(self):
+        return None
+
+    def samples(self):
+        try:
+            result = self.callback()
+        except Exception as e:
+            logger.warning("Metric callback for %s failed: %s", self.name, e)
+            return
+        if not self.labelnames:
+            result = [((), result)]
+        for values, value in result:
+            labels = _format_labels(self.labelnames, tuple(str(v) for v in values))
+            yield f"{self.name}{labels} {_format_value(value)}"
+
+
+class _HistogramChild:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS, registry=REGISTRY):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames, registry)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value):
+        (self._default or self.labels()).observe(value)
+
+    def samples(self):
+        for values, child in list(self._children.items()):
+            with child._lock:
+                counts = list(child.counts)
+                total = child.sum
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                labels = _format_labels(self.labelnames, values, extra=(("le", _format_value(bound)),))
+                yield f"{self.name}_bucket{labels} {cumulative}"
+            labels = _format_labels(self.labelnames, values)
+            yield f"{self.name}_sum{labels} {_format_value(total)}"
+            yield f"{self.name}_count{labels} {cumulative}"
+
+
+# Shared metrics recorded from the hot paths. Modules import the ones they need.
+COMMAND_LATENCY = Histogram(
+    "discord_command_duration_seconds", "Time from command invocation to completion.", ["command", "status"])
+INFERENCE_QUEUE_WAIT = Histogram(
+    "ollama_queue_wait_seconds", "Time a generation request waited for a scheduler slot.")
+INFERENCE_REJECTED = Counter(
+    "ollama_queue_rejected", "Generation requests turned away because the queue was full.")
+GENERATION_TIME = Histogram(
+    "ollama_generation_seconds", "Wall time of Ollama chat calls.", ["mode"])
+GENERATION_TOKENS = Counter(
+    "ollama_generated_tokens", "Tokens generated by Ollama.")
+GENERATION_SPEED = Histogram(
+    "ollama_tokens_per_second", "Generation speed reported by Ollama, per request.",
+    buckets=(1, 2, 5, 10, 20, 30, 50, 75, 100, 150, 200, 300))
+OLLAMA_ERRORS = Counter(
+    "ollama_request_errors", "Ollama calls that failed after retries.", ["mode"])
+MENTION_BATCH_SIZE = Histogram(
+    "ai_mention_batch_size", "Mentions answered by each generation.", buckets=(1, 2, 3, 4, 6, 8, 12, 16))
+SPOTIFY_RESOLVE_LATENCY = Histogram(
+    "spotify_resolve_seconds", "Latency of Spotify API calls made by the resolver.", ["call"])
+SPOTIFY_RESOLVER_LOOKUPS = Counter(
+    "spotify_resolver_lookups", "Resolver lookups by outcome (hit, miss, coalesced).", ["result"])
+INTER_TRACK_GAP = Histogram(
+    "music_inter_track_gap_seconds", "Silence between the end of one track and the first frame of the next.",
+    ["prefetched"], buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0))
+VOICE_EVENTS = Counter(
+    "music_voice_events", "Voice lifecycle events: idle and empty-channel disconnects, reconnects, reaped FFmpeg processes.",
+    ["event"])
+LOOP_LAG = Histogram(
+    "event_loop_lag_seconds", "How late the event loop woke a sleeping task.",
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5))
+
+
+async def monitor_loop_lag(interval=LOOP_LAG_INTERVAL):
+    """Sleep for `interval` over and over and record how late each wakeup is."""
+    loop = asyncio.get_running_loop()
+    while True:
+        expected = loop.time() + interval
+        await asyncio.sleep(interval)
+        lag = loop.time() - expected
+        LOOP_LAG.observe(max(0.0, lag))
+        if lag > 1.0:
+            logger.warning("Event loop was blocked for %.2fs.", lag)
+
+
+class MetricsServer:
+    """Serves the registry as Prometheus text on GET /metrics."""
+    def __init__(self, host=METRICS_HOST, port=METRICS_PORT, registry=REGISTRY):
+        self.host = host
+        self.port = port
+        self.registry = registry
+        self._runner = None
+
+    async def _handle(self, request):
+        return web.Response(
+            body=self.registry.render().encode("utf-8"),
+            headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"}
+        )
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_get("/metrics", self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        logger.info("Serving metrics on http://%s:%d/metrics", self.host, self.port)
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
@@ -0,0 +1,128 @@
+from discord.ext import commands
+import asyncio
+import logging
+from cogs.profanity import fold
+from cogs.state_store import StateStore
+from cogs.utils import FILTERS
+
+logger = logging.getLogger(__name__)
+
+
+class Moderation(commands.Cog):
+    """Per-guild profanity filter management for server moderators."""
+    def __init__(self, bot):
+        self.bot = bot
+        # Guild filters are saved so moderators' changes survive restarts.
+        self.state = StateStore()
+        logger.info("Moderation cog initialized.")
+
+    async def cog_load(self):
+        # Every reply is censored with its guild's filter, so all of them are loaded before the bot connects.
+        saved = await self.state.load_all("filters")
+        for (guild_id,), state in saved.items():
+            await asyncio.to_thread(FILTERS.set_guild, guild_id, state["words"], state["allow"])
+        if saved:
+            logger.info("Restored custom profanity filters for %d guilds.", len(saved))
+
+    async def cog_unload(self):
+        await self.state.close()
+
+    async def cog_check(self, ctx):
+        if ctx.guild is None:
+            return False
+        return ctx.author.guild_permissions.manage_guild
+
+    async def cog_command_error(self, ctx, error):
+        if isinstance(error, commands.CheckFailure):
+            if ctx.guild is None:
+                await ctx.send("Filter commands only work in a server.")
+            else:
+                await ctx.send("You need the Manage Server permission to change the filter.")
+        else:
+            # Defining this handler stops discord.py's default one from logging anything for this cog.
+            logger.error("Ignoring exception in command %s", ctx.command, exc_info=error)
+
+    def save_filter(self, guild_id):
+        def snapshot():
+            custom = FILTERS.guild_filter(guild_id)
+            if custom is None:
+                return None
+            return {"words": sorted(custom.words), "allow": sorted(custom.allow)}
+        self.state.mark_dirty("filters", (guild_id,), snapshot)
+
+    async def _update(self, ctx, words=None, allow=None):
+        """Swap in a new filter for the guild; large lists take a while to compile, so do it off the loop."""
+        current = FILTERS.for_guild(ctx.guild.id)
+        await asyncio.to_thread(
+            FILTERS.set_guild,
+            ctx.guild.id,
+            current.words if words is None else words,
+            current.allow if allow is None else allow
+        )
+        self.save_filter(ctx.guild.id)
+
+    @commands.group(name="filter", invoke_without_command=True)
+    async def filter_group(self, ctx):
+        """
+        Shows this server's profanity filter.
+        Subcommands: add, remove, allow, unallow, reset.
+        """
+        current = FILTERS.for_guild(ctx.guild.id)
+        custom = "custom" if current is not FILTERS.default else "default"
+        await ctx.send(f"Filter ({custom}): {len(current.words)} blocked words, {len(current.allow)} allowed words.")
+
+    @filter_group.command(name="add")
+    async def filter_add(self, ctx, *words: str):
+        """Blocks words on this server. Example: !filter add heck darn"""
+        if not words:
+            await ctx.send("Name at least one word, e.g. !filter add heck darn")
+            return
+        current = FILTERS.for_guild(ctx.guild.id)
+        await self._update(ctx, words=current.words | set(words))
+        await ctx.send(f"Blocked {len(words)} word(s).")
+        logger.info("Filter words added in guild %s by %s: %s", ctx.guild.id, ctx.author, words)
+
+    @filter_group.command(name="remove")
+    async def filter_remove(self, ctx, *words: str):
+        """Stops blocking words on this server."""
+        if not words:
+            await ctx.send("Name at least one word, e.g. !filter remove heck")
+            return
+        current = FILTERS.for_guild(ctx.guild.id)
+        await self._update(ctx, words=current.words - {fold(word) for word in words})
+        await ctx.send(f"Unblocked {len(words)} word(s).")
+        logger.info("Filter words removed in guild %s by %s: %s", ctx.guild.id, ctx.author, words)
+
+    @filter_group.command(name="allow")
+    async def filter_allow(self, ctx, *words: str):
+        """Never censors these words, even if they contain a blocked word. Example: !filter allow scunthorpe"""
+        if not words:
+            await ctx.send("Name at least one word, e.g. !filter allow scunthorpe")
+            return
+        current = FILTERS.for_guild(ctx.guild.id)
+        await self._update(ctx, allow=current.allow | set(words))
+        await ctx.send(f"Allowed {len(words)} word(s).")
+        logger.info("Filter allowlist extended in guild %s by %s: %s", ctx.guild.id, ctx.author, words)
+
+    @filter_group.command(name="unallow")
+    async def filter_unallow(self, ctx, *words: str):
+        """Removes words from this server's allowlist."""
+        if not words:
+            await ctx.send("Name at least one word, e.g. !filter unallow scunthorpe")
+            return
+        current = FILTERS.for_guild(ctx.guild.id)
+        await self._update(ctx, allow=current.allow - {fold(word) for word in words})
+        await ctx.send(f"Removed {len(words)} word(s) from the allowlist.")
+        logger.info("Filter allowlist reduced in guild %s by %s: %s", ctx.guild.id, ctx.author, words)
+
+    @filter_group.command(name="reset")
+    async def filter_reset(self, ctx):
+        """Goes back to the bot's default filter."""
+        FILTERS.reset_guild(ctx.guild.id)
+        self.save_filter(ctx.guild.id)
+        await ctx.send("Filter reset to the default word list.")
+        logger.info("Filter reset in guild %s by %s", ctx.guild.id, ctx.author)
+
+
+async def setup(bot):
+    await bot.add_cog(Moderation(bot))
@@ -1,12 +1,16 @@
-import discord
 from discord.ext import commands
-import asyncio
 import os
-import spotipy
-from spotipy.oauth2 import SpotifyClientCredentials
-from discord import FFmpegPCMAudio
+import time
 import logging
 from cogs.utils import censor_text
+from cogs.player import GuildPlayer
+from cogs.dsp import EQ_BANDS, parse_eq
+from cogs.library import MusicLibrary
+from cogs.metrics import REGISTRY, CallbackGauge
+from cogs.opus_cache import OpusCache
+from cogs.resolver import SpotifyResolver, parse_collection
+from cogs.state_store import StateStore
+from cogs.voice import VoiceManager
 
 logger = logging.getLogger(__name__)
 
@@ -14,44 +18,127 @@ logger = logging.getLogger(__name__)
 SPOTIFY_CLIENT_ID = os.getenv("SPOTIFY_CLIENT_ID")
 SPOTIFY_CLIENT_SECRET = os.getenv("SPOTIFY_CLIENT_SECRET")
 
-# Initialize the Spotify client using client credentials flow.
-sp = spotipy.Spotify(auth_manager=SpotifyClientCredentials(
-    client_id=SPOTIFY_CLIENT_ID,
-    client_secret=SPOTIFY_CLIENT_SECRET
-))
+# Minimum seconds between edits of the progress message during playlist/album ingest.
+PROGRESS_EDIT_INTERVAL = 1.5
+
+# Tracks shown per page of !queue.
+QUEUE_PAGE_SIZE = 10
+
+def spotify_client():
+    """Build the Spotify client using client credentials flow. Called on the first lookup, not at import."""
+    import spotipy
+    from spotipy.oauth2 import SpotifyClientCredentials
+    return spotipy.Spotify(auth_manager=SpotifyClientCredentials(
+        client_id=SPOTIFY_CLIENT_ID,
+        client_secret=SPOTIFY_CLIENT_SECRET
+    ))
 
 class Music(commands.Cog):
     """Music playback and queue commands using Spotify and FFmpeg for audio streaming."""
     def __init__(self, bot):
         self.bot = bot
-        self.voice_client = None
-        self.queue = asyncio.Queue()
-        self.play_next_song = asyncio.Event()
-        self.current_track = None
-        self.loop = False
+        # guild_id -> GuildPlayer, created lazily on first join/play.
+        self.players = {}
+        self.resolver = SpotifyResolver(spotify_client)
+        self.opus_cache = OpusCache()
+        # Local files searched before Spotify when MUSIC_LIBRARY_DIRS is set; indexed in the background.
+        self.library = MusicLibrary()
+        # Cluster workers share one index; only the first scans it and measures loudness, the rest just search it.
+        link = getattr(bot, "cluster_link", None)
+        self.indexes_library = link is None or link.worker_id == 0
+        if self.library.enabled and self.indexes_library:
+            self.library.scan()
+        # Queues and playback settings survive restarts; each guild is read back the first time it's used.
+        self.state = StateStore()
+        self._restored = set()
+        # Leaves idle or empty channels, reconnects dropped ones and reaps orphaned FFmpeg processes.
+        self.voice = VoiceManager(self.players, self.release_player)
+        # Read at scrape time only; unregistered on unload.
+        self.metrics = [
+            CallbackGauge("music_queue_depth", "Tracks waiting in each guild's queue.",
+                          lambda: [((guild_id,), len(player.queue)) for guild_id, player in self.players.items()],
+                          labelnames=["guild"]),
+            CallbackGauge("music_players", "Guild players currently held in memory.", lambda: len(self.players)),
+            CallbackGauge("opus_cache_bytes", "Bytes of Opus files in the transcode cache.", lambda: self.opus_cache.total_bytes),
+        ]
         logger.info("Music cog initialized.")
-        # Start the player loop as a background task.
-        self.bot.loop.create_task(self.player_loop())
-
-    async def player_loop(self):
-        logger.info("Player loop started.")
-        while True:
-            self.play_next_song.clear()
-            self.current_track = await self.queue.get()
-            logger.info(f"Track dequeued: {self.current_track['title']}")
-            if self.voice_client is not None:
-                source = FFmpegPCMAudio(self.current_track['url'])
-                self.voice_client.play(source, after=lambda e: self.bot.loop.call_soon_threadsafe(self.play_next_song.set))
-                channel = self.current_track.get('channel')
-                if channel:
-                    await channel.send(f"Now playing: **{self.current_track['title']}**")
-                logger.info(f"Playing track: {self.current_track['title']}")
-                await self.play_next_song.wait()
-                if self.loop:
-                    logger.info("Loop enabled, re-queuing track.")
-                    await self.queue.put(self.current_track)
-            else:
-                logger.warning("Voice client not connected, skipping track.")
+
+    def get_player(self, ctx, create=True):
+        """Return the player for the invoking guild, creating it on demand."""
+        return self.player_for(ctx.guild.id, create)
+
+    def player_for(self, guild_id, create=True):
+        player = self.players.get(guild_id)
+        if player is None and create:
+            player = GuildPlayer(self.bot, guild_id, on_idle=self._player_idle, opus_cache=self.opus_cache,
+                                 on_change=self.save_player)
+            self.players[guild_id] = player
+        return player
+
+    def save_player(self, player):
+        """Queue a write of the player's state; repeated calls before the next flush write once."""
+        self.state.mark_dirty("players", (player.guild_id,), player.snapshot)
+
+    async def restore_player(self, guild_id):
+        """Load a guild's saved queue and settings the first time the guild is used since startup."""
+        if guild_id in self._restored:
+            return
+        self._restored.add(guild_id)
+        # A player released a moment ago may not have been written yet.
+        await self.state.flush()
+        saved = await self.state.load("players", (guild_id,))
+        if saved is None:
+            return
+        state, _ = saved
+        player = self.player_for(guild_id)
+        # Something may have been queued while the saved state was being read; that wins.
+        if player.queue.empty() and player.current_track is None:
+            player.restore(state, self.bot.get_channel)
+            if not player.queue.empty():
+                # The task waits for a voice connection; if nobody joins within the idle timeout it exits and the player is released.
+                player.ensure_running()
+
+    def _player_idle(self, player):
+        """
+        Drop players whose task went idle and that no longer hold a voice connection. Tracks still
+        queued, e.g. paused by a lost connection and never resumed, stay in the state database.
+        """
+        if not player.connected:
+            self.release_player(player)
+
+    def release_player(self, player):
+        """Drop a player from memory; its saved state is read back the next time the guild uses music."""
+        if self.players.get(player.guild_id) is player:
+            del self.players[player.guild_id]
+            self.save_player(player)
+            self._restored.discard(player.guild_id)
+            logger.info(f"Released idle player for guild {player.guild_id}.")
+
+    async def cog_check(self, ctx):
+        return ctx.guild is not None
+
+    async def cog_before_invoke(self, ctx):
+        await self.restore_player(ctx.guild.id)
+
+    async def cog_after_invoke(self, ctx):
+        # Commands edit queues and settings in many ways; saving after each one covers them all.
+        player = self.get_player(ctx, create=False)
+        if player is not None:
+            self.save_player(player)
+
+    async def cog_unload(self):
+        # Save what was playing before teardown clears it, so the next start picks up from here.
+        for player in self.players.values():
+            self.save_player(player)
+        await self.state.close()
+        await self.voice.close()
+        for player in list(self.players.values()):
+            await player.teardown()
+        self.players.clear()
+        await self.library.close()
+        await self.opus_cache.close()
+        for metric in self.metrics:
+            REGISTRY.unregister(metric)
 
     @commands.command(name="join")
     async def join(self, ctx):
@@ -59,8 +146,22 @@ class Music(commands.Cog):
         logger.info(f"Join command invoked by {ctx.author}.")
         if ctx.author.voice:
             channel = ctx.author.voice.channel
-            self.voice_client = await channel.connect()
-            await ctx.send(f"Joined **{channel.name}**.")
+            player = self.get_player(ctx)
+            if player.connected:
+                await player.voice_client.move_to(channel)
+                player.voice_channel = channel
+                await ctx.send(f"Joined **{channel.name}**.")
+            else:
+                if player.voice_client is not None:
+                    # A dropped connection that hasn't been cleaned up yet would block connecting again.
+                    await player.detach()
+                # A queue restored from the last run, or paused by a lost connection, starts again
+                # as soon as there's somewhere to play it.
+                queued = len(player.queue)
+                player.attach(await channel.connect())
+                await ctx.send(f"Joined **{channel.name}**.")
+                if queued:
+                    await ctx.send(f"Resuming the queue ({queued} tracks).")
             logger.info(f"Connected to voice channel: {channel.name}")
         else:
             await ctx.send("You need to be in a voice channel to summon me.")
@@ -70,51 +171,82 @@ class Music(commands.Cog):
     async def leave(self, ctx):
         """Leaves the voice channel."""
         logger.info(f"Leave command invoked by {ctx.author}.")
-        if self.voice_client:
-            await self.voice_client.disconnect()
-            self.voice_client = None
+        player = self.get_player(ctx, create=False)
+        if player and player.voice_client:
+            await player.teardown()
+            self.players.pop(ctx.guild.id, None)
+            self.state.mark_dirty("players", (ctx.guild.id,), lambda: None)
             await ctx.send("Left the voice channel.")
             logger.info("Disconnected from voice channel.")
         else:
             await ctx.send("I'm not in a voice channel.")
             logger.warning("Leave command: not in voice channel.")
 
+    async def find_track(self, query):
+        """Look a query up in the local library first, then on Spotify."""
+        track = await self.library.find(query)
+        if track is not None:
+            logger.info(f"Found {track['title']} in the local library for query: {query}")
+            return track
+        return await self.resolver.resolve(query)
+
     @commands.command(name="play")
     async def play(self, ctx, *, query: str):
         """
-        Play a song from Spotify.
+        Play a song from the local music library or Spotify.
         Example: !play song name or Spotify URL.
-        Note: This uses Spotify search; a real stream URL may require additional integration.
+        A Spotify playlist or album URL queues every track in it.
+        Note: Spotify results only carry a web URL; local library files are streamed directly.
         """
         logger.info(f"Play command invoked by {ctx.author} with query: {query}")
+        collection = parse_collection(query)
+        if collection is not None:
+            await self.ingest_collection(ctx, *collection)
+            return
         try:
-            results = sp.search(q=query, type='track', limit=1)
-            tracks = results.get('tracks', {}).get('items', [])
-            if not tracks:
-                await ctx.send("No track found on Spotify.")
+            track = await self.find_track(query)
+            if track is None:
+                await ctx.send("No track found in the music library or on Spotify.")
                 logger.info("No track found for query: " + query)
                 return
-            track = tracks[0]
-            track_title = f"{track['name']} - {track['artists'][0]['name']}"
-            playable_url = track['external_urls']['spotify']  # Placeholder URL
-            track_info = {
-                'title': censor_text(track_title),
-                'url': playable_url,
-                'channel': ctx.channel
-            }
-            await self.queue.put(track_info)
+            track_info = dict(track, title=censor_text(track['title'], ctx.guild.id), channel=ctx.channel)
+            await self.get_player(ctx).enqueue(track_info)
             await ctx.send(f"Queued: **{track_info['title']}**")
             logger.info("Queued track: " + track_info['title'])
         except Exception as e:
             await ctx.send("An error occurred while retrieving the track.")
             logger.exception("Error in play command: " + str(e))
 
+    async def ingest_collection(self, ctx, kind, collection_id):
+        """Stream a playlist or album into the guild queue page by page, editing one progress message."""
+        player = self.get_player(ctx)
+        progress = await ctx.send(f"Queuing {kind}...")
+        queued = 0
+        last_edit = time.monotonic()
+        try:
+            async for tracks, total in self.resolver.iter_collection(kind, collection_id):
+                await player.enqueue_many(
+                    dict(track, title=censor_text(track['title'], ctx.guild.id), channel=ctx.channel) for track in tracks
+                )
+                queued += len(tracks)
+                now = time.monotonic()
+                if now - last_edit >= PROGRESS_EDIT_INTERVAL:
+                    last_edit = now
+                    await progress.edit(content=f"Queuing {kind}: {queued}/{total} tracks...")
+        except Exception as e:
+            await progress.edit(content=f"Stopped queuing the {kind} after {queued} tracks: an error occurred while retrieving it.")
+            logger.exception(f"Error ingesting {kind} {collection_id}: {e}")
+            return
+        await progress.edit(content=f"Queued **{queued}** tracks from the {kind}.")
+        logger.info(f"Ingested {queued} tracks from {kind} {collection_id}.")
+
     @commands.command(name="pause")
     async def pause(self, ctx):
         """Pauses the current track."""
         logger.info(f"Pause command invoked by {ctx.author}.")
-        if self.voice_client and self.voice_client.is_playing():
-            self.voice_client.pause()
+        player = self.get_player(ctx, create=False)
+        if player and player.voice_client and player.voice_client.is_playing():
+            player.voice_client.pause()
             await ctx.send("Paused the track.")
             logger.info("Track paused.")
         else:
@@ -125,8 +257,9 @@ class Music(commands.Cog):
     async def resume(self, ctx):
         """Resumes the paused track."""
         logger.info(f"Resume command invoked by {ctx.author}.")
-        if self.voice_client and self.voice_client.is_paused():
-            self.voice_client.resume()
+        player = self.get_player(ctx, create=False)
+        if player and player.voice_client and player.voice_client.is_paused():
+            player.voice_client.resume()
             await ctx.send("Resumed the track.")
             logger.info("Track resumed.")
         else:
@@ -137,8 +270,9 @@ class Music(commands.Cog):
     async def skip(self, ctx):
         """Skips the current track."""
         logger.info(f"Skip command invoked by {ctx.author}.")
-        if self.voice_client and self.voice_client.is_playing():
-            self.voice_client.stop()
+        player = self.get_player(ctx, create=False)
+        if player and player.voice_client and player.voice_client.is_playing():
+            player.voice_client.stop()
             await ctx.send("Skipped the track.")
             logger.info("Track skipped.")
         else:
@@ -149,9 +283,11 @@ class Music(commands.Cog):
     async def stop(self, ctx):
         """Stops playback and clears the queue."""
         logger.info(f"Stop command invoked by {ctx.author}.")
-        if self.voice_client:
-            self.queue = asyncio.Queue()
-            self.voice_client.stop()
+        player = self.get_player(ctx, create=False)
+        if player and player.voice_client:
+            player.queue.clear()
+            player.refresh_prefetch()
+            player.voice_client.stop()
             await ctx.send("Stopped playback and cleared the queue.")
             logger.info("Playback stopped and queue cleared.")
         else:
@@ -161,36 +297,76 @@ class Music(commands.Cog):
     @commands.command(name="loop")
     async def loop_command(self, ctx):
         """Toggles looping of the current track."""
-        self.loop = not self.loop
-        status = "enabled" if self.loop else "disabled"
+        player = self.get_player(ctx)
+        player.loop = not player.loop
+        status = "enabled" if player.loop else "disabled"
         await ctx.send(f"Looping is now {status}.")
         logger.info(f"Loop toggled to: {status} by {ctx.author}.")
 
     @commands.command(name="queue")
-    async def show_queue(self, ctx):
-        """Displays the current music queue."""
-        logger.info(f"Queue command invoked by {ctx.author}.")
-        if self.queue.empty():
+    async def show_queue(self, ctx, page: int = 1):
+        """
+        Displays the current music queue.
+        Example: !queue 2 shows the second page.
+        """
+        logger.info(f"Queue command invoked by {ctx.author} for page {page}.")
+        player = self.get_player(ctx, create=False)
+        if player is None or player.queue.empty():
             await ctx.send("The queue is empty.")
             logger.info("Queue is empty.")
         else:
-            queue_list = list(self.queue._queue)
-            message = "Upcoming tracks:\n"
-            for idx, track in enumerate(queue_list, 1):
+            total = len(player.queue)
+            pages = (total + QUEUE_PAGE_SIZE - 1) // QUEUE_PAGE_SIZE
+            page = min(max(page, 1), pages)
+            start = (page - 1) * QUEUE_PAGE_SIZE
+            message = f"Upcoming tracks (page {page}/{pages}, {total} total):\n"
+            for idx, track in enumerate(player.queue.page(page - 1, QUEUE_PAGE_SIZE), start + 1):
                 message += f"{idx}. {track['title']}\n"
             await ctx.send(message)
             logger.info("Displayed music queue.")
 
+    @commands.command(name="remove")
+    async def remove(self, ctx, position: int):
+        """
+        Removes a track from the queue.
+        Example: !remove 3 removes the third upcoming track.
+        """
+        logger.info(f"Remove command invoked by {ctx.author} for position {position}.")
+        player = self.get_player(ctx, create=False)
+        if player is None or not 1 <= position <= len(player.queue):
+            await ctx.send("There's no track at that position.")
+            logger.warning("Remove command: invalid position " + str(position))
+            return
+        track = player.queue.remove(position - 1)
+        player.refresh_prefetch()
+        await ctx.send(f"Removed: **{track['title']}**")
+        logger.info("Removed track: " + track['title'])
+
+    @commands.command(name="move")
+    async def move(self, ctx, src: int, dst: int):
+        """
+        Moves a track to a different position in the queue.
+        Example: !move 5 1 makes the fifth upcoming track play next.
+        """
+        logger.info(f"Move command invoked by {ctx.author} from {src} to {dst}.")
+        player = self.get_player(ctx, create=False)
+        size = len(player.queue) if player else 0
+        if not (1 <= src <= size and 1 <= dst <= size):
+            await ctx.send("There's no track at that position.")
+            logger.warning(f"Move command: invalid positions {src} -> {dst}")
+            return
+        track = player.queue.move(src - 1, dst - 1)
+        player.refresh_prefetch()
+        await ctx.send(f"Moved **{track['title']}** to position {dst}.")
+        logger.info(f"Moved track {track['title']} to position {dst}.")
+
     @commands.command(name="shuffle")
     async def shuffle(self, ctx):
         """Shuffles the current queue."""
         logger.info(f"Shuffle command invoked by {ctx.author}.")
-        import random
-        queue_list = list(self.queue._queue)
-        random.shuffle(queue_list)
-        self.queue = asyncio.Queue()
-        for item in queue_list:
-            await self.queue.put(item)
+        player = self.get_player(ctx)
+        player.queue.shuffle()
+        player.refresh_prefetch()
         await ctx.send("Shuffled the queue.")
         logger.info("Queue shuffled.")
 
@@ -199,11 +375,11 @@ class Music(commands.Cog):
         """
         Sets the volume.
         Example: !volume 50 sets volume to 50%.
-        (Note: Volume control is a placeholder.)
         """
         logger.info(f"Volume command invoked by {ctx.author} with volume {vol}.")
         if 0 <= vol <= 100:
-            await ctx.send(f"Volume set to {vol}% (placeholder).")
+            self.get_player(ctx).dsp.set_volume(vol / 100)
+            await ctx.send(f"Volume set to {vol}%.")
             logger.info("Volume set to " + str(vol))
         else:
             await ctx.send("Volume must be between 0 and 100.")
@@ -213,23 +389,56 @@ class Music(commands.Cog):
     async def now_playing(self, ctx):
         """Displays the currently playing track."""
         logger.info(f"NowPlaying command invoked by {ctx.author}.")
-        if self.current_track:
-            await ctx.send(f"Now playing: **{self.current_track['title']}**")
-            logger.info("Now playing: " + self.current_track['title'])
+        player = self.get_player(ctx, create=False)
+        if player and player.current_track:
+            await ctx.send(f"Now playing: **{player.current_track['title']}**")
+            logger.info("Now playing: " + player.current_track['title'])
         else:
             await ctx.send("No track is playing.")
             logger.info("NowPlaying command: no track playing.")
 
+    @commands.command(name="rescan")
+    @commands.is_owner()
+    async def rescan(self, ctx):
+        """Re-indexes the local music library, reading tags only for new or changed files."""
+        logger.info(f"Rescan command invoked by {ctx.author}.")
+        if not self.library.enabled:
+            await ctx.send("No music library is configured; set MUSIC_LIBRARY_DIRS.")
+            return
+        if not self.indexes_library:
+            await ctx.send("This server is handled by a cluster worker that doesn't index the library; "
+                           "run !rescan in a server on worker 0.")
+            return
+        progress = await ctx.send("Scanning the music library...")
+        try:
+            result = await self.library.scan()
+        except Exception as e:
+            await progress.edit(content="The library scan failed.")
+            logger.exception(f"Library rescan failed: {e}")
+            return
+        await progress.edit(content=f"Library has **{result['files']}** files: {result['indexed']} indexed, "
+                                    f"{result['removed']} removed in {result['seconds']:.1f}s.")
+
     @commands.command(name="eq")
     async def eq(self, ctx, *, settings: str):
         """
         Adjusts the equalizer settings.
-        Example: !eq bass+5 treble-3.
-        (Placeholder for equalizer functionality.)
+        Example: !eq bass+5 treble-3. Use !eq reset to flatten every band.
+        Bands: bass, lowmid, mid, highmid, treble (each -12 to +12 dB).
         """
         logger.info(f"EQ command invoked by {ctx.author} with settings: {settings}")
-        await ctx.send(f"Equalizer settings updated: {settings}")
-        logger.info("EQ settings updated.")
+        dsp = self.get_player(ctx).dsp
+        if settings.strip().lower() in ("reset", "flat"):
+            dsp.reset_bands()
+        else:
+            try:
+                dsp.set_bands(parse_eq(settings))
+            except ValueError as e:
+                await ctx.send(f"Couldn't understand `{e}`. Use bands {', '.join(EQ_BANDS)} like `bass+5 treble-3`.")
+                logger.warning(f"Invalid EQ setting: {e}")
+                return
+        await ctx.send(f"Equalizer settings updated: {dsp.describe()}")
+        logger.info("EQ settings updated: " + dsp.describe())
 
 async def setup(bot):
     await bot.add_cog(Music(bot))
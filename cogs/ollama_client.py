@@ -0,0 +1,186 @@
+import asyncio
+import json
+import os
+import random
+import time
+import logging
+import aiohttp
+from cogs.metrics import GENERATION_SPEED, GENERATION_TIME, GENERATION_TOKENS, OLLAMA_ERRORS
+
+logger = logging.getLogger(__name__)
+
+OLLAMA_API_URL = os.getenv("OLLAMA_API_URL", "http://localhost:11434")
+# Seconds allowed for a whole non-streaming call, and between chunks of a streaming one.
+try:
+    OLLAMA_TIMEOUT = float(os.getenv("OLLAMA_TIMEOUT", "120"))
+except ValueError:
+    OLLAMA_TIMEOUT = 120.0
+# Extra attempts after a connection failure, timeout or 5xx before giving up.
+try:
+    OLLAMA_RETRIES = int(os.getenv("OLLAMA_RETRIES", "2"))
+except ValueError:
+    OLLAMA_RETRIES = 2
+# How long Ollama should keep the model loaded after each request.
+OLLAMA_KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "30m")
+# Maximum pooled connections to the Ollama server.
+OLLAMA_POOL_SIZE = 8
+# Base delay for exponential backoff between retries, in seconds.
+RETRY_BACKOFF = 0.5
+
+
+class OllamaError(Exception):
+    """Raised when the Ollama server can't be reached or returns an error."""
+
+
+class _Retryable(OllamaError):
+    pass
+
+
+def record_generation(mode, started, body):
+    """Record wall time and, from Ollama's final response fields, tokens and tokens per second."""
+    GENERATION_TIME.labels(mode).observe(time.perf_counter() - started)
+    eval_count = body.get("eval_count")
+    eval_duration = body.get("eval_duration")  # nanoseconds
+    if eval_count:
+        GENERATION_TOKENS.inc(eval_count)
+        if eval_duration:
+            GENERATION_SPEED.observe(eval_count / (eval_duration / 1e9))
+
+
+class OllamaClient:
+    """
+    Async client for Ollama's /api/chat endpoint.
+    Keeps a pool of keep-alive HTTP connections, applies per-request timeouts, retries
+    transient failures with exponential backoff and asks the server to keep the model resident.
+    """
+    def __init__(self, base_url=OLLAMA_API_URL, timeout=OLLAMA_TIMEOUT, retries=OLLAMA_RETRIES,
+                 keep_alive=OLLAMA_KEEP_ALIVE, pool_size=OLLAMA_POOL_SIZE):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.retries = retries
+        self.keep_alive = keep_alive
+        self.pool_size = pool_size
+        self._session = None
+
+    def _get_session(self):
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.pool_size, keepalive_timeout=300)
+            self._session = aiohttp.ClientSession(connector=connector)
+        return self._session
+
+    def _payload(self, model, messages, stream, options):
+        payload = {"model": model, "messages": messages, "stream": stream}
+        if self.keep_alive:
+            payload["keep_alive"] = self.keep_alive
+        if options:
+            payload["options"] = options
+        return payload
+
+    async def _with_retries(self, attempt):
+        for retry in range(self.retries + 1):
+            try:
+                return await attempt()
+            except _Retryable as e:
+                if retry == self.retries:
+                    raise OllamaError(str(e)) from e
+                delay = RETRY_BACKOFF * (2 ** retry) * (1 + random.random() * 0.5)
+                logger.warning("Ollama request failed (%s); retrying in %.2fs.", e, delay)
+                await asyncio.sleep(delay)
+
+    async def _post(self, path, payload, timeout):
+        session = self._get_session()
+        try:
+            response = await session.post(self.base_url + path, json=payload, timeout=timeout)
+        except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+            raise _Retryable(f"connection failed: {e!r}") from e
+        if response.status >= 500:
+            body = await response.text()
+            response.release()
+            raise _Retryable(f"HTTP {response.status}: {body[:200]}")
+        if response.status >= 400:
+            body = await response.text()
+            response.release()
+            raise OllamaError(f"HTTP {response.status}: {body[:200]}")
+        return response
+
+    async def chat(self, model, messages, options=None) -> dict:
+        """Run a chat completion and return the decoded response body."""
+        payload = self._payload(model, messages, False, options)
+        started = time.perf_counter()
+
+        async def attempt():
+            timeout = aiohttp.ClientTimeout(total=self.timeout)
+            response = await self._post("/api/chat", payload, timeout)
+            try:
+                return await response.json(content_type=None)
+            except (aiohttp.ClientPayloadError, asyncio.TimeoutError) as e:
+                raise _Retryable(f"response interrupted: {e!r}") from e
+            finally:
+                response.release()
+
+        try:
+            body = await self._with_retries(attempt)
+        except OllamaError:
+            OLLAMA_ERRORS.labels("chat").inc()
+            raise
+        record_generation("chat", started, body)
+        return body
+
+    async def chat_stream(self, model, messages, options=None):
+        """
+        Run a streaming chat completion, yielding content chunks as they arrive.
+        Only the connection is retried; a stream that fails midway raises OllamaError.
+        """
+        payload = self._payload(model, messages, True, options)
+        timeout = aiohttp.ClientTimeout(total=None, sock_connect=self.timeout, sock_read=self.timeout)
+        started = time.perf_counter()
+        try:
+            response = await self._with_retries(lambda: self._post("/api/chat", payload, timeout))
+        except OllamaError:
+            OLLAMA_ERRORS.labels("stream").inc()
+            raise
+        try:
+            async for line in response.content:
+                if not line.strip():
+                    continue
+                part = json.loads(line)
+                if part.get("error"):
+                    OLLAMA_ERRORS.labels("stream").inc()
+                    raise OllamaError(part["error"])
+                content = part.get("message", {}).get("content")
+                if content:
+                    yield content
+                if part.get("done"):
+                    record_generation("stream", started, part)
+                    break
+        except (aiohttp.ClientPayloadError, aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+            OLLAMA_ERRORS.labels("stream").inc()
+            raise OllamaError(f"stream interrupted: {e!r}") from e
+        finally:
+            response.release()
+
+    async def model_digest(self, model) -> str:
+        """
+        Return the digest of a locally installed model from /api/tags, or None if it isn't installed.
+        Cheap compared to a generation, so it's safe to call at startup.
+        """
+        session = self._get_session()
+        timeout = aiohttp.ClientTimeout(total=self.timeout)
+        try:
+            async with session.get(self.base_url + "/api/tags", timeout=timeout) as response:
+                if response.status >= 400:
+                    raise OllamaError(f"HTTP {response.status}: {(await response.text())[:200]}")
+                body = await response.json(content_type=None)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            raise OllamaError(f"connection failed: {e!r}") from e
+        # Ollama reports names with an explicit tag; "qwen" and "qwen:latest" are the same model.
+        name = model if ":" in model else f"{model}:latest"
+        for entry in body.get("models", []):
+            if entry.get("name") == name or entry.get("model") == name:
+                return entry.get("digest")
+        return None
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
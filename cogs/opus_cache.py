@@ -0,0 +1,187 @@
+import asyncio
+import hashlib
+import json
+import os
+import logging
+from collections import OrderedDict
+from cogs.utils import TTLCache
+
+logger = logging.getLogger(__name__)
+
+OPUS_CACHE_DIR = os.getenv("OPUS_CACHE_DIR", "cache/opus")
+# Byte budget for cached Opus files; 0 disables the cache.
+try:
+    OPUS_CACHE_MAX_BYTES = int(os.getenv("OPUS_CACHE_MAX_BYTES", str(2 * 1024 ** 3)))
+except ValueError:
+    OPUS_CACHE_MAX_BYTES = 2 * 1024 ** 3
+OPUS_CACHE_BITRATE = os.getenv("OPUS_CACHE_BITRATE", "128k")
+# Maximum FFmpeg transcodes running in the background at once.
+TRANSCODE_CONCURRENCY = 2
+# Seconds to wait after the last change before the index is written back to disk.
+INDEX_SAVE_DELAY = 5.0
+# Seconds before a source that failed to transcode is tried again.
+FAILED_RETRY_AFTER = 3600.0
+
+
+def source_key(track: dict) -> str:
+    """Content address for a track: a hash of its source identity and any normalization gain baked in."""
+    identity = track.get('id') or track['url']
+    if track.get('gain_db'):
+        identity += f"@{track['gain_db']:+.1f}dB"
+    return hashlib.sha256(identity.encode("utf-8")).hexdigest()
+
+
+class OpusCache:
+    """
+    Content-addressed directory of pre-encoded Ogg/Opus files.
+    Hits can be streamed to Discord without decoding or re-encoding; misses are transcoded
+    in the background. Files are evicted least-recently-used first once the byte budget is
+    exceeded, and the index is persisted so the cache survives restarts.
+    """
+    def __init__(self, directory=OPUS_CACHE_DIR, max_bytes=OPUS_CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.index_path = os.path.join(directory, "index.json")
+        self._entries = OrderedDict()  # key -> size in bytes, least recently used first
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._pending = {}  # key -> transcode task
+        self._failed = TTLCache(maxsize=4096, ttl=FAILED_RETRY_AFTER)
+        self._semaphore = asyncio.Semaphore(TRANSCODE_CONCURRENCY)
+        self._save_handle = None
+        self._load_index()
+
+    @property
+    def enabled(self):
+        return self.max_bytes > 0
+
+    def path_for(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], key + ".ogg")
+
+    def _load_index(self):
+        if not self.enabled:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                entries = json.load(f)
+        except FileNotFoundError:
+            entries = []
+        except (OSError, ValueError) as e:
+            logger.warning(f"Opus cache index unreadable, starting empty: {e}")
+            entries = []
+        for key, size in entries:
+            if os.path.exists(self.path_for(key)):
+                self._entries[key] = size
+                self.total_bytes += size
+        logger.info(f"Opus cache loaded: {len(self._entries)} files, {self.total_bytes} bytes.")
+
+    def _write_index(self, entries):
+        tmp_path = self.index_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(entries, f)
+        os.replace(tmp_path, self.index_path)
+
+    def _schedule_save(self):
+        if self._save_handle is None:
+            self._save_handle = asyncio.get_running_loop().call_later(INDEX_SAVE_DELAY, self._save)
+
+    def _save(self):
+        self._save_handle = None
+        asyncio.create_task(self._save_async(list(self._entries.items())))
+
+    async def _save_async(self, entries):
+        try:
+            await asyncio.to_thread(self._write_index, entries)
+        except OSError as e:
+            logger.warning(f"Failed to write opus cache index: {e}")
+
+    def lookup(self, track: dict):
+        """Return the cached file path for a track, or None on a miss."""
+        if not self.enabled:
+            return None
+        key = source_key(track)
+        if key not in self._entries:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        self._schedule_save()
+        return self.path_for(key)
+
+    def schedule_transcode(self, track: dict):
+        """Start encoding a track into the cache in the background, unless it is cached or already underway."""
+        if not self.enabled:
+            return
+        key = source_key(track)
+        if key in self._entries or key in self._pending or key in self._failed:
+            return
+        task = asyncio.create_task(self._transcode(key, track['url'], track.get('gain_db')))
+        self._pending[key] = task
+        task.add_done_callback(lambda t: self._pending.pop(key, None))
+
+    async def _transcode(self, key, url, gain_db=None):
+        path = self.path_for(key)
+        tmp_path = path + ".part"
+        # Normalization is applied while encoding so cached files can still be passed straight through.
+        filters = ["-af", f"volume={gain_db:.1f}dB"] if gain_db else []
+        async with self._semaphore:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            try:
+                process = await asyncio.create_subprocess_exec(
+                    "ffmpeg", "-nostdin", "-loglevel", "error", "-y", "-i", url, *filters,
+                    "-vn", "-c:a", "libopus", "-b:a", OPUS_CACHE_BITRATE, "-ar", "48000", "-ac", "2",
+                    "-f", "ogg", tmp_path,
+                    stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.PIPE
+                )
+            except OSError as e:
+                self._failed.set(key, True)
+                logger.warning(f"Could not start FFmpeg to transcode {url}: {e}")
+                return
+            try:
+                _, stderr = await process.communicate()
+            except asyncio.CancelledError:
+                process.kill()
+                await process.wait()
+                self._remove(tmp_path)
+                raise
+        if process.returncode != 0:
+            self._failed.set(key, True)
+            self._remove(tmp_path)
+            logger.warning(f"Opus transcode failed for {url}: {stderr.decode(errors='replace').strip()}")
+            return
+        os.replace(tmp_path, path)
+        self._add(key, os.path.getsize(path))
+        logger.info(f"Cached Opus transcode for {url} ({self._entries[key]} bytes).")
+
+    def _add(self, key, size):
+        self._entries[key] = size
+        self.total_bytes += size
+        while self.total_bytes > self.max_bytes and len(self._entries) > 1:
+            old_key, old_size = self._entries.popitem(last=False)
+            self.total_bytes -= old_size
+            self._remove(self.path_for(old_key))
+            logger.info(f"Evicted {old_key} from opus cache ({old_size} bytes).")
+        self._schedule_save()
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    async def close(self):
+        """Cancel running transcodes and flush the index to disk."""
+        for task in list(self._pending.values()):
+            task.cancel()
+        if self._save_handle is not None:
+            self._save_handle.cancel()
+            self._save_handle = None
+        if self.enabled:
+            await asyncio.to_thread(self._write_index, list(self._entries.items()))
+
+    def stats(self):
+        return {"files": len(self._entries), "bytes": self.total_bytes, "hits": self.hits,
+                "misses": self.misses, "pending": len(self._pending)}
@@ -0,0 +1,399 @@
+import asyncio
+import os
+import time
+import logging
+from collections import deque
+from discord import ClientException, FFmpegPCMAudio
+from cogs.audio import OpusPassthroughSource, PrerollSource
+from cogs.dsp import DSPSettings, DSPSource
+from cogs.metrics import INTER_TRACK_GAP
+from cogs.track_queue import TrackQueue
+
+logger = logging.getLogger(__name__)
+
+# Seconds a player may sit with an empty queue before its task shuts down.
+try:
+    PLAYER_IDLE_TIMEOUT = float(os.getenv("PLAYER_IDLE_TIMEOUT", "300"))
+except ValueError:
+    PLAYER_IDLE_TIMEOUT = 300.0
+
+# Number of recent inter-track gap measurements kept per player.
+GAP_SAMPLES = 100
+# Seconds between saves of the playback position while a track plays.
+POSITION_SAVE_INTERVAL = 10.0
+# Seconds an FFmpeg process may go unplayed before it counts as orphaned; covers opening and prefetching.
+DECODER_GRACE = 60.0
+
+
+def _cleanup_prepared(task):
+    """Done-callback that releases a prepared source nobody is going to play."""
+    if not task.cancelled() and task.exception() is None:
+        task.result().cleanup()
+
+
+def _save_track(track):
+    """A JSON-safe copy of a queued track: the channel object is stored by id."""
+    saved = {key: value for key, value in track.items() if key != 'channel'}
+    channel = track.get('channel')
+    saved['channel_id'] = channel.id if channel is not None else None
+    return saved
+
+
+def _load_track(saved, get_channel):
+    track = dict(saved)
+    channel_id = track.pop('channel_id', None)
+    track['channel'] = get_channel(channel_id) if channel_id is not None else None
+    return track
+
+
+class GuildPlayer:
+    """Playback state for a single guild: its queue, voice connection, loop flag and player task."""
+    def __init__(self, bot, guild_id, on_idle=None, opus_cache=None, on_change=None):
+        self.bot = bot
+        self.guild_id = guild_id
+        self.opus_cache = opus_cache
+        self.voice_client = None
+        # The channel last connected to, for reconnecting after a drop.
+        self.voice_channel = None
+        self._voice_ready = asyncio.Event()
+        self.queue = TrackQueue()
+        self.play_next_song = asyncio.Event()
+        self.current_track = None
+        self.loop = False
+        self.dsp = DSPSettings()
+        self._task = None
+        # (track, task) for the next track being decoded ahead of time.
+        self._prefetch = None
+        self._ended_at = None
+        # Recent (gap seconds, prefetched) samples between one track ending and the next starting.
+        self.gaps = deque(maxlen=GAP_SAMPLES)
+        self._current_prefetched = False
+        # The track being opened or played, and its source once it is playing; both None between tracks.
+        self._playing = None
+        self._source = None
+        # Set when playback was stopped by suspend() rather than the track ending.
+        self._suspended = False
+        # PrerollSource -> (its FFmpegPCMAudio, monotonic time opened) for every source backed by an FFmpeg process.
+        self._decoders = {}
+        # Called with this player once its task exits because nothing was queued.
+        self._on_idle = on_idle
+        # Called with this player when the track changes and periodically during playback, so its state can be saved.
+        self._on_change = on_change
+        logger.info(f"Guild player created for guild {guild_id}.")
+
+    @property
+    def is_running(self):
+        return self._task is not None and not self._task.done()
+
+    def ensure_running(self):
+        """Start the player task if it is not already running."""
+        if not self.is_running:
+            self._task = self.bot.loop.create_task(self.player_loop())
+
+    @property
+    def connected(self):
+        return self.voice_client is not None and self.voice_client.is_connected()
+
+    def attach(self, voice_client):
+        """Play through a new voice connection, picking the queue up where it was paused."""
+        self.voice_client = voice_client
+        self.voice_channel = getattr(voice_client, "channel", None)
+        self._voice_ready.set()
+        if not self.queue.empty():
+            self.ensure_running()
+            self.refresh_prefetch()
+
+    def suspend(self):
+        """
+        Stop playback without losing the track: it goes back to the front of the queue and
+        resumes where it stopped once there is a connection to play it on.
+        """
+        if self._playing is not None and self._source is not None:
+            track = self._playing
+            track['resume_at'] = self.position
+            self.queue.put_front(track)
+            self._suspended = True
+            logger.info(f"[{self.guild_id}] Suspended {track['title']} at {track['resume_at']:.1f}s.")
+        self.discard_prefetch()
+        if self.voice_client is not None and (self.voice_client.is_playing() or self.voice_client.is_paused()):
+            self.voice_client.stop()
+
+    async def detach(self):
+        """Suspend playback and drop the voice connection, keeping the queue for the next attach()."""
+        self.suspend()
+        self._voice_ready.clear()
+        voice_client, self.voice_client = self.voice_client, None
+        if voice_client is not None:
+            try:
+                await voice_client.disconnect(force=True)
+            except Exception as e:
+                logger.warning(f"[{self.guild_id}] Error while disconnecting from voice: {e}")
+        self._changed()
+
+    async def _wait_for_voice(self):
+        """Wait until a voice connection is attached; False if none came within PLAYER_IDLE_TIMEOUT."""
+        logger.info(f"[{self.guild_id}] No voice connection, queue paused.")
+        deadline = time.monotonic() + PLAYER_IDLE_TIMEOUT
+        while not self.connected:
+            self._voice_ready.clear()
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            try:
+                await asyncio.wait_for(self._voice_ready.wait(), timeout=remaining)
+            except asyncio.TimeoutError:
+                return False
+        logger.info(f"[{self.guild_id}] Voice connection ready, queue resumed.")
+        return True
+
+    async def enqueue(self, track):
+        """Queue a track and make sure the player task is alive to pick it up."""
+        self.queue.put(track)
+        self.ensure_running()
+        self.refresh_prefetch()
+        self._changed()
+
+    async def enqueue_many(self, tracks):
+        """Queue a batch of tracks and make sure the player task is alive to pick them up."""
+        self.queue.extend(tracks)
+        self.ensure_running()
+        self.refresh_prefetch()
+        self._changed()
+
+    def _changed(self):
+        if self._on_change is not None:
+            self._on_change(self)
+
+    @property
+    def position(self):
+        """Seconds into the current track, or 0 when nothing is playing."""
+        if self._source is None:
+            return 0.0
+        return self._source.position
+
+    def snapshot(self):
+        """
+        Queue, current track, playback position, loop flag and DSP settings as a JSON-safe dict,
+        or None when there's nothing worth keeping.
+        """
+        if self.queue.empty() and self._playing is None and not self.loop and self.dsp.volume == 1.0 and not self.dsp.bands:
+            return None
+        return {
+            "queue": [_save_track(track) for track in self.queue],
+            "current": _save_track(self._playing) if self._playing is not None else None,
+            "position": self.position,
+            "loop": self.loop,
+            "volume": self.dsp.volume,
+            "bands": self.dsp.bands,
+        }
+
+    def restore(self, state, get_channel):
+        """
+        Load a snapshot into this idle player. The interrupted track goes first and resumes where it
+        stopped. Nothing starts playing until the player task is started, e.g. on the next join.
+        """
+        tracks = [_load_track(saved, get_channel) for saved in state.get("queue", [])]
+        if state.get("current") is not None:
+            current = _load_track(state["current"], get_channel)
+            current['resume_at'] = state.get("position", 0.0)
+            tracks.insert(0, current)
+        self.queue.extend(tracks)
+        self.loop = state.get("loop", False)
+        self.dsp.set_volume(state.get("volume", 1.0))
+        if state.get("bands"):
+            self.dsp.set_bands(state["bands"])
+        logger.info(f"[{self.guild_id}] Restored {len(tracks)} saved tracks.")
+
+    def _open_source(self, track, cached_path=None, start=0.0):
+        """
+        Open a track, from the Opus cache when possible, `start` seconds in.
+        Blocking; call it from a worker thread.
+        A track's normalization gain is already in its cached file, so it's only applied when decoding the source.
+        """
+        ffmpeg_options = {"before_options": f"-ss {start:.2f}"} if start else {}
+        gain = 10 ** (track.get('gain_db', 0.0) / 20)
+        if cached_path is not None:
+            try:
+                if self.dsp.is_flat:
+                    # Passthrough skips the DSP stage; volume/EQ changes apply from the next track.
+                    return PrerollSource(OpusPassthroughSource(cached_path, skip=start), on_start=self._record_gap, offset=start)
+                decoder = FFmpegPCMAudio(cached_path, **ffmpeg_options)
+                return self._register(PrerollSource(DSPSource(decoder, self.dsp), on_start=self._record_gap, offset=start), decoder)
+            except OSError as e:
+                logger.warning(f"[{self.guild_id}] Cached file unreadable, decoding from source: {e}")
+        decoder = FFmpegPCMAudio(track['url'], **ffmpeg_options)
+        return self._register(PrerollSource(DSPSource(decoder, self.dsp, gain), on_start=self._record_gap, offset=start), decoder)
+
+    def _register(self, source, decoder):
+        self._decoders[source] = (decoder, time.monotonic())
+        return source
+
+    def _prefetched_source(self):
+        if self._prefetch is None:
+            return None
+        task = self._prefetch[1]
+        if not task.done() or task.cancelled() or task.exception() is not None:
+            return None
+        return task.result()
+
+    def reap_decoders(self, grace=DECODER_GRACE):
+        """
+        Kill FFmpeg processes this player started whose sources are neither playing nor prefetched
+        and were opened more than `grace` seconds ago, e.g. left behind by a voice connection that
+        died mid-track. Returns how many were killed. Blocking; call it from a worker thread.
+        """
+        keep = (self._source, self._prefetched_source())
+        now = time.monotonic()
+        killed = 0
+        for source, (decoder, opened_at) in list(self._decoders.items()):
+            poll = getattr(getattr(decoder, "_process", None), "poll", None)
+            if poll is None or poll() is not None:
+                # Already cleaned up, or FFmpeg exited on its own.
+                self._decoders.pop(source, None)
+            elif not any(source is kept for kept in keep) and now - opened_at >= grace:
+                source.cleanup()
+                self._decoders.pop(source, None)
+                killed += 1
+        if killed:
+            logger.warning(f"[{self.guild_id}] Killed {killed} orphaned FFmpeg processes.")
+        return killed
+
+    async def _open(self, track):
+        cached_path = None
+        if self.opus_cache is not None:
+            cached_path = self.opus_cache.lookup(track)
+            if cached_path is None:
+                self.opus_cache.schedule_transcode(track)
+        # A restored track resumes once; on loop it plays again from the start.
+        start = track.pop('resume_at', 0.0)
+        return await asyncio.to_thread(self._open_source, track, cached_path, start)
+
+    async def _prepare(self, track):
+        source = await self._open(track)
+        await asyncio.to_thread(source.preload)
+        return source
+
+    def refresh_prefetch(self):
+        """
+        Start decoding the next queued track while the current one plays.
+        Call this after anything that may change the head of the queue; a stale prefetch is discarded.
+        """
+        head = None if self.queue.empty() else self.queue.peek()
+        if self._prefetch is not None and self._prefetch[0] is not head:
+            self.discard_prefetch()
+        if head is not None and self._prefetch is None and self.current_track is not None and self.connected:
+            self._prefetch = (head, asyncio.create_task(self._prepare(head)))
+            logger.debug(f"[{self.guild_id}] Prefetching next track: {head['title']}")
+
+    def discard_prefetch(self):
+        """Drop the prefetched track, killing its FFmpeg process once it is ready."""
+        if self._prefetch is not None:
+            _, task = self._prefetch
+            self._prefetch = None
+            task.add_done_callback(_cleanup_prepared)
+
+    async def _take_source(self, track):
+        """Return (source, prefetched) for a track, using the prefetched source when it matches."""
+        if self._prefetch is not None and self._prefetch[0] is track:
+            _, task = self._prefetch
+            self._prefetch = None
+            try:
+                return await task, True
+            except Exception as e:
+                logger.warning(f"[{self.guild_id}] Prefetch failed, opening track directly: {e}")
+        self.discard_prefetch()
+        return await self._open(track), False
+
+    def _after_track(self, error):
+        """Runs on the voice client's audio thread when a track finishes."""
+        self._ended_at = time.perf_counter()
+        if error:
+            logger.error(f"[{self.guild_id}] Playback error: {error}")
+        self.bot.loop.call_soon_threadsafe(self.play_next_song.set)
+
+    def _record_gap(self, started_at):
+        """Runs on the audio thread when a track's first frame is read."""
+        ended_at, self._ended_at = self._ended_at, None
+        if ended_at is not None:
+            gap = started_at - ended_at
+            self.gaps.append((gap, self._current_prefetched))
+            INTER_TRACK_GAP.labels(self._current_prefetched).observe(gap)
+            logger.info(f"[{self.guild_id}] Inter-track gap: {gap * 1000:.1f} ms (prefetched: {self._current_prefetched})")
+
+    async def player_loop(self):
+        logger.info(f"Player loop started for guild {self.guild_id}.")
+        while True:
+            self.play_next_song.clear()
+            if not self.connected and not await self._wait_for_voice():
+                break
+            try:
+                self.current_track = await asyncio.wait_for(self.queue.get(), timeout=PLAYER_IDLE_TIMEOUT)
+            except asyncio.TimeoutError:
+                self.current_track = None
+                break
+            logger.info(f"[{self.guild_id}] Track dequeued: {self.current_track['title']}")
+            self._playing = self.current_track
+            try:
+                source, self._current_prefetched = await self._take_source(self.current_track)
+            except Exception as e:
+                logger.exception(f"[{self.guild_id}] Failed to open track {self.current_track['title']}: {e}")
+                self._playing = None
+                continue
+            try:
+                if not self.connected:
+                    raise ClientException("Not connected to voice.")
+                self.voice_client.play(source, after=self._after_track)
+            except ClientException as e:
+                # The connection dropped while the track was opening; keep it for when it's back.
+                logger.warning(f"[{self.guild_id}] Voice connection lost before playback, re-queuing track: {e}")
+                if source.position:
+                    self.current_track['resume_at'] = source.position
+                source.cleanup()
+                self.queue.put_front(self.current_track)
+                self._playing = None
+                continue
+            self._source = source
+            self.refresh_prefetch()
+            self._changed()
+            channel = self.current_track.get('channel')
+            if channel:
+                await channel.send(f"Now playing: **{self.current_track['title']}**")
+            logger.info(f"[{self.guild_id}] Playing track: {self.current_track['title']}")
+            while not self.play_next_song.is_set():
+                try:
+                    await asyncio.wait_for(self.play_next_song.wait(), timeout=POSITION_SAVE_INTERVAL)
+                except asyncio.TimeoutError:
+                    self._changed()
+            self._playing = self._source = None
+            if self._suspended:
+                # suspend() already put the track back; it didn't end, so there's no gap to measure either.
+                self._suspended = False
+                self._ended_at = None
+            elif self.loop:
+                logger.info(f"[{self.guild_id}] Loop enabled, re-queuing track.")
+                self.queue.put(self.current_track)
+            self._changed()
+            if self.queue.empty():
+                # Nothing was waiting, so the time until the next track is not a playback gap.
+                self._ended_at = None
+        logger.info(f"Player loop for guild {self.guild_id} idle for {PLAYER_IDLE_TIMEOUT}s, stopping.")
+        self._task = None
+        if self._on_idle is not None:
+            self._on_idle(self)
+
+    async def teardown(self):
+        """Stop playback, disconnect from voice and cancel the player task."""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        self.discard_prefetch()
+        if self.voice_client is not None:
+            if self.voice_client.is_playing() or self.voice_client.is_paused():
+                self.voice_client.stop()
+            await self.voice_client.disconnect()
+            self.voice_client = None
+        self._voice_ready.clear()
+        self.current_track = None
+        self._playing = self._source = None
+        await asyncio.to_thread(self.reap_decoders, 0)
+        logger.info(f"Guild player for guild {self.guild_id} torn down.")
@@ -0,0 +1,49 @@
+import json
+import os
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+MODEL_PROBE_CACHE = os.getenv("MODEL_PROBE_CACHE", "cache/model_probes.json")
+
+
+class ProbeCache:
+    """
+    Capability probe results saved on disk per model name and digest, so a restart with
+    the same model skips the test generations. Pulling a new version of a model changes
+    its digest, which makes the old entry miss.
+    """
+    def __init__(self, path=MODEL_PROBE_CACHE):
+        self.path = path
+        self._entries = self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            logger.warning("Model probe cache unreadable, probing again: %s", e)
+            return {}
+
+    @staticmethod
+    def key_for(model: str, digest: str) -> str:
+        return f"{model}@{digest}"
+
+    def get(self, model: str, digest: str):
+        return self._entries.get(self.key_for(model, digest))
+
+    def set(self, model: str, digest: str, results: dict):
+        self._entries[self.key_for(model, digest)] = dict(results, probed_at=time.time())
+        directory = os.path.dirname(self.path)
+        try:
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self._entries, f, indent=2)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.warning("Could not save model probe cache: %s", e)
@@ -0,0 +1,147 @@
+import re
+import unicodedata
+import weakref
+
+# Common leetspeak substitutions, applied before matching.
+LEET = {
+    "0": "o", "1": "i", "3": "e", "4": "a", "5": "s", "7": "t", "8": "b",
+    "@": "a", "$": "s", "!": "i", "|": "l", "+": "t",
+}
+# Lookalike letters that Unicode normalization leaves alone (dotless i, common Cyrillic homoglyphs).
+CONFUSABLES = {
+    "ı": "i", "а": "a", "е": "e", "о": "o", "р": "p", "с": "c", "х": "x", "у": "y", "к": "k",
+}
+
+
+class _FoldTable(dict):
+    """
+    str.translate table that folds each character to exactly one character: leetspeak
+    substitution, accent stripping (NFKD base character) and case folding. Keeping the
+    mapping one-to-one means match positions in the folded text are positions in the original.
+    """
+    def __missing__(self, codepoint):
+        char = chr(codepoint)
+        folded = LEET.get(char) or CONFUSABLES.get(char.lower())
+        if folded is None:
+            decomposed = unicodedata.normalize("NFKD", char)
+            base = next((c for c in decomposed if not unicodedata.combining(c)), char)
+            folded = base.casefold()[:1] or char
+        self[codepoint] = folded
+        return folded
+
+
+_FOLD = _FoldTable()
+
+
+def fold(text: str) -> str:
+    """Normalize text for matching without changing its length."""
+    return text.translate(_FOLD)
+
+
+def trie_pattern(words) -> str:
+    """
+    Build a regex alternation shaped like a trie of the given words, e.g. ass/asshole/anal
+    becomes 'a(?:nal|ss(?:hole)?)'. The regex engine then walks shared prefixes once instead
+    of trying every word at every position, and greedy optional suffixes prefer the longest word.
+    """
+    trie = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[""] = {}
+
+    def build(node):
+        ends_here = "" in node
+        singles = []
+        branches = []
+        for char in sorted(key for key in node if key):
+            tail = build(node[char])
+            if tail:
+                branches.append(re.escape(char) + tail)
+            else:
+                singles.append(re.escape(char))
+        if singles:
+            branches.append(singles[0] if len(singles) == 1 else "[" + "".join(singles) + "]")
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 and not ends_here else "(?:" + "|".join(branches) + ")"
+        return body + "?" if ends_here else body
+
+    return build(trie)
+
+
+class ProfanityFilter:
+    """A wordlist and allowlist compiled once into trie-shaped regexes over folded text."""
+    def __init__(self, words, allow=()):
+        self.words = frozenset(fold(w) for w in words if w.strip())
+        self.allow = frozenset(fold(w) for w in allow if w.strip())
+        self._pattern = re.compile(trie_pattern(self.words)) if self.words else None
+        self._allow_pattern = re.compile(trie_pattern(self.allow)) if self.allow else None
+
+    def spans(self, text: str):
+        """Yield (start, end) of every blocked word in text that isn't inside an allowlisted word."""
+        if self._pattern is None:
+            return
+        folded = fold(text)
+        allowed = self._allow_pattern.finditer(folded) if self._allow_pattern is not None else iter(())
+        allow_span = next(allowed, None)
+        for match in self._pattern.finditer(folded):
+            start, end = match.span()
+            # Both scans move left to right, so the allowlist pointer only ever advances.
+            while allow_span is not None and allow_span.end() <= start:
+                allow_span = next(allowed, None)
+            if allow_span is not None and allow_span.start() <= start and end <= allow_span.end():
+                continue
+            yield start, end
+
+    def censor(self, text: str) -> str:
+        """Replace each character of a blocked word, except the first, with an asterisk."""
+        pieces = []
+        position = 0
+        for start, end in self.spans(text):
+            pieces.append(text[position:start + 1])
+            pieces.append("*" * (end - start - 1))
+            position = end
+        if not pieces:
+            return text
+        pieces.append(text[position:])
+        return "".join(pieces)
+
+
+class FilterRegistry:
+    """
+    The default filter plus per-guild overrides. Filters are swapped atomically, and
+    identical word/allow lists share one compiled filter.
+    """
+    def __init__(self, words, allow=()):
+        self._compiled = weakref.WeakValueDictionary()
+        self._guilds = {}
+        self.default = self.compile(words, allow)
+
+    def compile(self, words, allow=()) -> ProfanityFilter:
+        key = (frozenset(fold(w) for w in words), frozenset(fold(w) for w in allow))
+        compiled = self._compiled.get(key)
+        if compiled is None:
+            compiled = ProfanityFilter(*key)
+            self._compiled[key] = compiled
+        return compiled
+
+    def for_guild(self, guild_id=None) -> ProfanityFilter:
+        return self._guilds.get(guild_id, self.default)
+
+    def guild_filter(self, guild_id):
+        """The guild's own filter, or None when it uses the default."""
+        return self._guilds.get(guild_id)
+
+    def set_default(self, words, allow=()):
+        self.default = self.compile(words, allow)
+
+    def set_guild(self, guild_id, words, allow=()):
+        self._guilds[guild_id] = self.compile(words, allow)
+
+    def reset_guild(self, guild_id):
+        self._guilds.pop(guild_id, None)
+
+    def censor(self, text: str, guild_id=None) -> str:
+        return self.for_guild(guild_id).censor(text)
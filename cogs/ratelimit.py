@@ -0,0 +1,116 @@
+import os
+import time
+import logging
+from discord.ext import commands
+from cogs.utils import TTLCache
+
+logger = logging.getLogger(__name__)
+
+# Most buckets tracked at once; the least recently used are dropped beyond this.
+RATE_LIMIT_MAX_BUCKETS = 10000
+
+
+class RateLimited(commands.CheckFailure):
+    """Raised by a cog check when a user is over their rate limit for a command."""
+    def __init__(self, retry_after: float):
+        super().__init__(f"Rate limited; retry in {retry_after:.1f}s.")
+        self.retry_after = retry_after
+
+
+class RatePolicy:
+    """
+    Token bucket parameters: up to `burst` uses, refilled at one use per `period / burst` seconds.
+    A period of 0 means no limit, as DEBOUNCE_DELAY=0 always has.
+    """
+    def __init__(self, burst: int, period: float):
+        self.burst = burst
+        self.period = max(period, 0.0)
+        self.rate = burst / period if period > 0 else None
+
+    @property
+    def unlimited(self):
+        return self.rate is None
+
+    @classmethod
+    def parse(cls, spec: str):
+        """
+        Parse 'burst/seconds', e.g. '3/10' for three uses per ten seconds.
+        Raises ValueError for a burst below 1 or a negative period.
+        """
+        burst, period = spec.split("/")
+        burst, period = int(burst), float(period)
+        if burst < 1 or period < 0:
+            raise ValueError(f"burst must be at least 1 and seconds at least 0: {spec}")
+        return cls(burst, period)
+
+    def __repr__(self):
+        if self.unlimited:
+            return "RatePolicy(unlimited)"
+        return f"RatePolicy({self.burst}/{self.period:g}s)"
+
+
+def parse_policies(spec: str) -> dict:
+    """Parse 'chat=2/6,analyzeimage=1/15' into {command: RatePolicy}, skipping malformed entries."""
+    policies = {}
+    for item in spec.split(","):
+        if not item.strip():
+            continue
+        try:
+            name, value = item.split("=")
+            policies[name.strip()] = RatePolicy.parse(value.strip())
+        except ValueError:
+            logger.warning("Ignoring malformed rate limit policy: %s", item)
+    return policies
+
+
+class RateLimiter:
+    """
+    Token buckets per (command, guild, user) in a bounded map whose entries expire once a
+    bucket would have refilled anyway, so memory stays proportional to recently active users.
+    """
+    def __init__(self, policies: dict, default: RatePolicy, max_buckets=RATE_LIMIT_MAX_BUCKETS):
+        self.policies = policies
+        self.default = default
+        # At least a second, so buckets aren't dropped the moment they're stored when every policy is unlimited.
+        refill = max([default.period, 1.0] + [policy.period for policy in policies.values()])
+        self._buckets = TTLCache(maxsize=max_buckets, ttl=refill)
+        self.limited = 0
+
+    def policy_for(self, command: str) -> RatePolicy:
+        return self.policies.get(command, self.default)
+
+    def hit(self, command: str, guild_id, user_id) -> float:
+        """
+        Take one token for a use of a command. Returns 0 if the use is allowed,
+        otherwise the number of seconds until a token is available.
+        """
+        policy = self.policy_for(command)
+        if policy.unlimited:
+            return 0.0
+        key = (command, guild_id, user_id)
+        now = time.monotonic()
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            tokens = policy.burst
+        else:
+            tokens = min(policy.burst, bucket[0] + (now - bucket[1]) * policy.rate)
+        if tokens < 1:
+            self.limited += 1
+            self._buckets.set(key, (tokens, now))
+            return (1 - tokens) / policy.rate
+        self._buckets.set(key, (tokens - 1, now))
+        return 0.0
+
+    def __len__(self):
+        return len(self._buckets)
+
+
+def policies_from_env(debounce_delay: float):
+    """
+    Build the AI cog's rate limiter config. The default allows a burst of two and then one
+    message per DEBOUNCE_DELAY; RATE_LIMITS overrides individual commands.
+    """
+    default = RatePolicy(2, 2 * debounce_delay)
+    policies = {"analyzeimage": RatePolicy(1, 15.0)}
+    policies.update(parse_policies(os.getenv("RATE_LIMITS", "")))
+    return policies, default
@@ -0,0 +1,187 @@
+import asyncio
+import os
+import logging
+import re
+import threading
+import time
+from cogs.utils import TTLCache
+from cogs.metrics import SPOTIFY_RESOLVE_LATENCY, SPOTIFY_RESOLVER_LOOKUPS
+
+logger = logging.getLogger(__name__)
+
+# Resolver cache bounds; popular queries stay resident, stale metadata expires.
+try:
+    RESOLVER_CACHE_SIZE = int(os.getenv("RESOLVER_CACHE_SIZE", "2048"))
+except ValueError:
+    RESOLVER_CACHE_SIZE = 2048
+try:
+    RESOLVER_CACHE_TTL = float(os.getenv("RESOLVER_CACHE_TTL", "21600"))
+except ValueError:
+    RESOLVER_CACHE_TTL = 21600.0
+# Maximum playlist/album page requests in flight at once during bulk ingest.
+try:
+    INGEST_CONCURRENCY = int(os.getenv("INGEST_CONCURRENCY", "4"))
+except ValueError:
+    INGEST_CONCURRENCY = 4
+
+# Spotify API page sizes (the maximum each endpoint accepts).
+PAGE_SIZES = {'playlist': 100, 'album': 50}
+
+_WHITESPACE = re.compile(r"\s+")
+_COLLECTION = re.compile(r"(?:open\.spotify\.com/(?:intl-[\w-]+/)?|spotify:)(playlist|album)[/:]([A-Za-z0-9]+)")
+
+
+def normalize_query(query: str) -> str:
+    """Case-fold and collapse whitespace so trivially different queries share a cache entry."""
+    return _WHITESPACE.sub(" ", query).strip().casefold()
+
+
+def parse_collection(query: str):
+    """Return (kind, id) for a Spotify playlist/album URL or URI, or None for anything else."""
+    match = _COLLECTION.search(query)
+    if match is None:
+        return None
+    return match.group(1), match.group(2)
+
+
+def track_metadata(track: dict) -> dict:
+    """Reduce a Spotify track object to the fields the player needs."""
+    return {
+        'id': track.get('id'),
+        'title': f"{track['name']} - {track['artists'][0]['name']}",
+        'url': track.get('external_urls', {}).get('spotify'),  # Placeholder URL
+        'duration_ms': track.get('duration_ms'),
+    }
+
+
+class SpotifyResolver:
+    """
+    Resolves search queries to track metadata without blocking the event loop.
+    Searches run in a worker thread, identical concurrent queries share one request,
+    and results are kept in a bounded TTL/LRU cache. The Spotify client is built by
+    client_factory on first use, in a worker thread, so startup doesn't pay for it.
+    """
+    def __init__(self, client_factory, maxsize=RESOLVER_CACHE_SIZE, ttl=RESOLVER_CACHE_TTL):
+        self._client_factory = client_factory
+        self._client = None
+        self._client_lock = threading.Lock()
+        self.cache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._inflight = {}  # normalized query -> Future
+        self.coalesced = 0
+
+    @property
+    def client(self):
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    self._client = self._client_factory()
+                    logger.info("Spotify client created.")
+        return self._client
+
+    def _invoke(self, method, args, kwargs):
+        client = self.client
+        started = time.perf_counter()
+        try:
+            return getattr(client, method)(*args, **kwargs)
+        finally:
+            SPOTIFY_RESOLVE_LATENCY.labels(method).observe(time.perf_counter() - started)
+
+    async def _call(self, method, *args, **kwargs):
+        """Call a Spotify client method in a worker thread."""
+        return await asyncio.to_thread(self._invoke, method, args, kwargs)
+
+    async def resolve(self, query: str):
+        """Return track metadata for the best match of a query, or None if nothing matched."""
+        key = normalize_query(query)
+        cached = self.cache.get(key)
+        if cached is not None:
+            SPOTIFY_RESOLVER_LOOKUPS.labels("hit").inc()
+            return dict(cached)
+        future = self._inflight.get(key)
+        if future is not None:
+            self.coalesced += 1
+            SPOTIFY_RESOLVER_LOOKUPS.labels("coalesced").inc()
+            result = await asyncio.shield(future)
+            return dict(result) if result is not None else None
+        SPOTIFY_RESOLVER_LOOKUPS.labels("miss").inc()
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            result = await self._search(key)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Mark the exception as retrieved in case nobody else was waiting.
+            future.exception()
+            raise
+        else:
+            future.set_result(result)
+        finally:
+            self._inflight.pop(key, None)
+        if result is not None:
+            self.cache.set(key, result)
+            return dict(result)
+        return None
+
+    async def _search(self, key: str):
+        results = await self._call('search', q=key, type='track', limit=1)
+        tracks = results.get('tracks', {}).get('items', [])
+        if not tracks:
+            return None
+        return track_metadata(tracks[0])
+
+    async def iter_collection(self, kind: str, collection_id: str, concurrency=INGEST_CONCURRENCY):
+        """
+        Yield (tracks, total) for each page of a playlist or album, in order.
+        The first page is fetched alone so callers can start playback right away; the remaining
+        pages are fetched concurrently with at most `concurrency` requests in flight.
+        """
+        page_size = PAGE_SIZES[kind]
+        first = await self._fetch_page(kind, collection_id, 0, page_size)
+        total = first.get('total', 0)
+        yield self._page_tracks(kind, first), total
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def fetch(offset):
+            async with semaphore:
+                return await self._fetch_page(kind, collection_id, offset, page_size)
+
+        tasks = [asyncio.create_task(fetch(offset)) for offset in range(page_size, total, page_size)]
+        try:
+            for task in tasks:
+                page = await task
+                yield self._page_tracks(kind, page), total
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def _fetch_page(self, kind, collection_id, offset, limit):
+        if kind == 'playlist':
+            return await self._call(
+                'playlist_items', collection_id,
+                offset=offset, limit=limit, additional_types=('track',)
+            )
+        return await self._call('album_tracks', collection_id, limit=limit, offset=offset)
+
+    @staticmethod
+    def _page_tracks(kind, page):
+        items = page.get('items', [])
+        if kind == 'playlist':
+            # Playlist items wrap the track and may point at removed tracks or episodes.
+            items = [item.get('track') for item in items]
+        tracks = []
+        for item in items:
+            if not item or item.get('type', 'track') != 'track' or not item.get('artists'):
+                continue
+            metadata = track_metadata(item)
+            if metadata['url']:
+                tracks.append(metadata)
+        return tracks
+
+    def stats(self):
+        stats = self.cache.stats()
+        stats["coalesced"] = self.coalesced
+        stats["inflight"] = len(self._inflight)
+        return stats
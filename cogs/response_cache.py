@@ -0,0 +1,89 @@
+import hashlib
+import os
+import re
+import logging
+from cogs.utils import TTLCache
+
+logger = logging.getLogger(__name__)
+
+# Opt-in: replaying answers is only worth it on servers that spam the same prompts.
+RESPONSE_CACHE = os.getenv("RESPONSE_CACHE", "false").lower() in ("true", "1", "yes")
+try:
+    RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "256"))
+except ValueError:
+    RESPONSE_CACHE_SIZE = 256
+try:
+    RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", "600"))
+except ValueError:
+    RESPONSE_CACHE_TTL = 600.0
+# Times a cached answer may be replayed before a fresh one is generated.
+try:
+    RESPONSE_CACHE_MAX_HITS = int(os.getenv("RESPONSE_CACHE_MAX_HITS", "3"))
+except ValueError:
+    RESPONSE_CACHE_MAX_HITS = 3
+# Number of most recent history messages (including the new prompt) that make up the key.
+try:
+    RESPONSE_CACHE_WINDOW = int(os.getenv("RESPONSE_CACHE_WINDOW", "1"))
+except ValueError:
+    RESPONSE_CACHE_WINDOW = 1
+
+_NOISE = re.compile(r"[^\w\s]+")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_prompt(text: str) -> str:
+    """Case-fold and drop punctuation and extra whitespace, so 'Tell me a joke!' matches 'tell me a joke'."""
+    return _WHITESPACE.sub(" ", _NOISE.sub(" ", text)).strip().casefold()
+
+
+class ResponseCache:
+    """
+    LRU+TTL cache of final replies keyed by model, guild, system prompt and the recent history window.
+    Each entry can be replayed a limited number of times so answers don't feel canned.
+    Replies are stored censored, so each remembers the profanity filter it went through and is
+    only replayed while the guild still uses that filter.
+    """
+    def __init__(self, maxsize=RESPONSE_CACHE_SIZE, ttl=RESPONSE_CACHE_TTL,
+                 max_hits=RESPONSE_CACHE_MAX_HITS, window=RESPONSE_CACHE_WINDOW):
+        self.max_hits = max_hits
+        self.window = window
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+
+    def key_for(self, model: str, session, guild_id=None) -> str:
+        digest = hashlib.sha256()
+        digest.update(model.encode("utf-8"))
+        digest.update(b"\0")
+        digest.update(str(guild_id).encode("utf-8"))
+        digest.update(b"\0")
+        digest.update(session.system_prompt.encode("utf-8"))
+        digest.update(b"\0")
+        digest.update(session.meme_context.encode("utf-8"))
+        for message in session.history[-self.window:]:
+            digest.update(b"\0")
+            digest.update(message["role"].encode("utf-8"))
+            digest.update(b":")
+            digest.update(normalize_prompt(message["content"]).encode("utf-8"))
+        return digest.hexdigest()
+
+    def get(self, key: str, profanity_filter=None):
+        """Return a cached reply and count the replay, or None on a miss or if it was censored with another filter."""
+        entry = self._cache.get(key)
+        if entry is None:
+            return None
+        if entry[2] is not profanity_filter:
+            self._cache.pop(key)
+            return None
+        entry[1] += 1
+        if entry[1] >= self.max_hits:
+            self._cache.pop(key)
+        return entry[0]
+
+    def set(self, key: str, response: str, profanity_filter=None):
+        self._cache.set(key, [response, 0, profanity_filter])
+
+    @property
+    def hit_ratio(self):
+        return self._cache.hit_ratio
+
+    def stats(self):
+        return self._cache.stats()
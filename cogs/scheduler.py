@@ -0,0 +1,194 @@
+import asyncio
+import os
+import time
+import logging
+from collections import OrderedDict, deque
+from cogs.metrics import INFERENCE_QUEUE_WAIT, INFERENCE_REJECTED
+
+logger = logging.getLogger(__name__)
+
+# Generations allowed to run against the model at once.
+try:
+    OLLAMA_CONCURRENCY = int(os.getenv("OLLAMA_CONCURRENCY", "1"))
+except ValueError:
+    OLLAMA_CONCURRENCY = 1
+# Requests allowed to wait for a slot before new ones are turned away.
+try:
+    OLLAMA_MAX_QUEUE = int(os.getenv("OLLAMA_MAX_QUEUE", "20"))
+except ValueError:
+    OLLAMA_MAX_QUEUE = 20
+# Number of recent wait times kept for percentile reporting.
+WAIT_SAMPLES = 512
+
+
+class SchedulerBusy(Exception):
+    """Raised when the wait queue is full."""
+
+
+class RequestCancelled(Exception):
+    """Raised when a request is dropped because its invoking message was deleted."""
+
+
+class _Ticket:
+    __slots__ = ("guild_id", "user_id", "message_id", "future", "task", "enqueued_at", "deleted")
+
+    def __init__(self, guild_id, user_id, message_id):
+        self.guild_id = guild_id
+        self.user_id = user_id
+        self.message_id = message_id
+        self.future = None
+        self.task = None
+        self.enqueued_at = time.monotonic()
+        self.deleted = False
+
+
+class InferenceScheduler:
+    """
+    Admission control for model calls: at most `concurrency` run at once and at most
+    `max_queue` wait. Waiting requests are served round-robin across guilds and, within
+    a guild, across users, so one busy server or one spammer can't starve the rest.
+    """
+    def __init__(self, concurrency=OLLAMA_CONCURRENCY, max_queue=OLLAMA_MAX_QUEUE):
+        self.concurrency = concurrency
+        self.max_queue = max_queue
+        self._active = 0
+        self._waiting = 0
+        self._guilds = OrderedDict()  # guild_id -> OrderedDict(user_id -> deque of tickets)
+        self._by_message = {}  # message_id -> ticket, waiting or running
+        self._waits = deque(maxlen=WAIT_SAMPLES)
+        self.completed = 0
+        self.rejected = 0
+        self.cancelled = 0
+
+    @property
+    def running(self):
+        """Number of requests holding a slot."""
+        return self._active
+
+    @property
+    def depth(self):
+        """Number of requests waiting for a slot."""
+        return self._waiting
+
+    async def run(self, coro_factory, *, guild_id=None, user_id=None, message_id=None):
+        """
+        Wait for a slot, then run coro_factory() and return its result.
+        Raises SchedulerBusy if the queue is full and RequestCancelled if the invoking
+        message is deleted while the request is waiting or running.
+        """
+        ticket = _Ticket(guild_id, user_id, message_id)
+        await self._acquire(ticket)
+        try:
+            ticket.task = asyncio.create_task(coro_factory())
+            try:
+                return await asyncio.shield(ticket.task)
+            except asyncio.CancelledError:
+                if ticket.deleted and ticket.task.cancelled():
+                    raise RequestCancelled() from None
+                ticket.task.cancel()
+                raise
+        finally:
+            self._release(ticket)
+
+    async def _acquire(self, ticket):
+        if ticket.message_id is not None:
+            self._by_message[ticket.message_id] = ticket
+        if self._active < self.concurrency and not self._waiting:
+            self._active += 1
+            self._waits.append(0.0)
+            INFERENCE_QUEUE_WAIT.observe(0.0)
+            return
+        if self._waiting >= self.max_queue:
+            self.rejected += 1
+            INFERENCE_REJECTED.inc()
+            self._forget(ticket)
+            raise SchedulerBusy()
+        ticket.future = asyncio.get_running_loop().create_future()
+        self._guilds.setdefault(ticket.guild_id, OrderedDict()).setdefault(ticket.user_id, deque()).append(ticket)
+        self._waiting += 1
+        try:
+            await ticket.future
+        except BaseException:
+            if ticket.future.done() and not ticket.future.cancelled() and ticket.future.exception() is None:
+                # A slot was handed over just as we were cancelled; give it back.
+                self._active -= 1
+                self._dispatch()
+            elif not ticket.future.done():
+                self._remove_waiting(ticket)
+            self._forget(ticket)
+            raise
+        wait = time.monotonic() - ticket.enqueued_at
+        self._waits.append(wait)
+        INFERENCE_QUEUE_WAIT.observe(wait)
+        logger.debug("Inference request for guild %s waited %.2fs for a slot.", ticket.guild_id, wait)
+
+    def _release(self, ticket):
+        self._forget(ticket)
+        self._active -= 1
+        self.completed += 1
+        self._dispatch()
+
+    def _forget(self, ticket):
+        if ticket.message_id is not None and self._by_message.get(ticket.message_id) is ticket:
+            del self._by_message[ticket.message_id]
+
+    def _dispatch(self):
+        while self._active < self.concurrency and self._guilds:
+            guild_id, users = next(iter(self._guilds.items()))
+            user_id, tickets = next(iter(users.items()))
+            ticket = tickets.popleft()
+            if tickets:
+                users.move_to_end(user_id)
+            else:
+                del users[user_id]
+            if users:
+                self._guilds.move_to_end(guild_id)
+            else:
+                del self._guilds[guild_id]
+            self._waiting -= 1
+            self._active += 1
+            ticket.future.set_result(None)
+
+    def _remove_waiting(self, ticket):
+        users = self._guilds.get(ticket.guild_id)
+        tickets = users.get(ticket.user_id) if users else None
+        if not tickets or ticket not in tickets:
+            return
+        tickets.remove(ticket)
+        self._waiting -= 1
+        if not tickets:
+            del users[ticket.user_id]
+            if not users:
+                del self._guilds[ticket.guild_id]
+
+    def cancel_message(self, message_id):
+        """Drop the request started by a message, whether it is still waiting or already generating."""
+        ticket = self._by_message.pop(message_id, None)
+        if ticket is None:
+            return False
+        ticket.deleted = True
+        self.cancelled += 1
+        if ticket.task is not None:
+            ticket.task.cancel()
+        elif ticket.future is not None and not ticket.future.done():
+            self._remove_waiting(ticket)
+            ticket.future.set_exception(RequestCancelled())
+        logger.info("Cancelled inference request for deleted message %s.", message_id)
+        return True
+
+    def stats(self):
+        waits = sorted(self._waits)
+
+        def percentile(p):
+            return waits[min(len(waits) - 1, int(len(waits) * p))] if waits else 0.0
+
+        return {
+            "running": self._active,
+            "queue_depth": self._waiting,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "cancelled": self.cancelled,
+            "wait_p50": percentile(0.50),
+            "wait_p95": percentile(0.95),
+            "wait_max": waits[-1] if waits else 0.0,
+        }
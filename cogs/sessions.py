@@ -0,0 +1,204 @@
+import os
+import time
+import logging
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+# Estimated tokens of history kept per session before older turns are folded into the summary.
+try:
+    HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "2048"))
+except ValueError:
+    HISTORY_TOKEN_BUDGET = 2048
+# Compaction folds old turns until history is back under this fraction of the budget, so it runs rarely.
+COMPACT_TARGET = 0.5
+# Past this multiple of the budget (e.g. while a summary is still pending), the oldest turns are dropped outright.
+HARD_LIMIT_FACTOR = 2
+# Newest messages that are never folded into the summary.
+KEEP_RECENT = 2
+# Per-message overhead in the chat template, in tokens.
+MESSAGE_OVERHEAD = 4
+# Upper bound on live sessions; the least recently used one is dropped beyond this.
+try:
+    MAX_SESSIONS = int(os.getenv("MAX_SESSIONS", "1000"))
+except ValueError:
+    MAX_SESSIONS = 1000
+# Seconds without a message before a session is discarded.
+try:
+    SESSION_IDLE_TIMEOUT = float(os.getenv("SESSION_IDLE_TIMEOUT", "3600"))
+except ValueError:
+    SESSION_IDLE_TIMEOUT = 3600.0
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate (~4 characters per token for English BPE vocabularies)."""
+    return len(text) // 4 + MESSAGE_OVERHEAD
+
+
+class ChatSession:
+    """
+    Conversation state for one channel: its system prompt, meme context, rolling summary and recent history.
+    The prompt prefix (system prompt plus summary) only changes when history is compacted, and
+    history is otherwise append-only, so consecutive prompts share a byte-identical prefix that
+    the model server can reuse from its KV cache.
+    """
+    def __init__(self, key, system_prompt: str, meme_context: str = "default", token_budget=HISTORY_TOKEN_BUDGET):
+        self.key = key
+        self.system_prompt = system_prompt
+        self.meme_context = meme_context
+        self.summary = ""
+        self.history = []  # user/assistant messages, oldest first
+        self.tokens = 0  # estimated tokens in history
+        self.token_budget = token_budget
+        self.compacting = False
+        self.last_active = time.monotonic()
+        self._prefix = None
+        self._rebuild_prefix()
+
+    def _rebuild_prefix(self):
+        content = self.system_prompt
+        if self.summary:
+            content += "\n\nSummary of the earlier conversation:\n" + self.summary
+        self._prefix = {"role": "system", "content": content}
+
+    def messages(self):
+        """Return the message list to send to the model."""
+        return [self._prefix] + self.history
+
+    def set_system_prompt(self, system_prompt: str):
+        """
+        Switch persona without touching the cached prefix: the new instructions are appended as
+        a system turn now and become part of the prefix at the next compaction.
+        """
+        self.system_prompt = system_prompt
+        self.update_history("system", system_prompt)
+
+    def update_history(self, role: str, content: str):
+        """Append a new message to the conversation history, dropping the oldest turns past the hard limit."""
+        # A single pasted wall of text can't take more than half the budget.
+        max_chars = self.token_budget * 2
+        if len(content) > max_chars:
+            content = content[:max_chars]
+        entry = {"role": role, "content": content}
+        self.history.append(entry)
+        self.tokens += estimate_tokens(content)
+        while self.tokens > self.token_budget * HARD_LIMIT_FACTOR and len(self.history) > KEEP_RECENT:
+            removed = self.history.pop(0)
+            self.tokens -= estimate_tokens(removed["content"])
+            logger.debug("History over hard limit; dropped oldest entry: %s", removed)
+        return entry
+
+    def forget(self, entry):
+        """Remove an entry added by update_history, e.g. when its request never got an answer."""
+        for index, existing in enumerate(self.history):
+            if existing is entry:
+                del self.history[index]
+                self.tokens -= estimate_tokens(entry["content"])
+                return
+
+    @property
+    def needs_compaction(self):
+        return self.tokens > self.token_budget and not self.compacting
+
+    def compaction_batch(self):
+        """Return the oldest messages to fold into the summary to get back under the compaction target."""
+        target = self.token_budget * COMPACT_TARGET
+        remaining = self.tokens
+        batch = []
+        for entry in self.history[:-KEEP_RECENT]:
+            if remaining <= target:
+                break
+            batch.append(entry)
+            remaining -= estimate_tokens(entry["content"])
+        return batch
+
+    def apply_summary(self, batch, summary: str):
+        """Replace the folded messages with the new summary. Messages already dropped are skipped."""
+        folded = {id(entry) for entry in batch}
+        kept = []
+        for entry in self.history:
+            if id(entry) in folded:
+                self.tokens -= estimate_tokens(entry["content"])
+            else:
+                kept.append(entry)
+        self.history = kept
+        self.summary = summary
+        self._rebuild_prefix()
+
+    def snapshot(self):
+        """The parts of the session worth keeping across restarts, as a JSON-safe dict."""
+        return {
+            "system_prompt": self.system_prompt,
+            "meme_context": self.meme_context,
+            "summary": self.summary,
+            "history": list(self.history),
+        }
+
+    def restore(self, state):
+        """Load a snapshot taken by snapshot()."""
+        self.system_prompt = state.get("system_prompt", self.system_prompt)
+        self.meme_context = state.get("meme_context", self.meme_context)
+        self.summary = state.get("summary", "")
+        self.history = list(state.get("history", []))
+        self.tokens = sum(estimate_tokens(entry["content"]) for entry in self.history)
+        self._rebuild_prefix()
+
+
+class SessionStore:
+    """
+    Chat sessions keyed by (guild_id, channel_id), held in least-recently-used order.
+    Idle sessions are evicted on access and the number of live sessions is capped,
+    so memory stays flat regardless of how many channels talk to the bot.
+    """
+    def __init__(self, default_prompt: str, max_sessions=MAX_SESSIONS, idle_timeout=SESSION_IDLE_TIMEOUT):
+        self.default_prompt = default_prompt
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout
+        self._sessions = OrderedDict()
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def __contains__(self, key):
+        return key in self._sessions
+
+    @staticmethod
+    def key_for(channel):
+        guild = getattr(channel, "guild", None)
+        return (guild.id if guild else None, channel.id)
+
+    def get(self, channel) -> ChatSession:
+        """Return the session for a channel, creating it if needed."""
+        now = time.monotonic()
+        self._evict_idle(now)
+        key = self.key_for(channel)
+        session = self._sessions.get(key)
+        if session is None:
+            session = self._add(ChatSession(key, self.default_prompt))
+        else:
+            self._sessions.move_to_end(key)
+        session.last_active = now
+        return session
+
+    def restore(self, channel, state) -> ChatSession:
+        """Bring back a saved session for a channel, replacing any live one."""
+        session = ChatSession(self.key_for(channel), self.default_prompt)
+        session.restore(state)
+        self._sessions.pop(session.key, None)
+        return self._add(session)
+
+    def _add(self, session):
+        self._sessions[session.key] = session
+        while len(self._sessions) > self.max_sessions:
+            evicted, _ = self._sessions.popitem(last=False)
+            logger.debug("Evicted least recently used session %s", evicted)
+        return session
+
+    def _evict_idle(self, now):
+        # Sessions are ordered by last use, so idle ones are all at the front.
+        while self._sessions:
+            key, session = next(iter(self._sessions.items()))
+            if now - session.last_active < self.idle_timeout:
+                break
+            del self._sessions[key]
+            logger.debug("Evicted idle session %s", key)
@@ -0,0 +1,183 @@
+import asyncio
+import json
+import os
+import sqlite3
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# SQLite file for queues, chat sessions and guild filters; empty disables persistence.
+STATE_DB = os.getenv("STATE_DB", "cache/state.db")
+# Seconds changes are collected before they are written in one transaction.
+try:
+    STATE_FLUSH_INTERVAL = float(os.getenv("STATE_FLUSH_INTERVAL", "2"))
+except ValueError:
+    STATE_FLUSH_INTERVAL = 2.0
+
+# Each table stores one JSON document per key, so adding a field never needs a migration.
+TABLES = {
+    "players": ("guild_id",),
+    "sessions": ("guild_id", "channel_id"),
+    "filters": ("guild_id",),
+}
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS players (
+    guild_id INTEGER PRIMARY KEY,
+    state TEXT NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS sessions (
+    guild_id INTEGER NOT NULL,
+    channel_id INTEGER NOT NULL,
+    state TEXT NOT NULL,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (guild_id, channel_id)
+);
+CREATE TABLE IF NOT EXISTS filters (
+    guild_id INTEGER PRIMARY KEY,
+    state TEXT NOT NULL,
+    updated_at REAL NOT NULL
+);
+"""
+
+
+class StateStore:
+    """
+    Write-behind persistence on SQLite in WAL mode. Callers mark a key dirty with a function
+    that snapshots its current state; every flush interval the pending snapshots are taken on the
+    event loop, and serialized and written in one transaction on a dedicated database thread.
+    Many changes to the same key between flushes cost a single row write. Reads are single-row
+    lookups by primary key, made lazily when a guild or channel is first touched.
+    """
+    def __init__(self, path=STATE_DB, flush_interval=STATE_FLUSH_INTERVAL):
+        self.path = path
+        self.flush_interval = flush_interval
+        # sqlite3 connections belong to the thread that made them, so all database work runs on this one.
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="state-db")
+        self._conn = None
+        self._dirty = {}  # (table, key) -> snapshot function returning a dict, or None to delete
+        self._flush_handle = None
+        self._flushing = None
+        self._closed = False
+        self.writes = 0
+
+    @property
+    def enabled(self):
+        return bool(self.path)
+
+    def _db(self):
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._conn = sqlite3.connect(self.path, timeout=10)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            # WAL with synchronous=NORMAL only risks the last few transactions on power loss, never corruption.
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(SCHEMA)
+            logger.info("State database opened at %s.", self.path)
+        return self._conn
+
+    async def _run(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    def _select(self, table, key):
+        columns = TABLES[table]
+        where = " AND ".join(f"{column} = ?" for column in columns)
+        row = self._db().execute(f"SELECT state, updated_at FROM {table} WHERE {where}", key).fetchone()
+        if row is None:
+            return None
+        return json.loads(row[0]), row[1]
+
+    async def load(self, table, key):
+        """Return (state, updated_at wall-clock time) for a key, or None if nothing is stored."""
+        if not self.enabled:
+            return None
+        try:
+            return await self._run(self._select, table, tuple(key))
+        except (sqlite3.Error, ValueError) as e:
+            logger.warning("Could not load %s %s from the state database: %s", table, key, e)
+            return None
+
+    def _select_all(self, table):
+        columns = TABLES[table]
+        rows = self._db().execute(f"SELECT {', '.join(columns)}, state FROM {table}").fetchall()
+        return {tuple(row[:len(columns)]): json.loads(row[-1]) for row in rows}
+
+    async def load_all(self, table):
+        """Return {key: state} for every row of a table. Only for small tables that are needed up front."""
+        if not self.enabled:
+            return {}
+        try:
+            return await self._run(self._select_all, table)
+        except (sqlite3.Error, ValueError) as e:
+            logger.warning("Could not load %s from the state database: %s", table, e)
+            return {}
+
+    def mark_dirty(self, table, key, snapshot):
+        """Schedule `snapshot()` to be persisted for a key at the next flush."""
+        if not self.enabled or self._closed:
+            return
+        self._dirty[(table, tuple(key))] = snapshot
+        if self._flush_handle is None:
+            self._flush_handle = asyncio.get_running_loop().call_later(self.flush_interval, self._start_flush)
+
+    def _start_flush(self):
+        self._flush_handle = None
+        if self._flushing is None or self._flushing.done():
+            self._flushing = asyncio.create_task(self.flush())
+        else:
+            # A slow write is still running; try again after another interval.
+            self._flush_handle = asyncio.get_running_loop().call_later(self.flush_interval, self._start_flush)
+
+    def _write(self, rows):
+        conn = self._db()
+        now = time.time()
+        with conn:
+            for table, key, state in rows:
+                columns = TABLES[table]
+                if state is None:
+                    where = " AND ".join(f"{column} = ?" for column in columns)
+                    conn.execute(f"DELETE FROM {table} WHERE {where}", key)
+                else:
+                    placeholders = ", ".join("?" for _ in range(len(columns) + 2))
+                    conn.execute(
+                        f"INSERT OR REPLACE INTO {table} ({', '.join(columns)}, state, updated_at) VALUES ({placeholders})",
+                        key + (json.dumps(state, separators=(",", ":")), now)
+                    )
+        return len(rows)
+
+    async def flush(self):
+        """Write every pending snapshot now."""
+        if not self._dirty:
+            return
+        dirty, self._dirty = self._dirty, {}
+        rows = []
+        for (table, key), snapshot in dirty.items():
+            try:
+                rows.append((table, key, snapshot()))
+            except Exception as e:
+                logger.exception("Could not snapshot %s %s: %s", table, key, e)
+        try:
+            self.writes += await self._run(self._write, rows)
+        except (sqlite3.Error, TypeError, ValueError) as e:
+            logger.error("State database write of %d rows failed: %s", len(rows), e)
+
+    def _close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    async def close(self):
+        """Write anything still pending and close the database."""
+        self._closed = True
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        if self._flushing is not None and not self._flushing.done():
+            await self._flushing
+        await self.flush()
+        await self._run(self._close)
+        self._executor.shutdown(wait=True)
@@ -0,0 +1,106 @@
+import os
+import time
+import logging
+from cogs.utils import censor_text
+
+logger = logging.getLogger(__name__)
+
+# Discord's hard limit on message content length.
+DISCORD_MESSAGE_LIMIT = 2000
+# Minimum seconds between edits of a streamed reply; Discord allows about 5 edits per 5 seconds per channel.
+try:
+    STREAM_EDIT_INTERVAL = float(os.getenv("STREAM_EDIT_INTERVAL", "1.2"))
+except ValueError:
+    STREAM_EDIT_INTERVAL = 1.2
+
+
+def split_pages(text: str, limit: int = DISCORD_MESSAGE_LIMIT):
+    """
+    Split text into message-sized pages, preferring to break at a newline or space.
+    Breaks depend only on the text before them, so pages stay stable as a stream grows.
+    """
+    pages = []
+    while len(text) > limit:
+        cut = text.rfind("\n", 0, limit)
+        if cut <= 0:
+            cut = text.rfind(" ", 0, limit)
+        if cut <= 0:
+            cut = limit
+        pages.append(text[:cut])
+        text = text[cut:].lstrip()
+    pages.append(text)
+    return [page for page in pages if page.strip()]
+
+
+class StreamingReply:
+    """
+    Posts a reply as soon as the first words of a streamed answer arrive and edits it as more come in.
+    Text is censored one whole word at a time, edits are coalesced to STREAM_EDIT_INTERVAL, and
+    answers that outgrow one message continue in follow-up messages.
+    """
+    def __init__(self, destination, censor=censor_text, edit_interval=STREAM_EDIT_INTERVAL):
+        self.destination = destination  # anything with an async send(), e.g. a Context or channel
+        self.censor = censor
+        self.edit_interval = edit_interval
+        self.messages = []
+        self._shown = []  # content currently displayed in each message
+        self._committed = ""  # censored text made of complete words
+        self._pending = ""  # trailing partial word, not yet censored or shown
+        self._last_flush = 0.0
+        self.started_at = time.perf_counter()
+        self.first_visible_at = None
+
+    @property
+    def text(self):
+        return self._committed + self._pending
+
+    @property
+    def time_to_first_visible(self):
+        if self.first_visible_at is None:
+            return None
+        return self.first_visible_at - self.started_at
+
+    async def feed(self, chunk: str):
+        """Add a streamed chunk, posting or editing the reply if it is due."""
+        self._pending += chunk
+        cut = max(self._pending.rfind(" "), self._pending.rfind("\n"))
+        if cut < 0:
+            return
+        complete, self._pending = self._pending[:cut + 1], self._pending[cut + 1:]
+        self._committed += self.censor(complete)
+        if not self.messages:
+            if self._committed.strip():
+                await self.flush()
+        elif time.monotonic() - self._last_flush >= self.edit_interval:
+            await self.flush()
+
+    async def finish(self, transform=None):
+        """
+        Censor the remaining text, optionally pass the whole reply through transform(text) -> text,
+        and make the messages show the final result. Returns the final text.
+        """
+        self._committed += self.censor(self._pending)
+        self._pending = ""
+        if transform is not None:
+            self._committed = transform(self._committed)
+        await self.flush()
+        return self._committed
+
+    async def flush(self):
+        self._last_flush = time.monotonic()
+        pages = split_pages(self._committed)
+        while len(self.messages) > max(len(pages), 1):
+            # The final text can be shorter than what was streamed; drop leftover follow-ups.
+            await self.messages.pop().delete()
+            self._shown.pop()
+        for index, page in enumerate(pages):
+            if index < len(self.messages):
+                if self._shown[index] != page:
+                    await self.messages[index].edit(content=page)
+                    self._shown[index] = page
+                continue
+            self.messages.append(await self.destination.send(page))
+            self._shown.append(page)
+            if self.first_visible_at is None:
+                self.first_visible_at = time.perf_counter()
+                logger.info("Time to first visible token: %.0f ms", self.time_to_first_visible * 1000)
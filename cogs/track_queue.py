@@ -0,0 +1,101 @@
+import asyncio
+import random
+from collections import deque
+from itertools import islice
+
+
+class TrackQueue:
+    """
+    Music queue with an awaitable get, O(1) put/popleft and in-place editing.
+    Unlike asyncio.Queue the contents can be inspected, reordered and paginated
+    without rebuilding the queue, so a running player never waits on a stale object.
+    """
+    def __init__(self, tracks=()):
+        self._items = deque(tracks)
+        self._getters = deque()
+
+    def __len__(self):
+        return len(self._items)
+
+    def __iter__(self):
+        return iter(self._items)
+
+    def empty(self):
+        return not self._items
+
+    def _wakeup_next(self):
+        while self._getters:
+            getter = self._getters.popleft()
+            if not getter.done():
+                getter.set_result(None)
+                break
+
+    def put(self, track):
+        """Append a track to the end of the queue."""
+        self._items.append(track)
+        self._wakeup_next()
+
+    def extend(self, tracks):
+        """Append several tracks to the end of the queue."""
+        for track in tracks:
+            self.put(track)
+
+    def put_front(self, track):
+        """Insert a track so it is the next one played."""
+        self._items.appendleft(track)
+        self._wakeup_next()
+
+    async def get(self):
+        """Remove and return the next track, waiting until one is available."""
+        while not self._items:
+            getter = asyncio.get_running_loop().create_future()
+            self._getters.append(getter)
+            try:
+                await getter
+            except BaseException:
+                getter.cancel()
+                try:
+                    self._getters.remove(getter)
+                except ValueError:
+                    pass
+                # Pass the wakeup on if we were woken and cancelled at the same time.
+                if self._items and not getter.cancelled():
+                    self._wakeup_next()
+                raise
+        return self._items.popleft()
+
+    def get_nowait(self):
+        """Remove and return the next track; raises IndexError when empty."""
+        return self._items.popleft()
+
+    def peek(self, index=0):
+        """Return the track at a 0-based position without removing it."""
+        return self._items[index]
+
+    def remove(self, index):
+        """Remove and return the track at a 0-based position."""
+        track = self._items[index]
+        del self._items[index]
+        return track
+
+    def move(self, src, dst):
+        """Move the track at position src so it ends up at position dst (both 0-based)."""
+        track = self.remove(src)
+        self._items.insert(dst, track)
+        return track
+
+    def shuffle(self):
+        """Shuffle the queued tracks in place."""
+        items = list(self._items)
+        random.shuffle(items)
+        self._items.clear()
+        self._items.extend(items)
+
+    def clear(self):
+        """Drop every queued track."""
+        self._items.clear()
+
+    def page(self, page, per_page=10):
+        """Return the 0-based page of tracks without copying the rest of the queue."""
+        start = page * per_page
+        return list(islice(self._items, start, start + per_page))
@@ -1,13 +1,82 @@
-import re
+import os
+import time
+from collections import OrderedDict
+from cogs.profanity import FilterRegistry
 
 SWEAR_WORDS = ["Fuck", "shit"]
 
-def censor_text(text):
+
+def _load_wordlist(path):
+    """Read one word per line from a file, ignoring blank lines and # comments."""
+    with open(path, "r", encoding="utf-8") as f:
+        return [line.strip() for line in f if line.strip() and not line.startswith("#")]
+
+
+# Default filter: SWEAR_WORDS, or the files named by PROFANITY_WORDLIST / PROFANITY_ALLOWLIST.
+FILTERS = FilterRegistry(
+    _load_wordlist(os.environ["PROFANITY_WORDLIST"]) if os.getenv("PROFANITY_WORDLIST") else SWEAR_WORDS,
+    _load_wordlist(os.environ["PROFANITY_ALLOWLIST"]) if os.getenv("PROFANITY_ALLOWLIST") else ()
+)
+
+
+def censor_text(text, guild_id=None):
     """
     Censors strong language by replacing each character (except the first) with asterisks.
+    Uses the guild's own word and allow lists when it has them.
+    """
+    return FILTERS.censor(text, guild_id)
+
+
+class TTLCache:
+    """
+    Bounded mapping with least-recently-used eviction and per-entry expiry.
+    Tracks hit and miss counts so callers can report cache effectiveness.
     """
-    def replace(match):
-        word = match.group()
-        return word[0] + "*" * (len(word) - 1)
-    pattern = re.compile("|".join(re.escape(word) for word in SWEAR_WORDS), re.IGNORECASE)
-    return pattern.sub(replace, text)
+    def __init__(self, maxsize=1024, ttl=3600.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()  # key -> (expires_at, value)
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        entry = self._data.get(key)
+        return entry is not None and entry[0] > time.monotonic()
+
+    def get(self, key, default=None):
+        entry = self._data.get(key)
+        if entry is None:
+            self.misses += 1
+            return default
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._data[key]
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key, value):
+        self._data[key] = (time.monotonic() + self.ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        entry = self._data.pop(key, None)
+        return default if entry is None else entry[1]
+
+    def clear(self):
+        self._data.clear()
+
+    @property
+    def hit_ratio(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def stats(self):
+        return {"size": len(self._data), "hits": self.hits, "misses": self.misses, "hit_ratio": self.hit_ratio}
@@ -0,0 +1,158 @@
+import asyncio
+import os
+import time
+import logging
+import discord
+from cogs.metrics import VOICE_EVENTS
+
+logger = logging.getLogger(__name__)
+
+# Seconds connected with nothing playing before leaving the channel; 0 never leaves.
+try:
+    VOICE_IDLE_TIMEOUT = float(os.getenv("VOICE_IDLE_TIMEOUT", "300"))
+except ValueError:
+    VOICE_IDLE_TIMEOUT = 300.0
+# Seconds without anyone but bots in the channel before leaving it; 0 never leaves.
+try:
+    VOICE_EMPTY_TIMEOUT = float(os.getenv("VOICE_EMPTY_TIMEOUT", "60"))
+except ValueError:
+    VOICE_EMPTY_TIMEOUT = 60.0
+# Reconnect attempts after a dropped connection, waiting VOICE_RECONNECT_DELAY seconds before
+# the first and doubling up to VOICE_RECONNECT_MAX_DELAY.
+try:
+    VOICE_RECONNECT_ATTEMPTS = int(os.getenv("VOICE_RECONNECT_ATTEMPTS", "6"))
+except ValueError:
+    VOICE_RECONNECT_ATTEMPTS = 6
+try:
+    VOICE_RECONNECT_DELAY = float(os.getenv("VOICE_RECONNECT_DELAY", "1"))
+except ValueError:
+    VOICE_RECONNECT_DELAY = 1.0
+VOICE_RECONNECT_MAX_DELAY = 60.0
+# Seconds between checks of every guild's connection.
+VOICE_CHECK_INTERVAL = 10.0
+# Seconds a connection may stay down before we reconnect ourselves; discord.py retries short drops on its own.
+RECONNECT_GRACE = 10.0
+# Seconds to wait for the voice handshake on each reconnect attempt.
+CONNECT_TIMEOUT = 30.0
+
+
+def listeners(channel):
+    """Members in a voice channel other than bots."""
+    return [member for member in getattr(channel, "members", ()) if not member.bot]
+
+
+class VoiceManager:
+    """
+    Looks after the voice connections of the Music cog's players: leaves channels that sat
+    idle or empty for too long, reconnects with exponential backoff when a connection drops
+    and kills FFmpeg processes nothing is going to play. Disconnecting suspends the current
+    track instead of dropping it, so the queue carries on after the next join or reconnect.
+    """
+    def __init__(self, players, release, idle_timeout=VOICE_IDLE_TIMEOUT, empty_timeout=VOICE_EMPTY_TIMEOUT):
+        # guild id -> GuildPlayer, owned by the Music cog.
+        self.players = players
+        # Called with a player left with nothing queued after an automatic disconnect.
+        self.release = release
+        self.idle_timeout = idle_timeout
+        self.empty_timeout = empty_timeout
+        # guild id -> {"idle" | "empty" | "down": monotonic time the condition was first seen}
+        self._since = {}
+        self._reconnecting = {}  # guild id -> task
+        self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(VOICE_CHECK_INTERVAL)
+            try:
+                await self.check()
+            except Exception as e:
+                logger.exception(f"Voice check failed: {e}")
+
+    def _elapsed(self, guild_id, condition, active, now):
+        """Seconds `condition` has held for a guild, tracking when it started; 0 when it doesn't hold."""
+        since = self._since.setdefault(guild_id, {})
+        if not active:
+            since.pop(condition, None)
+            return 0.0
+        return now - since.setdefault(condition, now)
+
+    async def check(self):
+        """Check every player's connection once."""
+        now = time.monotonic()
+        for guild_id in list(self._since):
+            if guild_id not in self.players:
+                del self._since[guild_id]
+        for guild_id, player in list(self.players.items()):
+            if guild_id in self._reconnecting:
+                continue
+            voice_client = player.voice_client
+            if voice_client is not None and not voice_client.is_connected():
+                if self._elapsed(guild_id, "down", True, now) >= RECONNECT_GRACE:
+                    self._since.pop(guild_id, None)
+                    self._start_reconnect(player)
+                continue
+            self._elapsed(guild_id, "down", False, now)
+            if voice_client is not None:
+                channel = getattr(voice_client, "channel", None)
+                if channel is not None:
+                    # Follows the bot if someone drags it to another channel.
+                    player.voice_channel = channel
+                idle = self._elapsed(guild_id, "idle", not voice_client.is_playing(), now)
+                empty = self._elapsed(guild_id, "empty", channel is not None and not listeners(channel), now)
+                if self.empty_timeout and empty >= self.empty_timeout:
+                    await self.disconnect(player, "empty")
+                elif self.idle_timeout and idle >= self.idle_timeout:
+                    await self.disconnect(player, "idle")
+            reaped = await asyncio.to_thread(player.reap_decoders)
+            if reaped:
+                VOICE_EVENTS.labels("ffmpeg_reaped").inc(reaped)
+
+    async def disconnect(self, player, reason):
+        """Leave voice, keeping anything queued; players with nothing left are released."""
+        logger.info(f"[{player.guild_id}] Leaving voice: {reason} for too long.")
+        VOICE_EVENTS.labels(f"{reason}_disconnect").inc()
+        self._since.pop(player.guild_id, None)
+        await player.detach()
+        if player.queue.empty():
+            await player.teardown()
+            self.release(player)
+
+    def _start_reconnect(self, player):
+        task = asyncio.create_task(self.reconnect(player))
+        self._reconnecting[player.guild_id] = task
+        task.add_done_callback(lambda _: self._reconnecting.pop(player.guild_id, None))
+
+    async def reconnect(self, player):
+        """
+        Replace a dropped connection, backing off exponentially between attempts. The queue stays
+        paused meanwhile, and stays queued for the next !join if every attempt fails.
+        """
+        channel = player.voice_channel
+        await player.detach()
+        if channel is None:
+            return False
+        delay = VOICE_RECONNECT_DELAY
+        for attempt in range(1, VOICE_RECONNECT_ATTEMPTS + 1):
+            await asyncio.sleep(delay)
+            if player.voice_client is not None or self.players.get(player.guild_id) is not player:
+                # Someone used !join or !leave in the meantime.
+                return False
+            try:
+                voice_client = await channel.connect(timeout=CONNECT_TIMEOUT)
+            except (asyncio.TimeoutError, discord.ClientException, discord.HTTPException, OSError) as e:
+                logger.warning(f"[{player.guild_id}] Voice reconnect attempt {attempt}/{VOICE_RECONNECT_ATTEMPTS} failed: {e!r}")
+                delay = min(delay * 2, VOICE_RECONNECT_MAX_DELAY)
+                continue
+            player.attach(voice_client)
+            VOICE_EVENTS.labels("reconnect").inc()
+            logger.info(f"[{player.guild_id}] Reconnected to {channel} after {attempt} attempts.")
+            return True
+        VOICE_EVENTS.labels("reconnect_failed").inc()
+        logger.error(f"[{player.guild_id}] Gave up reconnecting to {channel}; the queue is kept for the next !join.")
+        return False
+
+    async def close(self):
+        self._task.cancel()
+        for task in list(self._reconnecting.values()):
+            task.cancel()
+        await asyncio.gather(self._task, *self._reconnecting.values(), return_exceptions=True)
@@ -1,4 +1,10 @@
+import time
+
+# Wall-clock reference for the startup timing breakdown, taken before the heavy imports.
+STARTED_AT = time.perf_counter()
+
 import os
+import signal
 import logging
 import discord
 from discord.ext import commands
@@ -15,6 +21,9 @@ logger = logging.getLogger("main")
 
 load_dotenv()
 
+# Imported after load_dotenv so METRICS_* settings from .env apply.
+from cogs.metrics import COMMAND_LATENCY, METRICS_PORT, MetricsServer, monitor_loop_lag
+
 DISCORD_TOKEN = os.getenv("DISCORD_TOKEN")
 COMMAND_PREFIX = "!"
 
@@ -22,45 +31,168 @@ COMMAND_PREFIX = "!"
 OWNER_ID = os.getenv("OWNER_ID")
 MODEL = os.getenv("MODEL")
 
+# Sharding: unset runs one unsharded bot; a number or "auto" (Discord's recommendation) shards it.
+SHARD_COUNT = os.getenv("SHARD_COUNT", "").strip().lower()
+# Bot processes for the cluster launcher; above 1, shard ranges are spread across processes.
+try:
+    CLUSTER_WORKERS = int(os.getenv("CLUSTER_WORKERS", "1"))
+except ValueError:
+    CLUSTER_WORKERS = 1
+
 intents = discord.Intents.default()
 intents.message_content = True  # Required to read message content
 
-# Create the bot instance.
-bot = commands.Bot(command_prefix=COMMAND_PREFIX, intents=intents)
-
 # List of extensions to load.
-extensions = ['cogs.ai', 'cogs.help'] # ['cogs.music', 'cogs.ai', 'cogs.help']
+extensions = ['cogs.music', 'cogs.ai', 'cogs.help', 'cogs.moderation', 'cogs.cluster']
+
+# Seconds spent in each startup phase, in the order they finished; logged once the bot is ready.
+startup_phases = {}
+# Start times of phases that end in an event handler rather than where they began.
+pending_phases = {}
+
+
+def record_phase(name, started):
+    startup_phases[name] = time.perf_counter() - started
+
+
+def create_bot(shard_count=None, shard_ids=None):
+    """
+    Build the bot instance. It is an AutoShardedBot when SHARD_COUNT is set or a shard range is
+    given (cluster workers), otherwise a plain Bot as before.
+    """
+    owner_id = int(OWNER_ID) if OWNER_ID else None
+    if shard_ids is not None or SHARD_COUNT:
+        if shard_count is None and SHARD_COUNT != "auto":
+            shard_count = int(SHARD_COUNT)
+        bot = commands.AutoShardedBot(command_prefix=COMMAND_PREFIX, intents=intents, owner_id=owner_id,
+                                      shard_count=shard_count, shard_ids=shard_ids)
+    else:
+        bot = commands.Bot(command_prefix=COMMAND_PREFIX, intents=intents, owner_id=owner_id)
+    # Set by cluster workers so the stats command can see the other processes.
+    bot.cluster_link = None
+
+    @bot.before_invoke
+    async def start_command_timer(ctx):
+        ctx.invoked_at = time.perf_counter()
+
+    @bot.after_invoke
+    async def record_command_latency(ctx):
+        started = getattr(ctx, "invoked_at", None)
+        if started is not None:
+            status = "error" if ctx.command_failed else "ok"
+            COMMAND_LATENCY.labels(ctx.command.qualified_name, status).observe(time.perf_counter() - started)
+
+    @bot.event
+    async def on_ready():
+        logger.info(f"Logged in as {bot.user.name} ({bot.user.id})")
+        if "gateway" in pending_phases:
+            record_phase("gateway", pending_phases.pop("gateway"))
+            record_phase("total", STARTED_AT)
+            breakdown = ", ".join(f"{name} {seconds:.3f}s" for name, seconds in startup_phases.items())
+            logger.info(f"Startup timing: {breakdown}")
+        # Notify the owner via DM that the bot has started; in a cluster only the worker with shard 0 does.
+        if OWNER_ID and (shard_ids is None or 0 in shard_ids):
+            owner = await bot.fetch_user(int(OWNER_ID))
+            if owner:
+                try:
+                    await owner.send(f"Hey, your bot **{bot.user.name}** has started using model **{MODEL}**!")
+                    logger.info(f"Sent startup notification DM to owner (ID: {OWNER_ID}).")
+                except Exception as e:
+                    logger.exception(f"Failed to send DM to owner: {e}")
+            else:
+                logger.warning("Owner not found.")
+
+    return bot
+
+
+async def load_extension(bot, ext):
+    started = time.perf_counter()
+    try:
+        await bot.load_extension(ext)
+        logger.info(f"Loaded extension '{ext}' in {time.perf_counter() - started:.3f}s")
+    except Exception as e:
+        logger.exception(f"Failed to load extension {ext}: {e}")
+    record_phase(f"extension {ext}", started)
 
-async def load_extensions():
-    for ext in extensions:
+
+async def load_extensions(bot):
+    """Load all extensions concurrently; a failing extension doesn't stop the others."""
+    started = time.perf_counter()
+    await asyncio.gather(*(load_extension(bot, ext) for ext in extensions))
+    record_phase("extensions", started)
+
+
+async def login(bot):
+    started = time.perf_counter()
+    await bot.login(DISCORD_TOKEN)
+    record_phase("login", started)
+
+async def main(bot, metrics_port=METRICS_PORT):
+    record_phase("imports", STARTED_AT)
+    metrics_server = MetricsServer(port=metrics_port) if metrics_port else None
+    if metrics_server is not None:
         try:
-            await bot.load_extension(ext)
-            logger.info(f"Loaded extension '{ext}'")
-        except Exception as e:
-            logger.exception(f"Failed to load extension {ext}: {e}")
-
-@bot.event
-async def on_ready():
-    logger.info(f"Logged in as {bot.user.name} ({bot.user.id})")
-    # Notify the owner via DM that the bot has started.
-    if OWNER_ID:
-        owner = await bot.fetch_user(int(OWNER_ID))
-        if owner:
-            try:
-                await owner.send(f"Hey, your bot **{bot.user.name}** has started using model **{MODEL}**!")
-                logger.info(f"Sent startup notification DM to owner (ID: {OWNER_ID}).")
-            except Exception as e:
-                logger.exception(f"Failed to send DM to owner: {e}")
-        else:
-            logger.warning("Owner not found.")
-
-async def main():
+            await metrics_server.start()
+        except OSError as e:
+            logger.error(f"Could not start metrics endpoint on port {metrics_port}: {e}")
+            metrics_server = None
+    background = [asyncio.create_task(monitor_loop_lag())]
+    if bot.cluster_link is not None:
+        background.append(asyncio.create_task(bot.cluster_link.run(bot)))
+    try:
+        await run_bot(bot)
+    finally:
+        for task in background:
+            task.cancel()
+        if metrics_server is not None:
+            await metrics_server.stop()
+
+async def run_bot(bot):
     async with bot:
-        await load_extensions()
-        await bot.start(DISCORD_TOKEN)
+        # Cogs load while the login request is in flight; neither needs the other.
+        await asyncio.gather(load_extensions(bot), login(bot))
+        # Gateway time runs until on_ready, which logs the breakdown.
+        pending_phases["gateway"] = time.perf_counter()
+        await bot.connect()
+
+def run_worker(worker_id, shard_ids, shard_count, outbox, inbox):
+    """Entry point of a cluster worker process: one AutoShardedBot for a range of shards."""
+    from cogs.cluster import ClusterLink
+    # The supervisor handles Ctrl+C and stops workers with SIGTERM.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    # Workers share the host, so each keeps its own Opus cache index and files.
+    # The music library index is shared instead: worker 0 scans it, the others only search it.
+    os.environ["OPUS_CACHE_DIR"] = os.path.join(os.getenv("OPUS_CACHE_DIR", "cache/opus"), f"worker-{worker_id}")
+    bot = create_bot(shard_count=shard_count, shard_ids=shard_ids)
+    bot.cluster_link = ClusterLink(worker_id, outbox, inbox)
+
+    async def worker_main():
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, asyncio.current_task().cancel)
+        # Each worker serves metrics on its own port, counting up from METRICS_PORT.
+        await main(bot, metrics_port=METRICS_PORT + worker_id if METRICS_PORT else 0)
 
-if __name__ == "__main__":
     try:
-        asyncio.run(main())
-    except KeyboardInterrupt:
-        logger.info("Bot is shutting down due to KeyboardInterrupt.")
+        asyncio.run(worker_main())
+    except asyncio.CancelledError:
+        logger.info(f"Worker {worker_id} stopped.")
+
+def run_cluster():
+    from cogs.cluster import Supervisor, recommended_shard_count
+    if SHARD_COUNT and SHARD_COUNT != "auto":
+        shard_count = int(SHARD_COUNT)
+    else:
+        try:
+            shard_count = recommended_shard_count(DISCORD_TOKEN)
+        except Exception as e:
+            shard_count = CLUSTER_WORKERS
+            logger.warning(f"Could not get the recommended shard count ({e}); using one shard per worker.")
+    Supervisor(run_worker, shard_count, CLUSTER_WORKERS).run()
+
+if __name__ == "__main__":
+    if CLUSTER_WORKERS > 1:
+        run_cluster()
+    else:
+        try:
+            asyncio.run(main(create_bot()))
+        except KeyboardInterrupt:
+            logger.info("Bot is shutting down due to KeyboardInterrupt.")